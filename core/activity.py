@@ -0,0 +1,85 @@
+"""
+Group activity log.
+
+log() buffers events in memory; the buffer goes to the database in one
+bulk_create once it holds ACTIVITY_FLUSH_SIZE events, once
+ACTIVITY_FLUSH_INTERVAL seconds have passed since the last flush, and at the
+end of every request (core.middleware.ActivityFlushMiddleware). Events logged inside a
+transaction are only buffered once it commits. A crashed process loses what
+it buffered since its last flush, which is fine for a feed but means this is
+not an audit trail for anything that needs guarantees.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ActivityEvent
+
+logger = logging.getLogger(__name__)
+
+
+def month_of(value):
+    return value.year * 100 + value.month
+
+
+class ActivityBuffer:
+    def __init__(self, flush_size=None, flush_interval=None, clock=time.monotonic):
+        self.flush_size = flush_size or getattr(settings, 'ACTIVITY_FLUSH_SIZE', 100)
+        self.flush_interval = flush_interval or getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 5)
+        self.clock = clock
+        self.events = []
+        self.lock = threading.Lock()
+        self.last_flush = clock()
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+            due = (len(self.events) >= self.flush_size
+                   or self.clock() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written."""
+        with self.lock:
+            events, self.events = self.events, []
+            self.last_flush = self.clock()
+        if not events:
+            return 0
+        try:
+            ActivityEvent.objects.bulk_create(events, batch_size=self.flush_size)
+        except Exception:
+            # the feed is best effort, never fail the request that triggered the flush
+            logger.exception("Could not write %d activity events", len(events))
+            return 0
+        return len(events)
+
+
+buffer = ActivityBuffer()
+atexit.register(buffer.flush)
+
+
+def log(group_id, verb, actor=None, target_id=None, **data):
+    now = timezone.now()
+    event = ActivityEvent(
+        group_id=group_id, month=month_of(now), actor_id=getattr(actor, 'id', actor),
+        verb=verb, target_id=target_id, data=data, created_at=now)
+    transaction.on_commit(lambda: buffer.add(event))
+
+
+# feed
+
+def encode_cursor(row):
+    return f"{row['month']}.{row['id']}"
+
+
+def decode_cursor(cursor):
+    """(month, id) from a feed cursor, raising ValueError if it is malformed."""
+    month, _, pk = cursor.partition('.')
+    return int(month), int(pk)
+
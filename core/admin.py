@@ -1,38 +1,112 @@
-from django.contrib import admin
-from .models import Profile, Group, GroupMembership, Task, Document, StudySession, TimerSession, Notification
+from django.contrib import admin, messages
+from .models import Profile, Group, GroupMembership, Task, Document, StudySession, TimerSession, Notification, ActivityEvent
+from .pagination import EstimatedCountPaginator
+from .sync import record_many
+from . import activity
+
+# Changelists join their foreign keys up front (list_select_related), FK
+# widgets are autocompletes or raw ids instead of <select>s with every row,
+# and the big tables skip the extra unfiltered COUNT(*) (show_full_result_count)
+# and count through EstimatedCountPaginator.
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'theme_mode', 'total_study_time')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_by', 'created_at')
+    list_select_related = ('created_by',)
+    autocomplete_fields = ('created_by',)
+    search_fields = ('name',)
 
 @admin.register(GroupMembership)
 class GroupMembershipAdmin(admin.ModelAdmin):
     list_display = ('user', 'group', 'role', 'joined_at')
     list_filter = ('role',)
+    list_select_related = ('user', 'group')
+    autocomplete_fields = ('user', 'group')
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'session', 'status', 'created_by', 'created_at')
-    list_filter = ('status', 'session')
+    # filtering by session listed every session in the sidebar; use search instead
+    list_filter = ('status',)
     search_fields = ('title', 'description', 'created_by__username')
+    list_select_related = ('session__group', 'created_by')  # StudySession.__str__ shows the group
+    autocomplete_fields = ('session', 'created_by')
+    date_hierarchy = 'created_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('title', 'group', 'uploaded_by', 'approved', 'uploaded_at')
     list_filter = ('approved',)
+    list_select_related = ('group', 'uploaded_by')
+    autocomplete_fields = ('group', 'uploaded_by')
+    date_hierarchy = 'uploaded_at'
+    actions = ('approve_documents',)
+
+    @admin.action(description="Approve selected documents")
+    def approve_documents(self, request, queryset):
+        pending = queryset.filter(approved=False)
+        approved = list(pending.values_list('id', 'group_id', 'title'))
+        # one UPDATE; the change log and activity feed are written in bulk
+        # because QuerySet.update() skips the model signals
+        pending.update(approved=True)
+        record_many('document', [(pk, group_id) for pk, group_id, _ in approved])
+        for pk, group_id, title in approved:
+            activity.log(group_id, 'document.approved', actor=request.user, target_id=pk, title=title)
+        self.message_user(request, f"Approved {len(approved)} documents.", messages.SUCCESS)
 
 @admin.register(StudySession)
 class StudySessionAdmin(admin.ModelAdmin):
     list_display = ('title', 'group', 'start_time', 'end_time')
+    list_select_related = ('group',)
+    autocomplete_fields = ('group',)
+    raw_id_fields = ('parent',)
+    search_fields = ('title',)
 
 @admin.register(TimerSession)
 class TimerSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'mode', 'duration', 'started_at', 'ended_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    date_hierarchy = 'started_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'message', 'created_at', 'read_status')
+    list_filter = ('read_status',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    date_hierarchy = 'created_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('mark_read', 'purge_read')
+
+    @admin.action(description="Mark selected notifications as read")
+    def mark_read(self, request, queryset):
+        updated = queryset.filter(read_status=False).update(read_status=True)
+        self.message_user(request, f"Marked {updated} notifications as read.", messages.SUCCESS)
+
+    @admin.action(description="Delete selected notifications that were read")
+    def purge_read(self, request, queryset):
+        # no signals or cascades on Notification, so this is a single DELETE
+        deleted, _ = queryset.filter(read_status=True).delete()
+        self.message_user(request, f"Deleted {deleted} read notifications.", messages.SUCCESS)
+
+@admin.register(ActivityEvent)
+class ActivityEventAdmin(admin.ModelAdmin):
+    list_display = ('verb', 'group_id', 'actor', 'target_id', 'created_at')
+    list_filter = ('verb',)
+    search_fields = ('=group_id',)
+    list_select_related = ('actor',)
+    raw_id_fields = ('actor',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
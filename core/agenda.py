@@ -0,0 +1,214 @@
+"""
+Agenda helpers: window parsing, interval-overlap queries, recurring session
+expansion, conflict detection and the per-group cached iCalendar feed used by
+StudySessionViewSet.agenda.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .metrics import cache_get
+from .models import Group, StudySession
+from .recurrence import occurrences, snap_to_days
+
+MAX_WINDOW = timedelta(days=366)
+ICS_CACHE_TIMEOUT = 60 * 60
+
+
+def parse_bound(value, name):
+    """Accept an ISO datetime or a plain date (midnight, current timezone)."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: f"Invalid date or datetime: {value!r}"})
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_window(params, default_before=timedelta(0), default_after=timedelta(days=7)):
+    now = timezone.now()
+    start = parse_bound(params['from'], 'from') if params.get('from') else now - default_before
+    end = parse_bound(params['to'], 'to') if params.get('to') else start + default_before + default_after
+    if start >= end:
+        raise ValidationError({'to': "'to' must be after 'from'."})
+    if end - start > MAX_WINDOW:
+        raise ValidationError({'to': f"Window can't be longer than {MAX_WINDOW.days} days."})
+    return start, end
+
+
+def overlapping(queryset, start, end):
+    """
+    Single sessions (and materialized occurrences) that intersect [start, end);
+    uses the (group, end_time, start_time) index. Recurring sessions are
+    handled by series_overlapping/agenda_rows.
+    """
+    return queryset.filter(recurrence='', end_time__gt=start, start_time__lt=end)
+
+
+def series_overlapping(queryset, start, end):
+    """Recurring sessions whose series can have occurrences in [start, end)."""
+    return queryset.exclude(recurrence='').filter(
+        Q(recurrence_until__isnull=True) | Q(recurrence_until__gt=start), start_time__lt=end)
+
+
+def agenda_rows(serializer, queryset, start, end):
+    """
+    Raw lean rows for every session or occurrence intersecting the window,
+    ordered by start. Occurrences of a recurring session that haven't been
+    materialized are expanded on the fly: they have id None and carry
+    parent/original_start, the same shape a materialized override has.
+    """
+    rows = list(serializer.get_rows(overlapping(queryset, start, end)))
+    series = list(serializer.get_rows(series_overlapping(queryset, start, end)))
+    if series:
+        longest = max(row['end_time'] - row['start_time'] for row in series)
+        # overrides replace their virtual occurrence even if they were moved
+        overridden = set(StudySession.objects.filter(
+            parent_id__in=[row['id'] for row in series],
+            original_start__gt=start - longest, original_start__lt=end,
+        ).values_list('parent_id', 'original_start'))
+        for row in series:
+            duration = row['end_time'] - row['start_time']
+            for occurrence in occurrences(row['id'], row['recurrence'],
+                                          row['start_time'], row['end_time'], start, end):
+                if (row['id'], occurrence) in overridden:
+                    continue
+                # tasks on the series row belong to its first occurrence
+                rows.append(dict(
+                    row, id=None, recurrence='', recurrence_until=None, parent_id=row['id'],
+                    original_start=occurrence, start_time=occurrence, end_time=occurrence + duration,
+                    num_tasks=row['num_tasks'] if occurrence == row['start_time'] else 0))
+    rows.sort(key=lambda row: (row['start_time'], row['id'] or 0))
+    return rows
+
+
+def row_key(row):
+    """Conflict key: the id, or 'parent@start' for a virtual occurrence."""
+    if row['id'] is not None:
+        return row['id']
+    return f"{row['parent_id']}@{row['original_start'].isoformat()}"
+
+
+def find_conflicts(intervals):
+    """
+    Sweep-line over (id, start, end) tuples; returns overlapping id pairs.
+    Sessions that only touch (one ends when the next starts) don't conflict.
+    O(n log n + k) for k conflicting pairs.
+    """
+    events = []
+    for pk, start, end in intervals:
+        # ends sort before starts at the same instant
+        events.append((start, 1, pk))
+        events.append((end, 0, pk))
+    # keys can mix ints and strings, so never compare them
+    events.sort(key=lambda event: event[:2])
+
+    active = {}
+    conflicts = []
+    for _, is_start, pk in events:
+        if is_start:
+            conflicts.extend((other, pk) for other in active)
+            active[pk] = True
+        else:
+            active.pop(pk, None)
+    return conflicts
+
+
+# iCalendar feed
+# Blocks are cached under the group's agenda_version, which lives on the
+# Group row rather than in the cache: every worker sees a bump at once even
+# with a per-process cache, and a cache eviction can't reset it.
+
+def group_versions(group_ids):
+    return dict(Group.all_objects.filter(pk__in=group_ids).values_list('pk', 'agenda_version'))
+
+
+def bump_group_version(group_id):
+    Group.all_objects.filter(pk=group_id).update(agenda_version=F('agenda_version') + 1)
+
+
+def _ics_escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_time(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _ics_line(line):
+    # fold at 75 octets (RFC 5545 3.1) without splitting utf-8 sequences
+    raw = line.encode()
+    if len(raw) <= 75:
+        return line + '\r\n'
+    parts, current = [], b''
+    for char in line:
+        encoded = char.encode()
+        if len(current) + len(encoded) > (75 if not parts else 74):
+            parts.append(current.decode())
+            current = b''
+        current += encoded
+    parts.append(current.decode())
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def render_group_events(group_id, start, end, stamp):
+    fields = ('id', 'title', 'description', 'start_time', 'end_time',
+              'recurrence', 'parent_id', 'original_start', 'group__name')
+    sessions = StudySession.objects.filter(group_id=group_id)
+    rows = list(overlapping(sessions, start, end).values(*fields))
+    rows += list(series_overlapping(sessions, start, end).values(*fields))
+    rows.sort(key=lambda row: (row['start_time'], row['id']))
+
+    lines = []
+    for row in rows:
+        # overrides share the series UID and point at the occurrence they replace
+        uid = row['parent_id'] or row['id']
+        lines.extend([
+            'BEGIN:VEVENT',
+            f"UID:session-{uid}@vsg",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_time(row['start_time'])}",
+            f"DTEND:{_ics_time(row['end_time'])}",
+        ])
+        if row['recurrence']:
+            lines.append(f"RRULE:{row['recurrence']}")
+        if row['parent_id']:
+            lines.append(f"RECURRENCE-ID:{_ics_time(row['original_start'])}")
+        lines.extend([
+            f"SUMMARY:{_ics_escape(row['title'])}",
+            f"CATEGORIES:{_ics_escape(row['group__name'])}",
+        ])
+        if row['description']:
+            lines.append(f"DESCRIPTION:{_ics_escape(row['description'])}")
+        lines.append('END:VEVENT')
+    return ''.join(_ics_line(line) for line in lines)
+
+
+def group_events(group_id, version, start, end):
+    """VEVENT block for one group, cached until a session in that group changes."""
+    key = f"agenda-ics:{group_id}:{version}:{start.timestamp()}:{end.timestamp()}"
+    block = cache_get(cache, key)
+    if block is None:
+        block = render_group_events(group_id, start, end, _ics_time(timezone.now()))
+        cache.set(key, block, ICS_CACHE_TIMEOUT)
+    return block
+
+
+def stream_ics(group_ids, start, end):
+    yield (_ics_line('BEGIN:VCALENDAR') + _ics_line('VERSION:2.0')
+           + _ics_line('PRODID:-//Virtual Study Group//Agenda//EN')
+           + _ics_line('CALSCALE:GREGORIAN')).encode()
+    versions = group_versions(group_ids)
+    for group_id in group_ids:
+        block = group_events(group_id, versions.get(group_id, 0), start, end)
+        if block:
+            yield block.encode()
+    yield _ics_line('END:VCALENDAR').encode()
@@ -6,4 +6,11 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
-        import core.signals
\ No newline at end of file
+        import core.signals
+        import core.job_handlers
+        from django.db.backends.signals import connection_created
+        from core.profiling import install_slow_query_log
+        from django.core import checks
+        from core.throttling import check_throttle_cache
+        checks.register(check_throttle_cache, checks.Tags.caches, deploy=True)
+        connection_created.connect(install_slow_query_log)
@@ -0,0 +1,128 @@
+"""
+Retention for the tables that only ever grow: read notifications, stopped
+timers (already rolled up into Profile.total_study_time) and comments on
+documents whose discussion went quiet.
+
+Matching rows are copied to gzip JSONL files and deleted one batch at a time:
+each batch is written and flushed before its rows are deleted in their own
+short transaction, so locks are held for one small DELETE and a crash can at
+worst archive the last batch twice, never lose it.
+"""
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import subtract
+from .models import Document, DocumentComment, Notification, TimerSession
+
+
+class Policy:
+    """Which rows of one model are archived, and in what order."""
+    name = None
+    model = None
+    ordering = ('id',)
+
+    def __init__(self, days):
+        self.days = days
+
+    def cutoff(self, now):
+        return now - timedelta(days=self.days)
+
+    def queryset(self, now):
+        raise NotImplementedError
+
+    def fields(self):
+        return [field.attname for field in self.model._meta.concrete_fields]
+
+    def after_delete(self, rows):
+        pass
+
+
+class NotificationPolicy(Policy):
+    name = 'notifications'
+    model = Notification
+
+    def queryset(self, now):
+        # served by the (read_status, created_at) index
+        return Notification.objects.filter(read_status=True, created_at__lt=self.cutoff(now))
+
+
+class TimerPolicy(Policy):
+    name = 'timers'
+    model = TimerSession
+
+    def queryset(self, now):
+        # only stopped timers; their minutes are already in the profile total
+        return TimerSession.objects.filter(ended_at__isnull=False, started_at__lt=self.cutoff(now))
+
+
+class CommentPolicy(Policy):
+    name = 'comments'
+    model = DocumentComment
+    # deepest first, so a reply never outlives its parent between batches
+    ordering = ('-depth', 'id')
+
+    def queryset(self, now):
+        # whole discussions only: a thread with a recent reply stays put
+        return DocumentComment.objects.filter(document__last_comment_at__lt=self.cutoff(now))
+
+    def after_delete(self, rows):
+        # one UPDATE per distinct count: a batch mostly holds whole threads of a few sizes
+        subtract(Document, 'comment_count', Counter(row['document_id'] for row in rows))
+        subtract(DocumentComment, 'reply_count', Counter(row['parent_id'] for row in rows if row['parent_id']))
+
+
+POLICIES = {policy.name: policy for policy in (NotificationPolicy, TimerPolicy, CommentPolicy)}
+
+
+def delete_rows(model, ids):
+    # archiving isn't a user delete: skip per-row signals (comment counters are
+    # lowered per document in after_delete) and delete with one statement
+    return model.objects.filter(id__in=ids)._raw_delete(model.objects.db)
+
+
+class Archiver:
+    def __init__(self, output_dir, batch_size=1000, pause=0.0, clock=timezone.now):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.pause = pause
+        self.clock = clock
+
+    def path_for(self, policy, now):
+        return os.path.join(self.output_dir, f"{policy.name}-{now:%Y%m%dT%H%M%S}.jsonl.gz")
+
+    def count(self, policy):
+        return policy.queryset(self.clock()).count()
+
+    def run(self, policy):
+        """Archive and delete everything the policy matches; returns (rows, path)."""
+        now = self.clock()
+        queryset = policy.queryset(now).order_by(*policy.ordering).values(*policy.fields())
+        first = list(queryset[:self.batch_size])
+        if not first:
+            return 0, None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = self.path_for(policy, now)
+        total = 0
+        with gzip.open(path, 'wt', encoding='utf-8') as archive:
+            batch = first
+            while batch:
+                archive.writelines(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in batch)
+                archive.flush()
+                with transaction.atomic():
+                    delete_rows(policy.model, [row['id'] for row in batch])
+                    policy.after_delete(batch)
+                total += len(batch)
+                if self.pause:
+                    time.sleep(self.pause)  # let replicas and other writers catch up
+                # the archived rows are gone, so the next batch is simply the first again
+                batch = list(queryset[:self.batch_size])
+        return total, path
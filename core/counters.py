@@ -0,0 +1,14 @@
+"""Helpers for denormalized counter columns, shared by archiving and blob refcounts."""
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def subtract(model, field, counts):
+    """Lower model.field by counts[pk] for every pk in counts, never below zero."""
+    by_amount = defaultdict(list)
+    for pk, amount in counts.items():
+        by_amount[amount].append(pk)
+    for amount, ids in by_amount.items():
+        model.objects.filter(pk__in=ids).update(**{field: Greatest(F(field) - amount, 0)})
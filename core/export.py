@@ -0,0 +1,175 @@
+"""
+Per-user data export.
+
+Exporter(export).run() writes everything a user owns into one ZIP under
+EXPORT_ROOT: profile.json, a JSONL file per model (timers, tasks, comments,
+documents) read through .iterator() cursors, and the uploaded files under
+documents/, copied out of storage CHUNK_SIZE bytes at a time. Entries go
+straight into the archive as they are produced, so memory use stays flat
+however much a user has. Progress (done_items of total_items) is saved on
+the DataExport row after every batch, which also refreshes the job's lock
+(jobs.heartbeat); the archive is written to a .part file and renamed once
+complete.
+
+The download action hands the finished file to the web server when
+EXPORT_ACCEL_REDIRECT is set (nginx X-Accel-Redirect to an internal
+location over EXPORT_ROOT); otherwise it returns a FileResponse, which WSGI
+servers send with sendfile.
+"""
+import json
+import os
+import re
+import shutil
+import zipfile
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .jobs import heartbeat
+from .models import DataExport, Document, DocumentComment, Job, Profile, Task, TimerSession
+from .storage import CHUNK_SIZE, ZIP_BASED
+
+BATCH_SIZE = 1000
+# already compressed: deflating them again only costs CPU
+STORED_TYPES = {'application/pdf', 'application/zip', 'application/gzip',
+                'image/png', 'image/jpeg', 'image/gif'}
+
+
+def export_root():
+    return str(getattr(settings, 'EXPORT_ROOT', 'exports'))
+
+
+def fields_of(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(name))[:100] or 'file'
+
+
+class Exporter:
+    def __init__(self, export, batch_size=BATCH_SIZE):
+        self.export = export
+        self.user = export.user
+        self.output_dir = export_root()
+        self.batch_size = batch_size
+        self.done = 0
+
+    def sections(self):
+        """(archive entry, queryset) pairs, one JSONL file each."""
+        user = self.user
+        return [
+            ('timers.jsonl', TimerSession.objects.filter(user=user)),
+            ('tasks.jsonl', Task.objects.filter(created_by=user)),
+            ('comments.jsonl', DocumentComment.objects.filter(user=user)),
+            ('documents.jsonl', Document.objects.filter(uploaded_by=user)),
+        ]
+
+    def documents_with_files(self):
+        return Document.objects.filter(uploaded_by=self.user).exclude(file='')
+
+    def count(self):
+        return (1 + sum(queryset.count() for _, queryset in self.sections())
+                + self.documents_with_files().count())
+
+    def progress(self, items):
+        self.done += items
+        DataExport.objects.filter(pk=self.export.pk).update(done_items=self.done)
+        heartbeat()  # a big export outlasts the job lock; keep it from being handed to another worker
+
+    def write_profile(self, archive):
+        user = self.user
+        profile = Profile.objects.filter(user=user).values(*fields_of(Profile)).first() or {}
+        data = {'id': user.pk, 'username': user.username, 'email': user.email,
+                'date_joined': user.date_joined, 'profile': profile}
+        archive.writestr('profile.json', json.dumps(data, cls=DjangoJSONEncoder, indent=2))
+        if profile.get('profile_picture'):
+            field = Profile._meta.get_field('profile_picture')
+            self.copy_file(archive, field.storage, profile['profile_picture'],
+                           f"profile/{safe_name(profile['profile_picture'])}")
+        self.progress(1)
+
+    def write_jsonl(self, archive, entry, queryset):
+        model = queryset.model
+        rows = queryset.order_by('pk').values(*fields_of(model)).iterator(chunk_size=self.batch_size)
+        with archive.open(entry, 'w', force_zip64=True) as out:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    return
+                out.write(''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in batch).encode())
+                self.progress(len(batch))
+
+    def copy_file(self, archive, storage, name, entry, mime_type=''):
+        info = zipfile.ZipInfo(entry, date_time=timezone.now().timetuple()[:6])
+        stored = mime_type in STORED_TYPES or os.path.splitext(name)[1].lower() in ZIP_BASED
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        with storage.open(name, 'rb') as src, archive.open(info, 'w', force_zip64=True) as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+    def write_files(self, archive):
+        storage = Document._meta.get_field('file').storage
+        documents = (self.documents_with_files().order_by('pk')
+                     .values_list('pk', 'file', 'original_name', 'mime_type').iterator(chunk_size=self.batch_size))
+        for pk, name, original_name, mime_type in documents:
+            self.copy_file(archive, storage, name,
+                           f"documents/{pk}-{safe_name(original_name or name)}", mime_type)
+            self.progress(1)
+
+    def run(self):
+        """Build the archive; returns the path of the finished ZIP."""
+        export = self.export
+        DataExport.objects.filter(pk=export.pk).update(status='running', done_items=0, total_items=self.count())
+        os.makedirs(self.output_dir, exist_ok=True)
+        file_name = f"export-{self.user.pk}-{export.pk}.zip"
+        path = os.path.join(self.output_dir, file_name)
+        partial = path + '.part'
+        try:
+            with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                self.write_profile(archive)
+                for entry, queryset in self.sections():
+                    self.write_jsonl(archive, entry, queryset)
+                self.write_files(archive)
+            os.replace(partial, path)
+        except Exception as exc:
+            if os.path.exists(partial):
+                os.remove(partial)
+            DataExport.objects.filter(pk=export.pk).update(status='failed', error=str(exc)[:1000])
+            raise
+        DataExport.objects.filter(pk=export.pk).update(
+            status='done', file_name=file_name, file_size=os.path.getsize(path), error='',
+            finished_at=timezone.now())
+        # a user keeps only the newest archive (export_deleted removes the files)
+        for old in DataExport.objects.filter(user=self.user, pk__lt=export.pk):
+            old.delete()
+        return path
+
+
+def job_key(export):
+    return f"data-export:{export.pk}"
+
+
+def unfinished_export(user):
+    """
+    The user's pending or running export while its job is still queued or
+    running; one whose job failed for good or vanished is marked failed.
+    """
+    export = DataExport.objects.filter(user=user, status__in=('pending', 'running')).order_by('-id').first()
+    if export is None:
+        return None
+    # a crashed worker's job is requeued by the worker, so a live job means progress will come
+    if Job.objects.filter(dedupe_key=job_key(export), status__in=('queued', 'running')).exists():
+        return export
+    DataExport.objects.filter(pk=export.pk, status__in=('pending', 'running')).update(
+        status='failed', error='The export stopped; request a new one.', finished_at=timezone.now())
+    return None
+
+
+def remove_file(export):
+    if export.file_name:
+        try:
+            os.remove(os.path.join(export_root(), export.file_name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,293 @@
+"""
+Plain text out of uploaded documents.
+
+extract(data, name, mime_type) returns (text, page_offsets): the text of the
+whole file and the character offset at which each page (PDF page, slide,
+sheet, form-feed separated text page) starts. It is a pure function of the
+bytes, so the 'documents.extract_text' job runs it on a process pool
+(run_in_pool) and extraction never competes with request threads for the GIL.
+The timeout runs from when a pool process starts on a file, not from when
+the file was queued; a process that overruns it is killed with its pool.
+
+- text/*: decoded as UTF-8, falling back to Latin-1; form feeds split pages.
+- PDF: pypdf when it is installed; otherwise a small built-in reader for
+  the text operators of (Flate-compressed) page content streams. It
+  handles ordinary text PDFs, not scans or exotic font encodings.
+- docx, pptx, xlsx and OpenDocument files: the XML inside the zip.
+
+Unknown formats give ('', []).
+"""
+import io
+import multiprocessing
+import os
+import re
+import signal
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+try:
+    import pypdf
+except ImportError:  # optional, the built-in PDF reader is used without it
+    pypdf = None
+
+
+WHITESPACE = re.compile(r'[ \t\u00a0]+')
+
+
+def join_pages(pages):
+    """Concatenate page texts; returns (text, start offset of each page)."""
+    offsets, parts, position = [], [], 0
+    for page in pages:
+        page = WHITESPACE.sub(' ', page).strip()
+        offsets.append(position)
+        parts.append(page)
+        position += len(page) + 2  # the blank line between pages
+    return '\n\n'.join(parts), offsets
+
+
+def extract_plain(data):
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+    return join_pages(text.replace('\r\n', '\n').split('\f'))
+
+
+# PDF
+
+PDF_OBJECT = re.compile(rb'(\d+)\s+\d+\s+obj\b(.*?)\bendobj', re.S)
+PDF_STREAM = re.compile(rb'stream\r?\n(.*?)\r?\n?endstream', re.S)
+PDF_REF = re.compile(rb'(\d+)\s+\d+\s+R')
+# strings (one level of nested parentheses), hex strings, large negative TJ
+# kerning (a word gap) and the operators that move to a new line
+PDF_TEXT_TOKEN = re.compile(
+    rb'\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)|<[0-9A-Fa-f\s]*>|-\d{3,}(?:\.\d*)?'
+    rb'|(?<![A-Za-z])(?:T[dD*]|ET)(?![A-Za-z])|\'|"', re.S)
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f',
+               b'(': b'(', b')': b')', b'\\': b'\\'}
+
+
+def _pdf_string(token):
+    if token.startswith(b'<'):
+        digits = re.sub(rb'\s', b'', token[1:-1])
+        raw = bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode())
+    else:
+        raw = re.sub(rb'\\([0-7]{1,3}|.|\n)', lambda m: (
+            PDF_ESCAPES.get(m.group(1)) if m.group(1) in PDF_ESCAPES
+            else bytes([int(m.group(1), 8) & 0xFF]) if m.group(1)[:1].isdigit()
+            else b'' if m.group(1) == b'\n' else m.group(1)), token[1:-1], flags=re.S)
+    if raw.startswith(b'\xfe\xff'):
+        return raw[2:].decode('utf-16-be', 'replace')
+    return raw.decode('latin-1')
+
+
+def _pdf_stream(body):
+    match = PDF_STREAM.search(body)
+    if match is None:
+        return b''
+    raw = match.group(1)
+    if b'/FlateDecode' in body.split(b'stream', 1)[0]:
+        try:
+            return zlib.decompressobj().decompress(raw)
+        except zlib.error:
+            return b''
+    return raw
+
+
+def _pdf_content_text(content):
+    out = []
+    for token in PDF_TEXT_TOKEN.findall(content):
+        if token[:1] in (b'(', b'<'):
+            out.append(_pdf_string(token))
+        elif token[:1] == b'-':
+            out.append(' ')
+        elif not out or out[-1] != '\n':
+            out.append('\n')
+    return re.sub(r'[ \t]+\n', '\n', ''.join(out))
+
+
+def extract_pdf_builtin(data):
+    objects = {int(num): body for num, body in PDF_OBJECT.findall(data)}
+
+    def page_objects(num, seen):
+        body = objects.get(num, b'')
+        if num in seen:
+            return []
+        seen.add(num)
+        if re.search(rb'/Type\s*/Pages\b', body):
+            kids = re.search(rb'/Kids\s*\[(.*?)\]', body, re.S)
+            return [page for kid in PDF_REF.findall(kids.group(1) if kids else b'')
+                    for page in page_objects(int(kid), seen)]
+        return [num] if re.search(rb'/Type\s*/Page\b', body) else []
+
+    roots = [num for num, body in objects.items()
+             if re.search(rb'/Type\s*/Pages\b', body) and b'/Parent' not in body]
+    pages = []
+    for root in roots[:1]:
+        for num in page_objects(root, set()):
+            contents = re.search(rb'/Contents\s*(\[.*?\]|\d+\s+\d+\s+R)', objects[num], re.S)
+            refs = PDF_REF.findall(contents.group(1)) if contents else []
+            pages.append(''.join(_pdf_content_text(_pdf_stream(objects.get(int(ref), b'')))
+                                 for ref in refs))
+    if not pages:
+        # no readable page tree (e.g. compressed object streams): every stream as one page
+        pages = [''.join(_pdf_content_text(_pdf_stream(body)) for body in objects.values())]
+    return join_pages(pages)
+
+
+def extract_pdf(data):
+    if pypdf is not None:
+        try:
+            reader = pypdf.PdfReader(io.BytesIO(data))
+            return join_pages(page.extract_text() or '' for page in reader.pages)
+        except Exception:
+            pass  # fall through to the built-in reader
+    return extract_pdf_builtin(data)
+
+
+# Office Open XML and OpenDocument
+
+def _xml_paragraphs(xml, paragraph_tag, text_tag=None, page_break=None):
+    """Paragraph texts of an XML part; a page_break(element) hit starts a new page."""
+    pages, paragraphs, current = [], [], []
+    for event, element in ElementTree.iterparse(io.BytesIO(xml), events=('start', 'end')):
+        tag = element.tag.rsplit('}', 1)[-1]
+        if event == 'start' and page_break is not None and page_break(tag, element):
+            paragraphs.append(''.join(current))
+            current = []
+            pages.append('\n'.join(p for p in paragraphs if p))
+            paragraphs = []
+        elif event == 'end':
+            if text_tag is not None and tag == text_tag and element.text:
+                current.append(element.text)
+            elif tag == paragraph_tag:
+                if text_tag is None:
+                    current.append(''.join(element.itertext()))
+                paragraphs.append(''.join(current))
+                current = []
+                element.clear()
+    paragraphs.append(''.join(current))
+    pages.append('\n'.join(p for p in paragraphs if p))
+    return pages
+
+
+def _docx_page_break(tag, element):
+    if tag == 'lastRenderedPageBreak':
+        return True
+    return tag == 'br' and any(key.endswith('}type') and value == 'page'
+                               for key, value in element.attrib.items())
+
+
+def _numbered(names, pattern):
+    found = [(int(m.group(1)), name) for name in names for m in [re.fullmatch(pattern, name)] if m]
+    return [name for _, name in sorted(found)]
+
+
+def extract_office(data, ext):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        if ext == '.docx':
+            return join_pages(_xml_paragraphs(archive.read('word/document.xml'), 'p', 't', _docx_page_break))
+        if ext == '.pptx':
+            return join_pages('\n'.join(_xml_paragraphs(archive.read(name), 'p', 't'))
+                              for name in _numbered(names, r'ppt/slides/slide(\d+)\.xml'))
+        if ext == '.xlsx':
+            # cell text lives in the shared string table; numbers aren't worth indexing
+            if 'xl/sharedStrings.xml' not in names:
+                return '', []
+            return join_pages(['\n'.join(_xml_paragraphs(archive.read('xl/sharedStrings.xml'), 'si', 't'))])
+        if 'content.xml' in names:  # OpenDocument
+            return join_pages(['\n'.join(_xml_paragraphs(archive.read('content.xml'), 'p'))])
+    return '', []
+
+
+OFFICE_EXTENSIONS = {'.docx', '.pptx', '.xlsx', '.odt', '.odp', '.ods'}
+
+
+def extract(data, name, mime_type=''):
+    ext = os.path.splitext(name)[1].lower()
+    try:
+        if mime_type == 'application/pdf' or data.startswith(b'%PDF-'):
+            return extract_pdf(data)
+        if ext in OFFICE_EXTENSIONS and data.startswith(b'PK'):
+            return extract_office(data, ext)
+        if mime_type.startswith('text/') or ext in ('.txt', '.md', '.csv'):
+            return extract_plain(data)
+    except (zipfile.BadZipFile, ElementTree.ParseError, KeyError, ValueError):
+        pass  # damaged or unexpected file: nothing to index
+    return '', []
+
+
+def extract_limited(data, name, mime_type, limit):
+    """extract(), cut to limit characters; returns (text, page_offsets, truncated)."""
+    text, offsets = extract(data, name, mime_type)
+    if len(text) <= limit:
+        return text, offsets, False
+    return text[:limit], [offset for offset in offsets if offset < limit], True
+
+
+def extract_timed(timeout, *args):
+    """extract_limited(*args) in a pool process, raising TimeoutError after timeout seconds."""
+    if not hasattr(signal, 'setitimer'):
+        return extract_limited(*args)
+
+    def expired(signum, frame):
+        raise TimeoutError(f"Extraction took longer than {timeout}s")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_limited(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+KILL_GRACE = 5  # seconds past the timeout before a process that ignores the alarm is killed
+_pool = None
+
+
+def reset_pool():
+    """Kill the pool's processes; the next run_in_pool starts a new one."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is None:
+        return
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.kill()
+
+
+def run_in_pool(processes, timeout, *args):
+    """extract_limited(*args) on a shared process pool (inline when processes is 0)."""
+    global _pool
+    if not processes:
+        return extract_limited(*args)
+    if _pool is None:
+        # spawn, not fork: the job workers that call this are multi-threaded
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    future = _pool.submit(extract_timed, timeout, *args)
+    deadline = None
+    try:
+        while True:
+            try:
+                # poll while the file waits for a free process, then wait out its time
+                return future.result(timeout=1 if deadline is None else max(0, deadline - time.monotonic()))
+            except TimeoutError:
+                if future.done():
+                    raise  # the process's own alarm
+                if deadline is not None:
+                    # stuck where the alarm can't interrupt it (e.g. inside C code);
+                    # other files in flight on this pool fail with it and are retried
+                    reset_pool()
+                    raise
+                if future.running():
+                    deadline = time.monotonic() + timeout + KILL_GRACE
+    except BrokenProcessPool:
+        _pool = None  # a child died (e.g. out of memory); start a new pool next time
+        raise
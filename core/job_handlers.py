@@ -0,0 +1,131 @@
+"""Background job handlers; imported from CoreConfig.ready so they register."""
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .export import Exporter
+from .extraction import run_in_pool
+from .jobs import enqueue, job
+from .membership_import import send_invites
+from .models import DataExport, Document, DocumentText, Group, Notification, Profile, Task
+from .sync import record
+from .purge import GroupPurger
+from .search import index_document
+from .storage import claim_blob, describe_upload
+
+logger = logging.getLogger(__name__)
+
+
+# new uploads are described in Document.save; this fills in rows stored before that
+@job('documents.detect_metadata')
+def detect_document_metadata(document_id):
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None or not document.file:
+        return
+    with document.file.open('rb') as content:
+        metadata = describe_upload(content, document.file.name)
+    with transaction.atomic():
+        Document.objects.filter(pk=document_id).update(**metadata)
+        if not document.content_hash:
+            claim_blob(metadata['content_hash'])
+    record('document', document.id, document.group_id)
+
+
+@job('documents.extract_text')
+def extract_document_text(document_id, reindex=False):
+    """Extract and index a document's text; reindex=True only re-reads the title."""
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None or not document.file:
+        return
+    stored = DocumentText.objects.filter(document_id=document_id).first()
+    if stored is not None and stored.content_hash == document.content_hash:
+        # same bytes as last time: skip extraction, refresh the index only if asked
+        if reindex:
+            index_document(document, stored.text)
+        return
+
+    # blobs are content-addressed, the same file may already be extracted for another document
+    source = None
+    if document.content_hash:
+        source = DocumentText.objects.filter(content_hash=document.content_hash).exclude(
+            document_id=document_id).first()
+    if source is not None:
+        text, offsets, truncated = source.text, source.page_offsets, source.truncated
+    elif document.file_size > getattr(settings, 'EXTRACTION_MAX_BYTES', 50 * 1024 * 1024):
+        text, offsets, truncated = '', [], False
+    else:
+        with document.file.open('rb') as content:
+            data = content.read()
+        try:
+            text, offsets, truncated = run_in_pool(
+                getattr(settings, 'EXTRACTION_PROCESSES', 2), getattr(settings, 'EXTRACTION_TIMEOUT', 60),
+                data, document.original_name or document.file.name, document.mime_type,
+                getattr(settings, 'DOCUMENT_TEXT_LIMIT', 200_000))
+        except TimeoutError:
+            # searchable by title meanwhile; no content_hash, so the job's retries extract again
+            logger.warning("Text extraction of document %s timed out", document_id)
+            with transaction.atomic():
+                DocumentText.objects.update_or_create(document_id=document_id, defaults={
+                    'content_hash': '', 'text': '', 'page_offsets': [], 'truncated': False})
+                index_document(document, '')
+            raise
+
+    with transaction.atomic():
+        DocumentText.objects.update_or_create(document_id=document_id, defaults={
+            'content_hash': document.content_hash, 'text': text,
+            'page_offsets': offsets, 'truncated': truncated})
+        index_document(document, text)
+
+
+@job('notifications.document_uploaded')
+def notify_document_uploaded(document_id):
+    document = Document.objects.select_related(
+        'group', 'uploaded_by').filter(pk=document_id).first()
+    if document is None:
+        return
+    group = document.group
+    if group.created_by_id != document.uploaded_by_id:
+        Notification.objects.create(
+            user_id=group.created_by_id,
+            message=f"{document.uploaded_by.username} uploaded '{document.title}' in '{group.name}' awaiting approval.",
+            type='document_upload'
+        )
+
+
+@job('profiles.recount_completed_tasks')
+def recount_completed_tasks(user_id):
+    # recount instead of +1/-1 so duplicate or reordered jobs can't drift
+    completed = Task.objects.filter(created_by_id=user_id, status='complete').count()
+    Profile.objects.filter(user_id=user_id).update(completed_tasks_count=completed)
+
+
+PURGE_TIME_BUDGET = 30  # seconds per run, then the purge yields to other jobs
+
+
+INVITE_BATCH_SIZE = 200  # emails per run
+
+
+@job('groups.send_invites')
+def send_group_invites(group_id):
+    group = Group.objects.filter(pk=group_id).first()
+    if group is None:
+        return
+    # a batch per run keeps each job short; the next one picks up the rest
+    if send_invites(group, batch_size=INVITE_BATCH_SIZE) == INVITE_BATCH_SIZE:
+        enqueue('groups.send_invites', {'group_id': group_id}, dedupe_key=f"group-invites:{group_id}")
+
+
+@job('groups.purge')
+def purge_group(group_id):
+    if not GroupPurger(group_id).run(time_budget=PURGE_TIME_BUDGET):
+        enqueue('groups.purge', {'group_id': group_id}, dedupe_key=f"group-purge:{group_id}")
+
+
+@job('exports.build')
+def build_export(export_id):
+    export = DataExport.objects.select_related('user').filter(pk=export_id).first()
+    if export is None or export.status == 'done':
+        return
+    Exporter(export).run()
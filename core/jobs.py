@@ -0,0 +1,188 @@
+"""
+Small durable job queue backed by the Job table.
+
+Request handlers call enqueue(); `manage.py run_workers` claims and runs jobs
+on a thread or process pool. Jobs are claimed with SELECT ... FOR UPDATE SKIP
+LOCKED where the database supports it, and with a compare-and-swap UPDATE
+otherwise (SQLite). Failed jobs are retried with exponential backoff.
+A running job holds its lock for STALE_LOCK_TIMEOUT; handlers that can run
+longer call heartbeat() as they make progress to keep it.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+BACKOFF_BASE = 5            # seconds, doubled per attempt
+BACKOFF_CAP = 60 * 60
+STALE_LOCK_TIMEOUT = timedelta(minutes=10)
+HEARTBEAT_INTERVAL = 60     # seconds between lock refreshes from heartbeat()
+
+_running = threading.local()
+
+
+def job(name):
+    """Register a function as the handler for jobs called `name`."""
+    def register(func):
+        REGISTRY[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, dedupe_key=None, run_at=None, max_attempts=5):
+    """
+    Queue a job and return it. With a dedupe_key, an already queued job with
+    the same key is returned instead of adding a second one.
+    """
+    if name not in REGISTRY:
+        raise ValueError(f"Unknown job: {name}")
+    fields = {
+        'name': name, 'payload': payload or {}, 'dedupe_key': dedupe_key,
+        'run_at': run_at or timezone.now(), 'max_attempts': max_attempts,
+    }
+    if dedupe_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(**fields)
+    except IntegrityError:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status='queued').first()
+        if existing is None:  # picked up between the insert and the lookup
+            return enqueue(name, payload, dedupe_key, run_at, max_attempts)
+        return existing
+
+
+def heartbeat():
+    """Refresh the lock of the job running on this thread, at most every HEARTBEAT_INTERVAL."""
+    job_id = getattr(_running, 'job_id', None)
+    if job_id is None or time.monotonic() - _running.beat < HEARTBEAT_INTERVAL:
+        return
+    _running.beat = time.monotonic()
+    Job.objects.filter(id=job_id, status='running').update(locked_at=timezone.now())
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class Worker:
+    def __init__(self, name=None, batch_size=10, poll_interval=1.0):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    # claiming
+
+    def claim(self):
+        now = timezone.now()
+        due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                ids = list(due.select_for_update(skip_locked=True)
+                           .values_list('id', flat=True)[:self.batch_size])
+                Job.objects.filter(id__in=ids).update(
+                    status='running', locked_by=self.name, locked_at=now, attempts=F('attempts') + 1)
+        else:
+            ids = []
+            for pk in due.values_list('id', flat=True)[:self.batch_size]:
+                # compare-and-swap: only one worker can move it out of 'queued'
+                if Job.objects.filter(id=pk, status='queued').update(
+                        status='running', locked_by=self.name, locked_at=now,
+                        attempts=F('attempts') + 1):
+                    ids.append(pk)
+        return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+    def requeue_stale(self):
+        """Jobs whose worker died mid-run go back to the queue."""
+        cutoff = timezone.now() - STALE_LOCK_TIMEOUT
+        stale = Job.objects.filter(status='running', locked_at__lt=cutoff).values_list('id', flat=True)
+        return sum(self.requeue(pk) for pk in stale)
+
+    def requeue(self, pk, **fields):
+        try:
+            with transaction.atomic():
+                return Job.objects.filter(id=pk).update(
+                    status='queued', locked_by='', locked_at=None, **fields)
+        except IntegrityError:
+            # an equivalent job (same dedupe_key) was queued meanwhile and supersedes this one
+            Job.objects.filter(id=pk).update(
+                status='done', locked_by='', locked_at=None, last_error='superseded')
+            return 0
+
+    # running
+
+    def execute(self, job):
+        handler = REGISTRY.get(job.name)
+        _running.job_id, _running.beat = job.id, time.monotonic()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {job.name}")
+            handler(**job.payload)
+        except Exception as exc:
+            logger.exception("Job %s failed (attempt %d/%d)", job, job.attempts, job.max_attempts)
+            if job.attempts < job.max_attempts:
+                self.requeue(job.id, run_at=timezone.now() + backoff(job.attempts),
+                             last_error=repr(exc))
+            else:
+                Job.objects.filter(id=job.id).update(status='failed', last_error=repr(exc))
+            return False
+        finally:
+            _running.job_id = None
+        Job.objects.filter(id=job.id).update(status='done', locked_by='', locked_at=None)
+        return True
+
+    def run_once(self):
+        """Claim and run one batch; returns how many jobs ran."""
+        jobs = self.claim()
+        for claimed in jobs:
+            self.execute(claimed)
+        return len(jobs)
+
+    def drain(self):
+        """Run until nothing is due (used by tests and --once)."""
+        total = 0
+        while True:
+            ran = self.run_once()
+            if not ran:
+                return total
+            total += ran
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        next_stale_check = 0
+        while not stop_event.is_set():
+            close_old_connections()
+            if time.monotonic() >= next_stale_check:
+                self.requeue_stale()
+                next_stale_check = time.monotonic() + 60
+            try:
+                ran = self.run_once()
+            except Exception:
+                logger.exception("Worker %s failed to claim jobs", self.name)
+                ran = 0
+            if not ran:
+                stop_event.wait(self.poll_interval)
+        connection.close()
+
+
+def run_worker_process(poll_interval, batch_size):
+    """Entry point for pool processes."""
+    import django
+    django.setup()
+    try:
+        Worker(poll_interval=poll_interval, batch_size=batch_size).run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,261 @@
+"""
+Closed-loop load test over the real URL routes (manage.py loadtest_vsg).
+
+Each worker thread plays seeded users: it picks a user and a weighted
+endpoint, fills in one of that user's groups, sessions or documents, sends
+the request with the user's JWT and records the latency. Requests go through
+the Django test client in-process, or over HTTP to a running server with
+--base-url. The report has throughput and p50/p95/p99 per endpoint and can
+be saved as JSON and compared with an earlier run to catch regressions.
+"""
+import http.client
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.db import connections
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Document, GroupMembership, StudySession
+
+Endpoint = namedtuple('Endpoint', 'name method path weight')
+
+# roughly what the web client sends: mostly reads, the home screen first
+DEFAULT_MIX = (
+    Endpoint('dashboard', 'GET', '/api/dashboard/', 20),
+    Endpoint('my-groups', 'GET', '/api/groups/my-groups/', 10),
+    Endpoint('explore-groups', 'GET', '/api/groups/explore-groups/', 4),
+    Endpoint('group-activity', 'GET', '/api/groups/{group}/activity/', 6),
+    Endpoint('sessions', 'GET', '/api/sessions/?group={group}', 8),
+    Endpoint('agenda', 'GET', '/api/sessions/agenda/', 8),
+    Endpoint('tasks', 'GET', '/api/tasks/', 10),
+    Endpoint('session-tasks', 'GET', '/api/tasks/?session={session}', 6),
+    Endpoint('documents', 'GET', '/api/documents/?group={group}', 6),
+    Endpoint('comments', 'GET', '/api/document-comments/?document={document}', 5),
+    Endpoint('timers', 'GET', '/api/timers/', 4),
+    Endpoint('sync', 'GET', '/api/sync/', 3),
+    Endpoint('create-task', 'POST', '/api/tasks/', 2),
+)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))  # ceil without floats
+    return sorted_values[int(rank) - 1]
+
+
+class VirtualUser:
+    """A seeded user with a token and the ids their requests can refer to."""
+
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.token = str(RefreshToken.for_user(user).access_token)
+        groups = list(GroupMembership.active.filter(user=user).values_list('group_id', flat=True))
+        self.ids = {
+            'group': groups,
+            'session': list(StudySession.objects.filter(group_id__in=groups)
+                            .values_list('id', flat=True)[:200]),
+            'document': list(Document.objects.filter(group_id__in=groups)
+                             .values_list('id', flat=True)[:200]),
+        }
+
+    def can_call(self, endpoint):
+        placeholders = [key for key in self.ids if '{%s}' % key in endpoint.path]
+        if endpoint.name == 'create-task':
+            placeholders.append('session')
+        return all(self.ids[key] for key in placeholders)
+
+    def fill(self, endpoint, rng):
+        chosen = {key: rng.choice(values) for key, values in self.ids.items() if values}
+        body = None
+        if endpoint.name == 'create-task':
+            body = {'session': chosen['session'], 'title': 'Load test task'}
+        return endpoint.path.format(**chosen), body
+
+
+class InProcessTransport:
+    """Django test client, one per thread; no network or server in the way."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, token, body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+        headers = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+        if method == 'GET':
+            return client.get(path, **headers).status_code
+        return client.generic(method, path, json.dumps(body or {}), 'application/json', **headers).status_code
+
+    def close(self):
+        connections.close_all()  # each worker thread opened its own
+
+
+class HTTPTransport:
+    """Keep-alive HTTP connection per thread to a running server."""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, token, body=None):
+        headers = {'Authorization': f"Bearer {token}"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = self.connection_class(self.netloc, timeout=self.timeout)
+            try:
+                conn.request(method, self.prefix + path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+class Report:
+    def __init__(self, elapsed, samples, errors):
+        self.elapsed = elapsed
+        self.samples = samples  # endpoint name -> latencies in ms
+        self.errors = errors    # endpoint name -> failed requests
+
+    def as_dict(self):
+        endpoints = {}
+        for name in sorted(self.samples):
+            latencies = sorted(self.samples[name])
+            endpoints[name] = {
+                'requests': len(latencies),
+                'errors': self.errors.get(name, 0),
+                'throughput': round(len(latencies) / self.elapsed, 2) if self.elapsed else 0.0,
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2) if latencies else 0.0,
+            }
+        total = sum(len(values) for values in self.samples.values())
+        return {
+            'elapsed': round(self.elapsed, 3),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput': round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+    def lines(self):
+        data = self.as_dict()
+        yield (f"{'endpoint':<16} {'reqs':>6} {'errs':>5} {'req/s':>8} "
+               f"{'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+        for name, row in data['endpoints'].items():
+            yield (f"{name:<16} {row['requests']:>6} {row['errors']:>5} {row['throughput']:>8.1f} "
+                   f"{row['mean']:>8.2f} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['p99']:>8.2f} "
+                   f"{row['max']:>8.2f}")
+        yield (f"total: {data['requests']} requests, {data['errors']} errors in "
+               f"{data['elapsed']:.1f} s = {data['throughput']:.1f} req/s")
+
+
+def regressions(current, baseline, tolerance=0.2, metric='p95'):
+    """Endpoints whose metric grew by more than tolerance (a fraction) over a saved run."""
+    found = []
+    for name, row in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before and before[metric] and row[metric] > before[metric] * (1 + tolerance):
+            found.append((name, before[metric], row[metric]))
+    return found
+
+
+class LoadTest:
+    def __init__(self, transport, users, mix=DEFAULT_MIX, concurrency=4, duration=None,
+                 requests=None, seed=0, clock=time.perf_counter):
+        if duration is None and requests is None:
+            raise ValueError("Give a duration or a number of requests.")
+        self.transport = transport
+        self.users = users
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.seed = seed
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def take_slot(self, deadline):
+        with self.lock:
+            if self.requests is not None and self.sent >= self.requests:
+                return False
+            if deadline is not None and self.clock() >= deadline:
+                return False
+            self.sent += 1
+            return True
+
+    def worker(self, index, deadline, samples, errors):
+        rng = random.Random(self.seed * 1000 + index)
+        # a user without groups has no group pages: each user only calls what they can
+        callable_mix = [(user, [e for e in self.mix if user.can_call(e)]) for user in self.users]
+        callable_mix = [(user, endpoints, [e.weight for e in endpoints])
+                        for user, endpoints in callable_mix if endpoints]
+        if not callable_mix:
+            return
+        try:
+            while self.take_slot(deadline):
+                user, endpoints, weights = rng.choice(callable_mix)
+                endpoint = rng.choices(endpoints, weights)[0]
+                path, body = user.fill(endpoint, rng)
+                started = self.clock()
+                try:
+                    status = self.transport.request(endpoint.method, path, user.token, body)
+                except Exception:
+                    status = None
+                elapsed = (self.clock() - started) * 1000
+                samples.setdefault(endpoint.name, []).append(elapsed)
+                if status is None or status >= 400:
+                    errors[endpoint.name] = errors.get(endpoint.name, 0) + 1
+        finally:
+            self.transport.close()
+
+    def run(self):
+        started = self.clock()
+        deadline = started + self.duration if self.duration is not None else None
+        # per-thread dicts, merged afterwards, so recording needs no lock
+        results = [({}, {}) for _ in range(self.concurrency)]
+        threads = [threading.Thread(target=self.worker, args=(i, deadline, *results[i]), daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = self.clock() - started
+
+        samples, errors = {}, {}
+        for thread_samples, thread_errors in results:
+            for name, values in thread_samples.items():
+                samples.setdefault(name, []).extend(values)
+            for name, count in thread_errors.items():
+                errors[name] = errors.get(name, 0) + count
+        return Report(elapsed, samples, errors)
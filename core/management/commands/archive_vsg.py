@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.archive import POLICIES, Archiver
+
+
+class Command(BaseCommand):
+    help = ("Move old read notifications, stopped timers and quiet comment threads "
+            "to gzip JSONL archives, deleting them in small batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', help="Comma separated subset of: " + ", ".join(POLICIES))
+        parser.add_argument('--notification-days', type=int, default=90,
+                            help="Archive read notifications older than this.")
+        parser.add_argument('--timer-days', type=int, default=365,
+                            help="Archive stopped timers that started before this.")
+        parser.add_argument('--comment-days', type=int, default=730,
+                            help="Archive comments on documents with no comment since this.")
+        parser.add_argument('--output-dir', default=getattr(settings, 'ARCHIVE_ROOT', 'archive'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many rows would be archived.")
+
+    def handle(self, *args, **options):
+        names = options['only'].split(',') if options['only'] else list(POLICIES)
+        unknown = set(names) - set(POLICIES)
+        if unknown:
+            self.stderr.write(f"Unknown: {', '.join(sorted(unknown))}")
+            return
+        days = {
+            'notifications': options['notification_days'],
+            'timers': options['timer_days'],
+            'comments': options['comment_days'],
+        }
+        archiver = Archiver(options['output_dir'], batch_size=options['batch_size'],
+                            pause=options['pause'])
+        for name in names:
+            policy = POLICIES[name](days[name])
+            if options['dry_run']:
+                self.stdout.write(f"{name}: {archiver.count(policy)} rows would be archived")
+                continue
+            total, path = archiver.run(policy)
+            if total:
+                self.stdout.write(f"{name}: archived {total} rows to {path}")
+            else:
+                self.stdout.write(f"{name}: nothing to archive")
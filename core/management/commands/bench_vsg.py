@@ -0,0 +1,167 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import (
+    Profile, Group, GroupMembership, Task, Document, StudySession, Notification
+)
+from core.renderers import ORJSONRenderer
+from core.serializers import (
+    GroupSerializer, TaskSerializer, DocumentSerializer, StudySessionSerializer,
+    GroupLeanSerializer, TaskLeanSerializer, DocumentLeanSerializer, StudySessionLeanSerializer
+)
+
+
+def seed_home_screen(groups=20, sessions_per_group=10, tasks_per_session=5):
+    """Small, deterministic data set for one user that belongs to many groups."""
+    user = User.objects.create_user('bench', password='bench-pass')
+    Profile.objects.create(user=user)
+    other = User.objects.create_user('bench-other', password='bench-pass')
+    Profile.objects.create(user=other)
+
+    now = timezone.now()
+    created = Group.objects.bulk_create([
+        Group(name=f"Group {i}", created_by=user if i % 4 == 0 else other)
+        for i in range(groups)
+    ])
+    GroupMembership.objects.bulk_create([
+        GroupMembership(user=user, group=g, sort_name=user.username.lower(),
+                        role='admin' if g.created_by_id == user.id else 'member')
+        for g in created
+    ])
+    sessions = StudySession.objects.bulk_create([
+        StudySession(group=g, title=f"Session {i}",
+                     start_time=now + timedelta(days=i - 2),
+                     end_time=now + timedelta(days=i - 2, hours=2))
+        for g in created for i in range(sessions_per_group)
+    ])
+    Task.objects.bulk_create([
+        Task(session=s, created_by=other, title=f"Task {i}",
+             status='complete' if i % 3 == 0 else 'pending')
+        for s in sessions for i in range(tasks_per_session)
+    ])
+    Document.objects.bulk_create([
+        Document(group=g, uploaded_by=other, title=f"Doc {g.id}", file=f"documents/group_{g.id}/doc.pdf")
+        for g in created if g.created_by_id == user.id
+    ])
+    Notification.objects.bulk_create([
+        Notification(user=user, message=f"Notice {i}", read_status=i % 2 == 0)
+        for i in range(50)
+    ])
+    return user
+
+
+def measure(client, urls, repeat):
+    """Return (queries per pass, mean milliseconds per pass) for a list of GETs."""
+    with CaptureQueriesContext(connection) as ctx:
+        for url in urls:
+            client.get(url)
+    queries = len(ctx.captured_queries)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            client.get(url)
+    elapsed = (time.perf_counter() - start) / repeat
+    return queries, elapsed * 1000
+
+
+def bench_dashboard(command, repeat):
+    user = seed_home_screen()
+    client = APIClient()
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    separate = [
+        '/api/profile/',
+        '/api/groups/my-groups/',
+        '/api/groups/my-admin-groups/',
+        '/api/sessions/?status=active',
+        '/api/tasks/',
+    ]
+    rows = [
+        ('5 separate calls', *measure(client, separate, repeat)),
+        ('/api/dashboard/', *measure(client, ['/api/dashboard/'], repeat)),
+    ]
+    for label, queries, ms in rows:
+        command.stdout.write(f"{label:<20} queries={queries:<6} mean={ms:8.2f} ms")
+
+
+def bench_serializers(command, repeat, rows=10000):
+    user = User.objects.create_user('bench', password='bench-pass')
+    now = timezone.now()
+    groups = Group.objects.bulk_create([
+        Group(name=f"Group {i}", created_by=user) for i in range(rows)
+    ])
+    sessions = StudySession.objects.bulk_create([
+        StudySession(group=groups[i % 100], title=f"Session {i}",
+                     start_time=now + timedelta(hours=i), end_time=now + timedelta(hours=i + 1))
+        for i in range(rows)
+    ])
+    Task.objects.bulk_create([
+        Task(session=sessions[i], created_by=user, title=f"Task {i}", due_date=now.date())
+        for i in range(rows)
+    ])
+    Document.objects.bulk_create([
+        Document(group=groups[i], uploaded_by=user, title=f"Doc {i}",
+                 file=f"documents/group_{groups[i].id}/doc{i}.pdf", file_type='pdf')
+        for i in range(rows)
+    ])
+
+    cases = [
+        ('Group', GroupSerializer, GroupLeanSerializer,
+         Group.objects.select_related('created_by').order_by('id')),
+        ('Task', TaskSerializer, TaskLeanSerializer,
+         Task.objects.select_related('created_by').order_by('id')),
+        ('Document', DocumentSerializer, DocumentLeanSerializer,
+         Document.objects.select_related('uploaded_by').order_by('id')),
+        ('StudySession', StudySessionSerializer, StudySessionLeanSerializer,
+         StudySession.objects.order_by('id')),
+    ]
+    for label, serializer_class, lean_class, queryset in cases:
+        def model_pass():
+            return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+        def lean_pass():
+            return ORJSONRenderer().render(lean_class(queryset.all()).data)
+
+        timings = []
+        for run in (model_pass, lean_pass):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            timings.append((time.perf_counter() - start) / repeat * 1000)
+        command.stdout.write(
+            f"{label:<14} rows={rows} serializer={timings[0]:9.2f} ms "
+            f"lean+orjson={timings[1]:8.2f} ms speedup={timings[0] / timings[1]:5.1f}x")
+
+
+SCENARIOS = {
+    'dashboard': bench_dashboard,
+    'serializers': bench_serializers,
+}
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark scenario against a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            SCENARIOS[options['scenario']](self, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.sync import compact
+
+
+class Command(BaseCommand):
+    help = "Compact the /api/sync/ change log (run periodically, e.g. nightly from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired, superseded = compact(batch_size=options['batch_size'])
+        self.stdout.write(f"Removed {expired} expired and {superseded} superseded change log entries.")
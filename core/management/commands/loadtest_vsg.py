@@ -0,0 +1,73 @@
+import json
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.loadtest import DEFAULT_MIX, HTTPTransport, InProcessTransport, LoadTest, VirtualUser, regressions
+
+
+class Command(BaseCommand):
+    help = ("Drive the API routes with seeded users (see seed_vsg) and report "
+            "throughput and p50/p95/p99 latency per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='seed', help="Use users named <prefix>_user_*.")
+        parser.add_argument('--users', type=int, default=50, help="How many seeded users take part.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Worker threads.")
+        parser.add_argument('--duration', type=float, help="Seconds to run.")
+        parser.add_argument('--requests', type=int, help="Stop after this many requests.")
+        parser.add_argument('--base-url', help="Send HTTP to a running server instead of in-process; "
+                                               "start it with THROTTLE_DISABLED=1.")
+        parser.add_argument('--throttle', action='store_true',
+                            help="Keep the rate limits for in-process runs (they are skipped by default).")
+        parser.add_argument('--only', help="Comma separated endpoint names: " +
+                            ", ".join(endpoint.name for endpoint in DEFAULT_MIX))
+        parser.add_argument('--read-only', action='store_true', help="Leave out endpoints that write.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', help="Write the report as JSON to this file.")
+        parser.add_argument('--compare', help="JSON report of an earlier run to compare p95 against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 growth over --compare, as a fraction.")
+
+    def handle(self, *args, **options):
+        if options['duration'] is None and options['requests'] is None:
+            options['duration'] = 30.0
+        mix = DEFAULT_MIX
+        if options['only']:
+            names = set(options['only'].split(','))
+            unknown = names - {endpoint.name for endpoint in DEFAULT_MIX}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            mix = tuple(endpoint for endpoint in mix if endpoint.name in names)
+        if options['read_only']:
+            mix = tuple(endpoint for endpoint in mix if endpoint.method == 'GET')
+
+        users = User.objects.filter(username__startswith=f"{options['prefix']}_user_").order_by('id')
+        users = [VirtualUser(user) for user in users[:options['users']]]
+        if not users:
+            raise CommandError(f"No {options['prefix']}_user_* users; run seed_vsg first.")
+
+        transport = HTTPTransport(options['base_url']) if options['base_url'] else InProcessTransport()
+        # the seeded users would otherwise spend the run collecting 429s
+        unthrottled = (override_settings(THROTTLE_DISABLED=True)
+                       if not options['base_url'] and not options['throttle'] else nullcontext())
+        with unthrottled:
+            report = LoadTest(transport, users, mix=mix, concurrency=options['concurrency'],
+                              duration=options['duration'], requests=options['requests'],
+                              seed=options['seed']).run()
+        for line in report.lines():
+            self.stdout.write(line)
+
+        data = report.as_dict()
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump(data, fh, indent=2)
+        if options['compare']:
+            with open(options['compare']) as fh:
+                slower = regressions(data, json.load(fh), options['tolerance'])
+            for name, before, after in slower:
+                self.stderr.write(f"{name}: p95 {before:.2f} ms -> {after:.2f} ms")
+            if slower:
+                raise CommandError(f"{len(slower)} endpoints regressed beyond {options['tolerance']:.0%}.")
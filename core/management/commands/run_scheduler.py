@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.scheduler import ReminderScheduler, reminder_offsets
+
+
+class Command(BaseCommand):
+    help = "Send study session reminders to group members at the configured offsets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offsets', help="Comma separated minutes before start, "
+                                              "defaults to settings.SESSION_REMINDER_OFFSETS.")
+        parser.add_argument('--lookahead', type=int, default=300,
+                            help="Seconds of upcoming reminders to load per refill.")
+        parser.add_argument('--max-sleep', type=float, default=30.0)
+        parser.add_argument('--once', action='store_true',
+                            help="Send what is due now and exit (e.g. from cron).")
+
+    def handle(self, *args, **options):
+        if options['offsets']:
+            offsets = sorted({timedelta(minutes=int(m)) for m in options['offsets'].split(',')},
+                             reverse=True)
+        else:
+            offsets = reminder_offsets()
+        scheduler = ReminderScheduler(offsets=offsets,
+                                      lookahead=timedelta(seconds=options['lookahead']))
+
+        if options['once']:
+            sent = scheduler.run_due()
+            self.stdout.write(f"Sent {sent} reminders.")
+            return
+
+        self.stdout.write("Reminder scheduler running, offsets: "
+                          + ", ".join(str(offset) for offset in offsets))
+        try:
+            scheduler.run_forever(max_sleep=options['max_sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
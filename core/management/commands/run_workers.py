@@ -0,0 +1,73 @@
+import multiprocessing
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import Worker, run_worker_process
+
+
+class Command(BaseCommand):
+    help = "Run background job workers on a thread or process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true',
+                            help="Run everything that is due, then exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = Worker(batch_size=options['batch_size']).drain()
+            self.stdout.write(f"Ran {ran} jobs.")
+            return
+
+        concurrency = options['concurrency']
+        self.stdout.write(f"Starting {concurrency} {options['pool']} workers")
+        if options['pool'] == 'process':
+            self.run_processes(concurrency, options)
+        else:
+            self.run_threads(concurrency, options)
+
+    def run_threads(self, concurrency, options):
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=Worker(name=f"thread-{i}", batch_size=options['batch_size'],
+                              poll_interval=options['poll_interval']).run_forever,
+                args=(stop,), daemon=True)
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers...")
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def run_processes(self, concurrency, options):
+        # don't share the parent's database connections with the children
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=run_worker_process,
+                args=(options['poll_interval'], options['batch_size']))
+            for _ in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers...")
+            for process in processes:
+                process.terminate()
+                process.join()
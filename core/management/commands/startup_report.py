@@ -0,0 +1,93 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.startup import by_package, parse_importtime, regressions
+
+# Run in a fresh interpreter: load the WSGI application the way a worker
+# does, then report wall time, resident memory and what got imported.
+BOOT = r"""
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vsg_project.settings')
+import vsg_project.wsgi
+boot_ms = (time.perf_counter() - started) * 1000
+rss_kb = 0
+with open('/proc/self/status') as fh:
+    for line in fh:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({
+    'boot_ms': boot_ms,
+    'rss_kb': rss_kb,
+    'modules': len(sys.modules),
+    'loaded': {name: name in sys.modules for name in ('PIL', 'django.contrib.admin', 'core.admin')},
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Boot a worker in a fresh interpreter and report import time, boot time, "
+            "RSS and the slowest imports; compare with a saved report to catch regressions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--api-only', action='store_true', help="Boot with VSG_API_ONLY=1.")
+        parser.add_argument('--repeat', type=int, default=3, help="Boots to take the median of.")
+        parser.add_argument('--top', type=int, default=15, help="Slowest imports to list.")
+        parser.add_argument('--save', help="Write the report as JSON to this file.")
+        parser.add_argument('--compare', help="JSON report of an earlier run to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed growth over --compare, as a fraction.")
+
+    def boot(self, env):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT], env=env,
+                                cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"Worker boot failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='vsg_project.settings')
+        env.pop('VSG_API_ONLY', None)
+        if options['api_only']:
+            env['VSG_API_ONLY'] = '1'
+
+        boots = [self.boot(env) for _ in range(max(1, options['repeat']))]
+        rows = boots[-1][1]
+        report = {
+            'api_only': options['api_only'],
+            'import_ms': round(statistics.median(sum(r[1] for r in rows) / 1000 for _, rows in boots), 1),
+            'boot_ms': round(statistics.median(data['boot_ms'] for data, _ in boots), 1),
+            'rss_kb': int(statistics.median(data['rss_kb'] for data, _ in boots)),
+            'modules': boots[-1][0]['modules'],
+            'loaded': boots[-1][0]['loaded'],
+            'packages': {name: round(us / 1000, 1) for name, us in
+                         sorted(by_package(rows).items(), key=lambda item: -item[1])[:options['top']]},
+        }
+
+        self.stdout.write(f"boot {report['boot_ms']} ms (imports {report['import_ms']} ms), "
+                          f"RSS {report['rss_kb'] / 1024:.1f} MiB, {report['modules']} modules")
+        self.stdout.write("loaded: " + ", ".join(
+            f"{name}={'yes' if loaded else 'no'}" for name, loaded in report['loaded'].items()))
+        self.stdout.write("self import time by package (ms):")
+        for name, ms in report['packages'].items():
+            self.stdout.write(f"  {name:<32} {ms:8.1f}")
+        self.stdout.write("slowest modules, self time (ms):")
+        for module, self_us, _, _ in sorted(rows, key=lambda row: -row[1])[:options['top']]:
+            self.stdout.write(f"  {module:<48} {self_us / 1000:8.2f}")
+
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+        if options['compare']:
+            with open(options['compare']) as fh:
+                grown = regressions(report, json.load(fh), options['tolerance'])
+            for name, before, after in grown:
+                self.stderr.write(f"{name}: {before} -> {after}")
+            if grown:
+                raise CommandError(f"{len(grown)} start-up numbers regressed beyond {options['tolerance']:.0%}.")
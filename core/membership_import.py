@@ -0,0 +1,192 @@
+"""
+Bulk membership import and email invites.
+
+MemberImport(group, invited_by).run(identifiers) takes usernames or emails
+(read_identifiers gives the first column of an uploaded CSV, lazily) and
+works through them BATCH_SIZE at a time: one IN query resolves the
+usernames, one finds who is already a member and one
+bulk_create(ignore_conflicts=True) adds the rest, so the (user, group)
+unique_together constraint settles races with members joining meanwhile.
+
+Emails are never matched to accounts: addresses aren't verified or unique,
+so whoever typed an address into their profile is not necessarily its
+owner. Every email becomes a GroupInvite instead. The 'groups.send_invites'
+job gives each one a random token, stores only its hash and mails the token;
+whoever holds it joins through /api/invites/claim/ (claim_invite), once, and
+within INVITE_MAX_AGE_DAYS of the mail going out.
+"""
+import csv
+import hashlib
+import io
+import secrets
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.mail import send_mass_mail
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from . import activity
+from .jobs import enqueue
+from .models import GroupInvite, GroupMembership, Notification
+from .presence import publish_membership
+from .sync import record_many
+
+BATCH_SIZE = 1000
+HEADER_NAMES = {'username', 'email', 'user', 'identifier'}
+UNKNOWN_SAMPLE = 100  # unknown usernames echoed back to the admin
+
+
+def read_identifiers(fileobj):
+    """First-column values of a binary CSV file object; header and blank rows skipped."""
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    for i, row in enumerate(reader):
+        value = row[0].strip() if row else ''
+        if value and not (i == 0 and value.lower() in HEADER_NAMES):
+            yield value
+
+
+def is_email(value):
+    try:
+        validate_email(value)
+    except ValidationError:
+        return False
+    return True
+
+
+class MemberImport:
+    def __init__(self, group, invited_by, max_rows=None, batch_size=BATCH_SIZE):
+        self.group = group
+        self.invited_by = invited_by
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.counts = {'rows': 0, 'added': 0, 'already_members': 0, 'invited': 0, 'unknown': 0}
+        self.unknown = []
+        self.seen = set()
+
+    def run(self, identifiers):
+        """Import everything in one transaction; raises ValueError past max_rows."""
+        identifiers = iter(identifiers)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(identifiers, self.batch_size))
+                if not batch:
+                    break
+                self.counts['rows'] += len(batch)
+                if self.max_rows is not None and self.counts['rows'] > self.max_rows:
+                    raise ValueError(f"The file has more than {self.max_rows} rows.")
+                self.import_batch(batch)
+            if self.counts['invited']:
+                enqueue('groups.send_invites', {'group_id': self.group.pk},
+                        dedupe_key=f"group-invites:{self.group.pk}")
+            if self.counts['added'] or self.counts['invited']:
+                # one event for the whole file instead of one per member
+                activity.log(self.group.pk, 'members.imported', actor=self.invited_by,
+                             added=self.counts['added'], invited=self.counts['invited'])
+        return {**self.counts, 'unknown_usernames': self.unknown}
+
+    def import_batch(self, batch):
+        values = []
+        for value in batch:
+            key = value.lower()
+            if key not in self.seen:
+                self.seen.add(key)
+                values.append(value)
+        # usernames are unique and exact; an email only ever gets an invite
+        by_username = dict(User.objects.filter(username__in=values).values_list('username', 'id'))
+
+        found, invites = {}, []
+        for value in values:
+            if value in by_username:
+                found[by_username[value]] = value
+            elif '@' in value and is_email(value):
+                invites.append(value.lower())
+            else:
+                self.counts['unknown'] += 1
+                if len(self.unknown) < UNKNOWN_SAMPLE:
+                    self.unknown.append(value)
+
+        existing = set(GroupMembership.objects.filter(group=self.group, user_id__in=found)
+                       .values_list('user_id', flat=True))
+        new = [(user_id, username) for user_id, username in found.items() if user_id not in existing]
+        self.counts['already_members'] += len(existing)
+        self.counts['added'] += len(new)
+        if new:
+            # bulk_create skips the signals: fill sort_name and tell sync and presence clients here
+            GroupMembership.objects.bulk_create([
+                GroupMembership(group=self.group, user_id=user_id, role='member', sort_name=username.lower())
+                for user_id, username in new
+            ], ignore_conflicts=True)
+            record_many('membership', [(user_id, self.group.pk) for user_id, _ in new])
+            transaction.on_commit(partial(publish_membership, [
+                (user_id, self.group.pk, 'joined') for user_id, _ in new]))
+            Notification.objects.bulk_create([
+                Notification(user_id=user_id, type='group_added',
+                             message=f"{self.invited_by.username} added you to '{self.group.name}'.")
+                for user_id, _ in new
+            ])
+        if invites:
+            GroupInvite.objects.bulk_create([
+                GroupInvite(group=self.group, email=email, invited_by=self.invited_by) for email in invites
+            ], ignore_conflicts=True)
+            self.counts['invited'] += len(invites)
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def claim_message(group, invite, token):
+    inviter = invite.invited_by.username if invite.invited_by else 'A group admin'
+    claim_url = getattr(settings, 'INVITE_CLAIM_URL', None)
+    how = f"Open {claim_url}?token={token}" if claim_url else f"Enter this invite code in the app: {token}"
+    return (f"{inviter} invited you to the study group '{group.name}'. {how} "
+            f"once you are signed in. The invite works once and expires in "
+            f"{getattr(settings, 'INVITE_MAX_AGE_DAYS', 14)} days.")
+
+
+def send_invites(group, batch_size=200):
+    """Mail up to batch_size unsent invites of the group; returns how many went out."""
+    invites = list(group.invites.filter(sent_at__isnull=True).select_related('invited_by')
+                   .order_by('id')[:batch_size])
+    if not invites:
+        return 0
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+    messages = []
+    for invite in invites:
+        token = secrets.token_urlsafe(32)
+        invite.token_hash = token_hash(token)  # the token itself only goes out in the mail
+        messages.append((f"You're invited to {group.name}", claim_message(group, invite, token),
+                         from_email, [invite.email]))
+    send_mass_mail(messages, fail_silently=False)  # one connection for the batch
+    now = timezone.now()
+    for invite in invites:
+        invite.sent_at = now
+    GroupInvite.objects.bulk_update(invites, ['token_hash', 'sent_at'])
+    return len(invites)
+
+
+def claim_invite(user, token):
+    """
+    Add user to the group of the invite holding token and use the invite up;
+    returns the GroupMembership, or None if the token is unknown or expired.
+    """
+    max_age = timedelta(days=getattr(settings, 'INVITE_MAX_AGE_DAYS', 14))
+    with transaction.atomic():
+        invite = (GroupInvite.objects.select_for_update()
+                  .filter(token_hash=token_hash(token), sent_at__gte=timezone.now() - max_age,
+                          group__deleted_at__isnull=True)
+                  .select_related('group').first())
+        if invite is None:
+            return None
+        membership, created = GroupMembership.objects.get_or_create(
+            user=user, group=invite.group, defaults={'role': 'member'})
+        if created:
+            activity.log(invite.group_id, 'member.joined', actor=user)
+        invite.delete()
+    return membership
@@ -0,0 +1,231 @@
+import hmac
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Media types that are already compressed; re-compressing only burns CPU.
+INCOMPRESSIBLE_PREFIXES = ('image/', 'video/', 'audio/', 'font/woff')
+INCOMPRESSIBLE_TYPES = {
+    'application/zip', 'application/gzip', 'application/x-gzip',
+    'application/x-bzip2', 'application/x-7z-compressed', 'application/x-rar-compressed',
+    'application/x-xz', 'application/zstd', 'application/pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+# svg is text, compress it even though it is an image/ type
+COMPRESSIBLE_EXCEPTIONS = {'image/svg+xml'}
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into a set of codings, dropping the ones with q=0."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = params.strip().replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    return accepted
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(';')[0].strip().lower()
+    if media_type in COMPRESSIBLE_EXCEPTIONS:
+        return True
+    return not (media_type in INCOMPRESSIBLE_TYPES or media_type.startswith(INCOMPRESSIBLE_PREFIXES))
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+    for item in sequence:
+        # flush per chunk so the client can start decoding right away
+        yield compressor.process(item) + compressor.flush()
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that also negotiates brotli (when the brotli package is
+    installed) and skips media types that are already compressed.
+    Streaming responses are compressed chunk by chunk.
+    """
+    brotli_quality = 4
+
+    def process_response(self, request, response):
+        if not is_compressible(response.get('Content-Type', '')):
+            return response
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or 'br' not in accepted or (response.streaming and response.is_async):
+            if 'gzip' not in accepted:
+                # still vary, a different client may get a compressed copy
+                patch_vary_headers(response, ('Accept-Encoding',))
+                return response
+            return super().process_response(request, response)
+
+        if not response.streaming and len(response.content) < 200:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.streaming:
+            response.streaming_content = brotli_sequence(
+                response.streaming_content, self.brotli_quality)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(
+                response.content, mode=brotli.MODE_TEXT, quality=self.brotli_quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class ActivityFlushMiddleware:
+    """Write the buffered activity events (core.activity) once the response is ready."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .activity import buffer
+
+        response = self.get_response(request)
+        if buffer.events:
+            buffer.flush()
+        return response
+
+
+class RateLimitHeadersMiddleware:
+    """
+    X-RateLimit-Limit, -Remaining and -Reset of the limit that refused the
+    request, or else the tightest one a throttle (core.throttling) checked.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        states = getattr(request, 'rate_limits', None)
+        if states:
+            scope, limit, remaining, reset, _ = min(states, key=lambda state: (state[4], state[2] / state[1]))
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Reset'] = str(reset)
+            response['X-RateLimit-Scope'] = scope
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Query count, DB, serializer and cache numbers per request (core.metrics),
+    added to the per-route histograms and sent back as Server-Timing: with
+    METRICS_SERVER_TIMING None (the default) only to staff or in DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', None)
+        self.aliases = list(settings.DATABASES)
+
+    def show_timing(self, request):
+        if self.server_timing is not None:
+            return self.server_timing
+        # DRF puts the token-authenticated user on the request once the view ran
+        user = getattr(request, 'user', None)
+        return settings.DEBUG or bool(user and user.is_staff)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; that time is serialization
+        from . import metrics as request_metrics
+
+        metrics = request_metrics.current()
+        if metrics is not None:
+            request_metrics.start_render(metrics)
+        return response
+
+    def __call__(self, request):
+        from . import metrics as request_metrics
+
+        if not self.enabled or request.path == '/metrics':
+            return self.get_response(request)
+        metrics, token = request_metrics.start_request()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in self.aliases:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+                request_metrics.end_render(metrics)
+        finally:
+            request_metrics.end_request(token)
+        total = time.perf_counter() - started
+        if self.show_timing(request):
+            response['Server-Timing'] = metrics.server_timing(total)
+        request_metrics.registry.observe(
+            request_metrics.route_of(request), request.method, response.status_code, total, metrics)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests sent with "X-Profile: <PROFILE_TOKEN>" and one in
+    PROFILE_SAMPLE_RATE others (core.profiling). Switched off, and out of
+    the middleware chain, when neither is set.
+    """
+
+    def __init__(self, get_response):
+        from .profiling import RequestProfiler
+
+        self.get_response = get_response
+        self.token = getattr(settings, 'PROFILE_TOKEN', None)
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if not self.token and not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.profiler = RequestProfiler(
+            getattr(settings, 'PROFILE_DIR', 'profiles'),
+            getattr(settings, 'PROFILE_FORMAT', 'collapsed'),
+            getattr(settings, 'PROFILE_INTERVAL', 0.005))
+
+    def __call__(self, request):
+        from .metrics import route_of
+
+        header = request.headers.get('X-Profile')
+        requested = bool(self.token and header and hmac.compare_digest(header, self.token))
+        if not requested and not (self.sample_rate and random.randrange(self.sample_rate) == 0):
+            return self.get_response(request)
+        response, path = self.profiler.profile(
+            self.get_response, request, label=lambda: f"{request.method}-{route_of(request)}")
+        if requested:
+            response['X-Profile-File'] = os.path.basename(path)
+        return response
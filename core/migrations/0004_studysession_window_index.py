@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_remove_studysession_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studysession',
+            index=models.Index(fields=['group', 'end_time', 'start_time'], name='session_group_window_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_studysession_window_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studysession',
+            name='original_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studysession',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='core.studysession'),
+        ),
+        migrations.AddField(
+            model_name='studysession',
+            name='recurrence',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='studysession',
+            name='recurrence_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='studysession',
+            index=models.Index(fields=['group', 'recurrence_until'], name='session_group_series_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='studysession',
+            constraint=models.UniqueConstraint(fields=('parent', 'original_start'), name='unique_session_occurrence'),
+        ),
+    ]
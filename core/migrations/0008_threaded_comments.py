@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill(apps, schema_editor):
+    # every existing comment is a thread root
+    DocumentComment = apps.get_model('core', 'DocumentComment')
+    Document = apps.get_model('core', 'Document')
+    for pk in DocumentComment.objects.values_list('id', flat=True).iterator():
+        DocumentComment.objects.filter(pk=pk).update(path=f"{pk:010d}/")
+    stats = DocumentComment.objects.values('document_id').annotate(
+        total=Count('id'), last=Max('created_at'))
+    for row in stats.iterator():
+        Document.objects.filter(pk=row['document_id']).update(
+            comment_count=row['total'], last_comment_at=row['last'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentcomment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documentcomment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='core.documentcomment'),
+        ),
+        migrations.AddField(
+            model_name='documentcomment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='documentcomment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='documentcomment',
+            index=models.Index(fields=['document', 'parent', 'created_at'], name='comment_threads_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentcomment',
+            index=models.Index(fields=['document', 'path'], name='comment_path_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sync_changelog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('group_id', models.PositiveIntegerField()),
+                ('month', models.PositiveIntegerField()),
+                ('verb', models.CharField(choices=[('member.joined', 'Member joined'), ('member.left', 'Member left'), ('document.approved', 'Document approved'), ('task.completed', 'Task completed')], max_length=50)),
+                ('target_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group_id', 'month', 'id'], name='activity_partition_idx')],
+            },
+        ),
+    ]
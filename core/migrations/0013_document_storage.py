@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:32
+
+import core.models
+import core.storage
+import os
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # hash and MIME of existing files are filled in by queued documents.detect_metadata jobs
+    Document = apps.get_model('core', 'Document')
+    Job = apps.get_model('core', 'Job')
+    jobs = []
+    for pk, name in Document.objects.values_list('id', 'file').iterator():
+        Document.objects.filter(pk=pk).update(original_name=os.path.basename(name)[:255])
+        if name:
+            jobs.append(Job(name='documents.detect_metadata', payload={'document_id': pk},
+                            dedupe_key=f"document-metadata:{pk}"))
+    Job.objects.bulk_create(jobs, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_group_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(max_length=255, storage=core.storage.document_storage, upload_to=core.models.document_upload_path),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
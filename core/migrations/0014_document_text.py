@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # existing files are extracted and indexed by queued documents.extract_text jobs
+    Document = apps.get_model('core', 'Document')
+    Job = apps.get_model('core', 'Job')
+    Job.objects.bulk_create([
+        Job(name='documents.extract_text', payload={'document_id': pk}, dedupe_key=f"document-text:{pk}")
+        for pk in Document.objects.exclude(file='').values_list('id', flat=True).iterator()
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_document_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='extracted_text', serialize=False, to='core.document')),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('text', models.TextField(blank=True)),
+                ('truncated', models.BooleanField(default=False)),
+                ('page_offsets', models.JSONField(blank=True, default=list)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DocumentTerm',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('term', models.CharField(max_length=40)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='core.document')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'document'), name='unique_document_term')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
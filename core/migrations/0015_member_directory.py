@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def backfill(apps, schema_editor):
+    GroupMembership = apps.get_model('core', 'GroupMembership')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    GroupMembership.objects.update(sort_name=Subquery(
+        User.objects.filter(pk=OuterRef('user_id')).values(name=Lower('username'))[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_document_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmembership',
+            name='sort_name',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.AddIndex(
+            model_name='groupmembership',
+            index=models.Index(fields=['group', 'sort_name', 'user'], name='member_directory_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmembership',
+            index=models.Index(fields=['group', 'role', 'sort_name', 'user'], name='member_role_directory_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
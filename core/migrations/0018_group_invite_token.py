@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+def resend(apps, schema_editor):
+    # invites mailed before tokens existed can't be claimed: send them again with one
+    GroupInvite = apps.get_model('core', 'GroupInvite')
+    Job = apps.get_model('core', 'Job')
+    GroupInvite.objects.update(sent_at=None)
+    Job.objects.bulk_create([
+        Job(name='groups.send_invites', payload={'group_id': pk}, dedupe_key=f"group-invites:{pk}")
+        for pk in GroupInvite.objects.values_list('group_id', flat=True).distinct().iterator()
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_data_export'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupinvite',
+            name='token_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(resend, migrations.RunPython.noop),
+    ]
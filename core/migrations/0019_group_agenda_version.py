@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_group_invite_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='agenda_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    Blob = apps.get_model('core', 'Blob')
+    Document = apps.get_model('core', 'Document')
+    rows = (Document.objects.exclude(content_hash='').values('content_hash')
+            .annotate(refs=Count('id')).order_by().iterator())
+    Blob.objects.bulk_create((Blob(content_hash=row['content_hash'], refs=row['refs']) for row in rows),
+                             batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_group_agenda_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activityevent',
+            name='verb',
+            field=models.CharField(choices=[('member.joined', 'Member joined'), ('member.left', 'Member left'), ('members.imported', 'Members imported'), ('document.approved', 'Document approved'), ('task.completed', 'Task completed')], max_length=50),
+        ),
+    ]
@@ -1,8 +1,14 @@
+import os
+from bisect import bisect_right
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User  # using default User
 from django.utils import timezone
 
+from .recurrence import parse_rule, series_end
+from .storage import claim_blob, describe_upload, document_storage, release_blobs
+
 # Profile (1:1 with User)
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -17,17 +23,45 @@ class Profile(models.Model):
 
 
 # Group
+class GroupManager(models.Manager):
+    # groups waiting to be purged (see core.purge) are invisible everywhere
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Group(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups')
     created_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # part of the iCalendar cache keys; bump_group_version moves it on every session change
+    agenda_version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = GroupManager()
+    all_objects = models.Manager()
+
+    def save(self, *args, **kwargs):
+        # only bump_group_version writes agenda_version: saving an instance
+        # loaded before a bump must not roll it back to a cached version
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'agenda_version']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
 # GroupMembership (junction for users <-> groups)
+class ActiveMembershipManager(models.Manager):
+    # memberships of a deleted group stop counting right away: member-scoped
+    # querysets take their group ids from GroupMembership.active, which hides
+    # the group's sessions, tasks and documents at once
+    def get_queryset(self):
+        return super().get_queryset().filter(group__deleted_at__isnull=True)
+
+
 class GroupMembership(models.Model):
     ROLE_CHOICES = (('admin', 'Admin'), ('member', 'Member'))
 
@@ -35,9 +69,19 @@ class GroupMembership(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='memberships')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='member')
     joined_at = models.DateTimeField(auto_now_add=True)
+    # lowercased copy of user.username, so the member directory can sort and
+    # prefix-search a group's members inside one index range
+    sort_name = models.CharField(max_length=150, blank=True, editable=False)
+
+    objects = models.Manager()
+    active = ActiveMembershipManager()
 
     class Meta:
         unique_together = ('user', 'group')
+        indexes = [
+            models.Index(fields=['group', 'sort_name', 'user'], name='member_directory_idx'),
+            models.Index(fields=['group', 'role', 'sort_name', 'user'], name='member_role_directory_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} in {self.group.name} as {self.role}"
@@ -55,6 +99,11 @@ class Task(models.Model):
     due_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='task_created_idx'),  # admin date_hierarchy
+        ]
+
     def __str__(self):
         return self.title
 
@@ -68,28 +117,95 @@ class Document(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='documents')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_documents')
     title = models.CharField(max_length=255)
-    file = models.FileField(upload_to=document_upload_path)
+    # content-addressed, see core.storage; upload_to only supplies the extension
+    file = models.FileField(upload_to=document_upload_path, storage=document_storage, max_length=255)
+    original_name = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     approved = models.BooleanField(default=False)
     file_size = models.PositiveIntegerField(default=0)  # Added
     file_type = models.CharField(max_length=50, blank=True)  # Added
+    mime_type = models.CharField(max_length=100, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # sha256
+    # denormalized from DocumentComment (see core.signals) so cards don't aggregate
+    comment_count = models.PositiveIntegerField(default=0)
+    last_comment_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['uploaded_at'], name='document_uploaded_idx'),  # admin date_hierarchy
+        ]
 
     def save(self, *args, **kwargs):
-        if self.file:
-            self.file_size = self.file.size
-            self.file_type = self.file.name.split('.')[-1]
-        super().save(*args, **kwargs)
+        # size/type/MIME/hash are read once, from the upload itself; saves that
+        # don't bring a new file (approval, renames) never touch storage
+        if not self.file or self.file._committed:
+            return super().save(*args, **kwargs)
+        upload = self.file.file
+        self.original_name = os.path.basename(self.file.name)[:255]
+        for field, value in describe_upload(upload, self.file.name).items():
+            setattr(self, field, value)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'original_name', 'file_size', 'file_type', 'mime_type', 'content_hash'}
+        replaced = None
+        if self.pk:
+            replaced = Document.objects.filter(pk=self.pk).values_list('content_hash', flat=True).first()
+        with transaction.atomic():
+            # referenced before the storage checks whether the blob exists
+            claim_blob(self.content_hash)
+            super().save(*args, **kwargs)
+            if replaced:
+                release_blobs({replaced: 1})
 
     def __str__(self):
         return self.title
 
 
-# Document comments/discussion
+# Blob (documents referencing one content-addressed file, see core.storage)
+class Blob(models.Model):
+    content_hash = models.CharField(max_length=64, primary_key=True)  # sha256
+    refs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.content_hash} ({self.refs})"
+
+
+# Document comments/discussion (threaded)
 class DocumentComment(models.Model):
+    MAX_DEPTH = 20
+    PATH_STEP = 11  # 10 digit zero-padded id + '/'
+
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # materialized path of ids from the thread root, e.g. "0000000012/0000000034/";
+    # ordering by path walks a thread depth-first
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)  # direct replies
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['document', 'parent', 'created_at'], name='comment_threads_idx'),
+            models.Index(fields=['document', 'path'], name='comment_path_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = f"{prefix}{self.pk:010d}/"
+            self.depth = self.parent.depth + 1 if self.parent_id else 0
+            DocumentComment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+
+    def subtree(self):
+        """This comment and all replies below it, in thread order, in one query."""
+        return DocumentComment.objects.filter(
+            document_id=self.document_id, path__gte=self.path, path__lt=self.path + '~'
+        ).order_by('path')
 
     def __str__(self):
         return f"Comment by {self.user.username} on {self.document.title}"
@@ -102,17 +218,48 @@ class StudySession(models.Model):
     description = models.TextField(blank=True)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    # RRULE-style rule (see core.recurrence); start/end_time are the first occurrence
+    recurrence = models.CharField(max_length=255, blank=True, default='')
+    recurrence_until = models.DateTimeField(null=True, blank=True, editable=False)  # end of last occurrence, null = open-ended
+    # set on occurrences materialized out of a recurring session
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='overrides')
+    original_start = models.DateTimeField(null=True, blank=True)
     # created_by = models.ForeignKey(
     #     User, on_delete=models.CASCADE, related_name='created_sessions')
     # created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # agenda/status queries: group IN (...) AND end_time > from AND start_time < to
+            models.Index(fields=['group', 'end_time', 'start_time'], name='session_group_window_idx'),
+            models.Index(fields=['group', 'recurrence_until'], name='session_group_series_idx'),
+            # reminder scheduler: start_time range across all groups
+            models.Index(fields=['start_time'], name='session_start_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['parent', 'original_start'], name='unique_session_occurrence'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.group.name})"
-    
+
+    def save(self, *args, **kwargs):
+        if self.recurrence:
+            rule = parse_rule(self.recurrence)
+            self.recurrence_until = series_end(rule, self.start_time, self.end_time - self.start_time)
+        else:
+            self.recurrence_until = None
+        super().save(*args, **kwargs)
+
     @property
     def status(self):
         """Returns 'active' if session is ongoing, 'completed' if past."""
         now = timezone.now()
+        if self.recurrence:
+            # a series stays active until its last occurrence is over
+            if self.recurrence_until is not None and self.recurrence_until < now:
+                return "completed"
+            return "active"
         if self.end_time < now:
             return "completed"
         return "active"
@@ -130,6 +277,11 @@ class TimerSession(models.Model):
     is_paused = models.BooleanField(default=False)
     paused_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at'], name='timer_started_idx'),  # admin date_hierarchy
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.mode} - {self.duration}m"
 
@@ -142,5 +294,191 @@ class Notification(models.Model):
     read_status = models.BooleanField(default=False)
     type = models.CharField(max_length=50, default='info')  # Added (optional categorization)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_created_idx'),  # admin date_hierarchy
+            models.Index(fields=['read_status', 'created_at'], name='notification_read_idx'),  # purge
+        ]
+
     def __str__(self):
         return f"Notif for {self.user.username} at {self.created_at}"
+
+
+# SchedulerState (persisted progress of background schedulers)
+class SchedulerState(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    # everything due at or before the watermark has been handled
+    watermark = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.watermark}"
+
+
+# Job (durable background work, see core.jobs)
+class Job(models.Model):
+    STATUS_CHOICES = (('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'))
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # at most one queued job per key; a running one doesn't block a fresh enqueue
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_claim_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='queued'),
+                                    name='unique_queued_job_dedupe_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+# ChangeLog (append-only feed behind /api/sync/, see core.sync)
+class ChangeLog(models.Model):
+    id = models.BigAutoField(primary_key=True)  # doubles as the sync position
+    group_id = models.PositiveIntegerField()
+    model = models.CharField(max_length=20)     # 'group', 'session', 'task', 'document' or 'membership'
+    object_id = models.PositiveIntegerField()   # user id for 'membership'
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'id'], name='changelog_group_idx'),
+            models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'),
+            models.Index(fields=['created_at'], name='changelog_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.model} {self.object_id}{' (deleted)' if self.deleted else ''}"
+
+
+# ActivityEvent (group audit trail, written in batches by core.activity)
+class ActivityEvent(models.Model):
+    VERB_CHOICES = (
+        ('member.joined', 'Member joined'),
+        ('member.left', 'Member left'),
+        ('members.imported', 'Members imported'),
+        ('document.approved', 'Document approved'),
+        ('task.completed', 'Task completed'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # (group_id, month) is the partition key; every index and feed query leads with it
+    group_id = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()  # YYYYMM of created_at
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    verb = models.CharField(max_length=50, choices=VERB_CHOICES)
+    target_id = models.PositiveIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'month', 'id'], name='activity_partition_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.verb} in group {self.group_id} at {self.created_at}"
+
+
+# GroupDeletion (progress of an asynchronous group purge, outlives the group row)
+class GroupDeletion(models.Model):
+    STATUS_CHOICES = (('pending', 'Pending'), ('purging', 'Purging'), ('done', 'Done'))
+
+    group_id = models.PositiveIntegerField(unique=True)
+    group_name = models.CharField(max_length=200)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    deleted_rows = models.PositiveIntegerField(default=0)
+    deleted_files = models.PositiveIntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Deletion of group {self.group_id} ({self.status})"
+
+
+# DocumentText (plain text pulled out of a document's file by core.extraction)
+class DocumentText(models.Model):
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='extracted_text')
+    content_hash = models.CharField(max_length=64, db_index=True)  # Document.content_hash it was extracted from
+    text = models.TextField(blank=True)  # cut at settings.DOCUMENT_TEXT_LIMIT characters
+    truncated = models.BooleanField(default=False)
+    page_offsets = models.JSONField(default=list, blank=True)  # character offset where each page starts
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def page_of(self, offset):
+        """1-based page holding the character at offset."""
+        return max(1, bisect_right(self.page_offsets, offset))
+
+    def __str__(self):
+        return f"Text of document {self.document_id}"
+
+
+# DocumentTerm (inverted index over DocumentText and titles, see core.search)
+class DocumentTerm(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    term = models.CharField(max_length=40)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='terms')
+    count = models.PositiveIntegerField(default=1)  # occurrences, title words weigh more
+
+    class Meta:
+        constraints = [
+            # also the lookup index: exact terms and prefix ranges both lead with term
+            models.UniqueConstraint(fields=['term', 'document'], name='unique_document_term'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in document {self.document_id}"
+
+
+# GroupInvite (an imported email with no account yet, see core.membership_import)
+class GroupInvite(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='invites')
+    email = models.EmailField()  # stored lowercased
+    invited_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)  # set once the email has gone out
+    # sha256 of the token mailed with the invite; the token itself is never stored
+    token_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['email', 'group'], name='unique_group_invite'),
+        ]
+
+    def __str__(self):
+        return f"Invite for {self.email} to group {self.group_id}"
+
+
+# DataExport (a user's own data as a ZIP built by core.export, with its progress)
+class DataExport(models.Model):
+    STATUS_CHOICES = (('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'))
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_exports')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_items = models.PositiveIntegerField(default=0)
+    done_items = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)  # under settings.EXPORT_ROOT
+    file_size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export {self.pk} of {self.user_id} ({self.status})"
@@ -29,7 +29,7 @@ class IsGroupAdmin(permissions.BasePermission):
             return False
 
         # Check if user is admin of that group or is a superuser
-        return GroupMembership.objects.filter(
+        return GroupMembership.active.filter(
             group_id=group_pk, user=request.user, role='admin'
         ).exists() or request.user.is_superuser
 
@@ -0,0 +1,396 @@
+"""
+Group presence over WebSockets (plain ASGI, no extra dependencies).
+
+    ws://<host>/ws/presence/?token=<JWT access token>
+
+On connect the socket joins one channel-layer group per study group the user
+belongs to and receives a roster of who is online in each. Clients send
+{"type": "heartbeat"} every ~20s; members that miss heartbeats for
+PRESENCE_HEARTBEAT_TIMEOUT seconds drop out of the roster. Timer start,
+pause, resume, stop and restart are broadcast as small diffs to every group
+of the timer's owner. Membership changes reach open sockets too: a user who
+joins a group is subscribed to it and gets its roster, one who leaves (or
+whose group is deleted) is unsubscribed and gets {"type": "removed"}.
+
+The channel layer is pluggable (PRESENCE_CHANNEL_LAYER). InMemoryChannelLayer
+only reaches sockets in the same process, which is what tests and a single
+ASGI process need; a multi-process deployment needs a shared-broker layer with
+the same four coroutine methods.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_TIMEOUT = getattr(settings, 'PRESENCE_HEARTBEAT_TIMEOUT', 45)
+CHANNEL_CAPACITY = getattr(settings, 'PRESENCE_CHANNEL_CAPACITY', 100)
+
+
+def group_name(group_id):
+    return f"presence.group.{group_id}"
+
+
+def user_group_name(user_id):
+    return f"presence.user.{user_id}"
+
+
+class InMemoryChannelLayer:
+    """Channels-style layer kept in process memory: one bounded queue per socket."""
+
+    def __init__(self, capacity=CHANNEL_CAPACITY):
+        self.capacity = capacity
+        self.queues = {}
+        self.groups = {}
+        self._counter = itertools.count()
+
+    async def new_channel(self):
+        name = f"presence.channel.{next(self._counter)}"
+        self.queues[name] = asyncio.Queue(maxsize=self.capacity)
+        return name
+
+    async def receive(self, channel):
+        return await self.queues[channel].get()
+
+    async def send(self, channel, message):
+        queue = self.queues.get(channel)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a slow client must not hold everyone up; it gets dropped instead
+            logger.warning("Presence channel %s is full, disconnecting it", channel)
+            queue.get_nowait()
+            queue.put_nowait({'type': 'close'})
+
+    async def group_add(self, group, channel):
+        self.groups.setdefault(group, set()).add(channel)
+
+    async def group_discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del self.groups[group]
+
+    async def group_send(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            await self.send(channel, message)
+
+    async def close_channel(self, channel):
+        self.queues.pop(channel, None)
+
+
+class Roster:
+    """
+    Who is online where. Liveness is tracked per socket (channel -> last
+    heartbeat), separately from group_id -> user_id -> {channels}, so a socket
+    of a user with no groups still expires. A user is online in a group while
+    any of their sockets is subscribed to it.
+    """
+
+    def __init__(self, timeout=HEARTBEAT_TIMEOUT, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.sockets = {}
+        self.groups = {}
+        self.usernames = {}
+
+    def connect(self, channel):
+        self.sockets[channel] = self.clock()
+
+    def heartbeat(self, channel):
+        if channel in self.sockets:
+            self.sockets[channel] = self.clock()
+
+    def disconnect(self, channel):
+        self.sockets.pop(channel, None)
+
+    def join(self, group_id, user_id, username, channel):
+        """Returns True when the user just came online in the group."""
+        self.usernames[user_id] = username
+        users = self.groups.setdefault(group_id, {})
+        came_online = user_id not in users
+        users.setdefault(user_id, set()).add(channel)
+        return came_online
+
+    def leave(self, group_id, user_id, channel):
+        """Returns True when the user's last socket in the group went away."""
+        users = self.groups.get(group_id)
+        if not users or user_id not in users:
+            return False
+        users[user_id].discard(channel)
+        if users[user_id]:
+            return False
+        del users[user_id]
+        if not users:
+            del self.groups[group_id]
+        return True
+
+    def expired(self):
+        """Channels of the sockets that missed their heartbeats."""
+        cutoff = self.clock() - self.timeout
+        return [channel for channel, seen in self.sockets.items() if seen < cutoff]
+
+    def members(self, group_id):
+        return [{'user_id': user_id, 'username': self.usernames.get(user_id)}
+                for user_id in self.groups.get(group_id, {})]
+
+
+_layer = None
+_roster = Roster()
+
+
+def get_channel_layer():
+    global _layer
+    if _layer is None:
+        path = getattr(settings, 'PRESENCE_CHANNEL_LAYER', 'core.presence.InMemoryChannelLayer')
+        _layer = import_string(path)()
+    return _layer
+
+
+# publishing from (sync) views
+
+def timer_diff(timer, event):
+    fields = {
+        'start': ('mode', 'duration', 'started_at'),
+        'restart': ('started_at',),
+        'pause': ('paused_at',),
+        'resume': (),
+        'stop': ('ended_at',),
+    }[event]
+    diff = {'id': timer.id}
+    for field in fields:
+        value = getattr(timer, field)
+        diff[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return diff
+
+
+async def publish_timer_event_async(user_id, username, group_ids, event, diff, layer=None):
+    layer = layer or get_channel_layer()
+    for group_id in group_ids:
+        await layer.group_send(group_name(group_id), {
+            'type': 'timer', 'group': group_id, 'user_id': user_id,
+            'username': username, 'event': event, 'timer': diff,
+        })
+
+
+def publish_timer_event(user, timer, event):
+    """Broadcast a timer change to every group the owner belongs to."""
+    from .models import GroupMembership
+
+    group_ids = list(GroupMembership.active.filter(
+        user=user).values_list('group_id', flat=True))
+    if not group_ids:
+        return
+    try:
+        async_to_sync(publish_timer_event_async)(
+            user.id, user.username, group_ids, event, timer_diff(timer, event))
+    except Exception:
+        # presence is best effort, never fail the API call because of it
+        logger.exception("Could not publish timer event")
+
+
+async def publish_membership_async(changes, layer=None):
+    """changes: (user_id, group_id, 'joined' | 'left') for the user's own sockets."""
+    layer = layer or get_channel_layer()
+    for user_id, group_id, state in changes:
+        await layer.group_send(user_group_name(user_id), {
+            'type': 'membership', 'group': group_id, 'state': state})
+
+
+async def publish_group_closed_async(group_id, layer=None):
+    # every socket subscribed to the group unsubscribes itself
+    layer = layer or get_channel_layer()
+    await layer.group_send(group_name(group_id), {
+        'type': 'membership', 'group': group_id, 'state': 'left'})
+
+
+def publish_membership(changes):
+    """Subscribe or unsubscribe the open sockets of users who joined or left groups."""
+    if not changes:
+        return
+    try:
+        async_to_sync(publish_membership_async)(list(changes))
+    except Exception:
+        logger.exception("Could not publish membership changes")
+
+
+def publish_group_closed(group_id):
+    try:
+        async_to_sync(publish_group_closed_async)(group_id)
+    except Exception:
+        logger.exception("Could not close presence of group %s", group_id)
+
+
+# ASGI application
+
+def _authenticate(token):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+    from .models import GroupMembership
+
+    try:
+        user_id = AccessToken(token)['user_id']
+    except (TokenError, KeyError):
+        return None, []
+    user = User.objects.filter(pk=user_id, is_active=True).only('id', 'username').first()
+    if user is None:
+        return None, []
+    group_ids = list(GroupMembership.active.filter(
+        user_id=user.id).values_list('group_id', flat=True))
+    return user, group_ids
+
+
+class PresenceConnection:
+    __slots__ = ('scope', 'receive', 'send', 'layer', 'roster', 'channel', 'user', 'group_ids')
+
+    def __init__(self, scope, receive, send, layer, roster):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.layer = layer
+        self.roster = roster
+        self.channel = None
+        self.user = None
+        self.group_ids = []
+
+    async def send_json(self, data):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('token', [''])[0]
+        self.user, self.group_ids = await sync_to_async(_authenticate)(token)
+        if self.user is None:
+            await self.send({'type': 'websocket.close', 'code': 4401})
+            return
+
+        await self.send({'type': 'websocket.accept'})
+        self.channel = await self.layer.new_channel()
+        self.roster.connect(self.channel)
+        try:
+            await self.layer.group_add(user_group_name(self.user.id), self.channel)
+            await self.join()
+            await self.pump()
+        finally:
+            await self.leave()
+
+    async def join(self):
+        for group_id in self.group_ids:
+            await self.join_group(group_id)
+
+    async def join_group(self, group_id):
+        await self.layer.group_add(group_name(group_id), self.channel)
+        if self.roster.join(group_id, self.user.id, self.user.username, self.channel):
+            await self.layer.group_send(group_name(group_id), {
+                'type': 'presence', 'group': group_id, 'user_id': self.user.id,
+                'username': self.user.username, 'state': 'online'})
+        await self.send_json({'type': 'roster', 'group': group_id,
+                              'members': self.roster.members(group_id)})
+
+    async def leave(self):
+        for group_id in self.group_ids:
+            await self.leave_group(group_id)
+        await self.layer.group_discard(user_group_name(self.user.id), self.channel)
+        await self.layer.close_channel(self.channel)
+        self.roster.disconnect(self.channel)
+
+    async def leave_group(self, group_id):
+        await self.layer.group_discard(group_name(group_id), self.channel)
+        if self.roster.leave(group_id, self.user.id, self.channel):
+            await self.layer.group_send(group_name(group_id), {
+                'type': 'presence', 'group': group_id, 'user_id': self.user.id,
+                'username': self.user.username, 'state': 'offline'})
+
+    async def membership_changed(self, message):
+        group_id = message['group']
+        if message['state'] == 'joined' and group_id not in self.group_ids:
+            self.group_ids.append(group_id)
+            await self.join_group(group_id)
+        elif message['state'] == 'left' and group_id in self.group_ids:
+            self.group_ids.remove(group_id)
+            await self.leave_group(group_id)
+            await self.send_json({'type': 'removed', 'group': group_id})
+
+    async def pump(self):
+        """Forward layer messages to the socket until either side closes."""
+        from_client = asyncio.ensure_future(self.receive())
+        from_layer = asyncio.ensure_future(self.layer.receive(self.channel))
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {from_client, from_layer}, return_when=asyncio.FIRST_COMPLETED)
+                if from_client in done:
+                    message = from_client.result()
+                    if message['type'] == 'websocket.disconnect':
+                        return
+                    if message['type'] == 'websocket.receive':
+                        self.handle_client(message)
+                    from_client = asyncio.ensure_future(self.receive())
+                if from_layer in done:
+                    message = from_layer.result()
+                    if message['type'] == 'close':
+                        await self.send({'type': 'websocket.close', 'code': 4408})
+                        return
+                    if message['type'] == 'membership':
+                        await self.membership_changed(message)
+                    else:
+                        await self.send_json(message)
+                    from_layer = asyncio.ensure_future(self.layer.receive(self.channel))
+        finally:
+            from_client.cancel()
+            from_layer.cancel()
+
+    def handle_client(self, message):
+        try:
+            data = json.loads(message.get('text') or '{}')
+        except ValueError:
+            return
+        if data.get('type') == 'heartbeat':
+            self.roster.heartbeat(self.channel)
+
+
+async def expire_stale(layer, roster):
+    """Close sockets that missed their heartbeats; run periodically."""
+    for channel in roster.expired():
+        await layer.send(channel, {'type': 'close'})
+
+
+class PresenceApplication:
+    def __init__(self, layer=None, roster=None, sweep_interval=None):
+        self._layer = layer
+        self.roster = roster or _roster
+        self.sweep_interval = sweep_interval or max(1, HEARTBEAT_TIMEOUT // 3)
+        self._sweeper = None
+
+    @property
+    def layer(self):
+        return self._layer or get_channel_layer()
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await expire_stale(self.layer, self.roster)
+            except Exception:
+                logger.exception("Presence sweep failed")
+
+    async def __call__(self, scope, receive, send):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self.sweep_forever())
+        await PresenceConnection(scope, receive, send, self.layer, self.roster).run()
+
+
+application = PresenceApplication()
@@ -0,0 +1,171 @@
+"""
+On-demand profiling and the slow-query log.
+
+ProfilingMiddleware (core.middleware) profiles a request when it carries
+"X-Profile: <PROFILE_TOKEN>", or at random one in PROFILE_SAMPLE_RATE
+requests. With PROFILE_FORMAT = 'collapsed' a sampler thread records the
+request thread's stack every PROFILE_INTERVAL seconds and writes one
+"frame;frame;frame count" line per distinct stack (flamegraph.pl and
+speedscope read it); with 'pstats' the request runs under cProfile instead.
+Files land in PROFILE_DIR.
+
+The slow-query log is an execute_wrapper added to every new database
+connection: a query slower than SLOW_QUERY_MS is logged to
+'core.slow_queries' with its SQL, duration and the innermost frame of our
+own code (the view, serializer or helper that ran it). Parameters are only
+included with SLOW_QUERY_LOG_PARAMS, since they hold user data.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+slow_query_logger = logging.getLogger('core.slow_queries')
+
+# frames from these modules are never reported as the origin of a query
+INTERNAL_MODULES = ('core.profiling', 'core.metrics', 'core.middleware')
+
+
+def frame_label(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class RequestProfiler:
+    """Profiles one call in the configured format and writes the result."""
+
+    def __init__(self, output_dir, fmt='collapsed', interval=0.005):
+        if fmt not in ('collapsed', 'pstats'):
+            raise ValueError(f"Unknown profile format {fmt!r}")
+        self.output_dir = output_dir
+        self.format = fmt
+        self.interval = interval
+
+    def profile(self, func, arg, label=None):
+        """
+        Run func(arg) under the profiler; returns (result, path of the written
+        profile). label may be a callable, asked after the call, for the file name.
+        """
+        started = time.perf_counter()
+        if self.format == 'pstats':
+            import cProfile  # only loaded in processes that profile this way
+
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(func, arg)
+            finally:
+                elapsed = time.perf_counter() - started
+            path = self.path_for(label, elapsed)
+            profiler.dump_stats(path)
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            try:
+                result = func(arg)
+            finally:
+                sampler.stop()
+                elapsed = time.perf_counter() - started
+            path = self.path_for(label, elapsed)
+            with open(path, 'w') as fh:
+                fh.write(sampler.collapsed())
+        return result, path
+
+    def path_for(self, label, elapsed):
+        label = label() if callable(label) else label
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label or 'request')[:80]
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{timezone.now():%Y%m%dT%H%M%S%f}-{label}-{elapsed * 1000:.0f}ms.{self.format}"
+        return os.path.join(self.output_dir, name)
+
+
+def origin_frame():
+    """Innermost frame of project code on the current stack, as 'module:function:line'."""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base) and 'site-packages' not in filename
+                and not module.startswith(INTERNAL_MODULES)):
+            return f"{module}:{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLogger:
+    """connection.execute_wrapper that logs queries slower than a threshold."""
+
+    def __init__(self, threshold_ms, log_params=False):
+        self.threshold = threshold_ms / 1000
+        self.log_params = log_params
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                origin = origin_frame()
+                slow_query_logger.warning(
+                    "Slow query (%.1f ms) from %s: %s params=%s",
+                    elapsed * 1000, origin or '?', sql, params if self.log_params else '<hidden>',
+                    extra={'duration_ms': elapsed * 1000, 'sql': sql, 'origin': origin,
+                           'db_alias': context['connection'].alias})
+
+
+def install_slow_query_log(sender=None, connection=None, **kwargs):
+    """connection_created receiver; also safe to call for an open connection."""
+    threshold = getattr(settings, 'SLOW_QUERY_MS', None)
+    if threshold is None or connection is None:
+        return
+    if any(isinstance(wrapper, SlowQueryLogger) for wrapper in connection.execute_wrappers):
+        return
+    # first in the list: execute_wrapper() context managers (MetricsMiddleware)
+    # pop the last entry when they exit, and the connection may open inside one
+    logger = SlowQueryLogger(threshold, getattr(settings, 'SLOW_QUERY_LOG_PARAMS', False))
+    connection.execute_wrappers.insert(0, logger)
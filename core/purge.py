@@ -0,0 +1,154 @@
+"""
+Asynchronous group deletion.
+
+Deleting a group through the ORM makes the collector load every membership,
+session, task, document and comment into memory and send a signal per row.
+Instead the API marks the group deleted (Group.objects and
+GroupMembership.active hide it and everything reachable through its
+memberships at once), closes its presence subscriptions and queues a 'groups.purge' job. The job deletes the
+children leaf-first in small batches, each in its own short transaction,
+removes document files once their rows are gone, and records progress on
+GroupDeletion. Every step only deletes what is left, so a retried or resumed
+job simply carries on.
+"""
+import logging
+import time
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    ActivityEvent, Blob, Document, DocumentComment, DocumentTerm, DocumentText, Group, GroupDeletion,
+    GroupInvite, GroupMembership, StudySession, Task,
+)
+from .jobs import enqueue
+from .presence import publish_group_closed
+from .signals import recount_completed_tasks
+from .storage import release_blobs
+from .sync import record, record_many
+
+logger = logging.getLogger(__name__)
+
+
+def request_deletion(group, user):
+    """Hide the group now and queue the purge; returns the GroupDeletion."""
+    with transaction.atomic():
+        Group.all_objects.filter(pk=group.pk).update(deleted_at=timezone.now())
+        deletion, _ = GroupDeletion.objects.get_or_create(
+            group_id=group.pk, defaults={'group_name': group.name, 'requested_by': user})
+        # update() skips signals: tell sync clients now rather than after the purge
+        record('group', group.pk, group.pk, deleted=True)
+        transaction.on_commit(partial(publish_group_closed, group.pk))
+        enqueue('groups.purge', {'group_id': group.pk}, dedupe_key=f"group-purge:{group.pk}")
+    return deletion
+
+
+class GroupPurger:
+    def __init__(self, group_id, batch_size=500, storage=None, clock=time.monotonic):
+        self.group_id = group_id
+        self.batch_size = batch_size
+        self.storage = storage or Document._meta.get_field('file').storage
+        self.clock = clock
+
+    def steps(self):
+        """(queryset, ordering) pairs, leaf tables first."""
+        group_id = self.group_id
+        return [
+            # deepest replies first so no comment outlives its parent
+            (DocumentComment.objects.filter(document__group_id=group_id), ('-depth', 'id')),
+            (DocumentTerm.objects.filter(document__group_id=group_id), ('id',)),
+            (DocumentText.objects.filter(document__group_id=group_id), ('pk',)),
+            (Document.objects.filter(group_id=group_id), ('id',)),
+            (Task.objects.filter(session__group_id=group_id), ('id',)),
+            # materialized occurrences before the series they belong to
+            (StudySession.objects.filter(group_id=group_id, parent__isnull=False), ('id',)),
+            (StudySession.objects.filter(group_id=group_id, parent__isnull=True), ('id',)),
+            (GroupInvite.objects.filter(group_id=group_id), ('id',)),
+            (GroupMembership.objects.filter(group_id=group_id), ('id',)),
+            (ActivityEvent.objects.filter(group_id=group_id), ('id',)),
+        ]
+
+    def count(self):
+        return sum(queryset.count() for queryset, _ in self.steps())
+
+    def delete_batch(self, queryset, ordering):
+        model = queryset.model
+        fields = ['pk']
+        if model is Document:
+            fields += ['file', 'content_hash']
+        elif model is GroupMembership:
+            fields.append('user_id')
+        elif model is Task:
+            fields += ['created_by_id', 'status']
+        rows = list(queryset.order_by(*ordering).values_list(*fields)[:self.batch_size])
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        with transaction.atomic():
+            # no collector and no per-row signals: children are already gone
+            model._base_manager.filter(pk__in=ids)._raw_delete(model._base_manager.db)
+            if model is GroupMembership:
+                # each former member's sync feed drops the group
+                record_many('membership', [(user_id, self.group_id) for _, user_id in rows], deleted=True)
+            elif model is Document:
+                # no post_delete signal either: the documents let go of their blobs here
+                release_blobs(Counter(digest for _, _, digest in rows if digest))
+            elif model is Task:
+                # no post_delete signal: the owners of completed tasks are recounted here
+                for user_id in {user_id for _, user_id, status in rows if status == 'complete' and user_id}:
+                    recount_completed_tasks(user_id)
+            GroupDeletion.objects.filter(group_id=self.group_id).update(
+                deleted_rows=F('deleted_rows') + len(ids))
+        if model is Document:
+            self.delete_files({(name, digest) for _, name, digest in rows if name})
+        return len(ids)
+
+    def delete_file(self, name, digest, named):
+        """
+        Delete the blob if nothing references it, holding its Blob row so an
+        upload of the same bytes waits (see core.storage); True if deleted.
+        """
+        with transaction.atomic():
+            if digest:
+                # made at zero if missing, so a concurrent claim still waits for us
+                blob, _ = Blob.objects.select_for_update().get_or_create(pk=digest)
+                if blob.refs:
+                    return False
+            if name in named:
+                return False  # a document not counted yet (its metadata job is pending)
+            self.storage.delete(name)
+            if digest:
+                blob.delete()
+        return True
+
+    def delete_files(self, files):
+        # blobs are content-addressed and may be shared with documents elsewhere;
+        # one lookup per batch for the ones still referenced by name
+        named = set(Document.objects.filter(file__in={name for name, _ in files})
+                    .values_list('file', flat=True))
+        deleted = 0
+        for name, digest in files:
+            try:
+                deleted += self.delete_file(name, digest, named)
+            except Exception:
+                # a missing or locked file must not stall the purge
+                logger.exception("Could not delete %s while purging group %s", name, self.group_id)
+        GroupDeletion.objects.filter(group_id=self.group_id).update(
+            deleted_files=F('deleted_files') + deleted)
+
+    def run(self, time_budget=None):
+        """Purge until done or out of time; returns True once the group row is gone."""
+        started = self.clock()
+        GroupDeletion.objects.filter(group_id=self.group_id, status='pending').update(
+            status='purging', total_rows=self.count())
+        for queryset, ordering in self.steps():
+            while self.delete_batch(queryset, ordering):
+                if time_budget is not None and self.clock() - started >= time_budget:
+                    return False
+        Group.all_objects.filter(pk=self.group_id).delete()
+        GroupDeletion.objects.filter(group_id=self.group_id).update(
+            status='done', finished_at=timezone.now())
+        return True
@@ -0,0 +1,267 @@
+"""
+RRULE-style recurrence for study sessions.
+
+Supports the subset of RFC 5545 the app needs:
+    FREQ=DAILY|WEEKLY|MONTHLY;INTERVAL=n;COUNT=n;UNTIL=YYYYMMDD[THHMMSSZ];BYDAY=MO,WE
+Occurrences are expanded lazily and only for the requested window, in local
+wall-clock time so a 7pm session stays at 7pm.
+"""
+import hashlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .metrics import cache_get
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+MAX_COUNT = 1000
+EXPANSION_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class Rule:
+    def __init__(self, freq, interval=1, count=None, until=None, byday=None):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until          # aware datetime or None
+        self.byday = byday or ()    # weekday numbers, Monday == 0
+
+
+def _parse_until(value):
+    try:
+        if 'T' in value:
+            return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=dt_timezone.utc)
+        day = datetime.strptime(value, '%Y%m%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid UNTIL: {value}")
+    # a bare date includes the whole local day
+    return timezone.make_aware(datetime.combine(day, time.max))
+
+
+def parse_rule(text):
+    """Parse an RRULE string, raising ValueError with a readable message."""
+    parts = {}
+    for item in text.strip().removeprefix('RRULE:').split(';'):
+        if not item:
+            continue
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid rule part: {item}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}.")
+    try:
+        interval = int(parts.pop('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be integers.")
+    parts.pop('COUNT', None)
+    if interval < 1 or (count is not None and not 1 <= count <= MAX_COUNT):
+        raise ValueError(f"INTERVAL must be positive and COUNT between 1 and {MAX_COUNT}.")
+
+    until = _parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+    if until and count:
+        raise ValueError("COUNT and UNTIL can't be combined.")
+
+    byday = ()
+    if 'BYDAY' in parts:
+        if freq != 'WEEKLY':
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY.")
+        try:
+            byday = tuple(sorted({WEEKDAYS.index(day) for day in parts.pop('BYDAY').split(',')}))
+        except ValueError:
+            raise ValueError("BYDAY must list days like MO,WE,FR.")
+    if parts:
+        raise ValueError(f"Unsupported rule parts: {', '.join(sorted(parts))}")
+    return Rule(freq, interval, count, until, byday)
+
+
+def format_rule(rule):
+    """Canonical RRULE text; UNTIL is always written as a UTC datetime."""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={rule.until.astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[wd] for wd in rule.byday))
+    return ";".join(parts)
+
+
+def _local(value):
+    return timezone.localtime(value).replace(tzinfo=None)
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    try:
+        return value.replace(year=year, month=month)
+    except ValueError:
+        return None  # e.g. the 31st in a 30-day month, skipped like RFC 5545
+
+
+def _iter_local_starts(rule, start, lo):
+    """
+    Yield (index, naive local start) in order, beginning at the first
+    occurrence >= lo. DAILY and WEEKLY jump straight to lo instead of walking
+    from the first occurrence.
+    """
+    if rule.freq == 'DAILY':
+        step = timedelta(days=rule.interval)
+        k = max(0, -((start - lo) // step))
+        while True:
+            yield k, start + k * step
+            k += 1
+
+    elif rule.freq == 'WEEKLY':
+        days = rule.byday or (start.weekday(),)
+        week0 = start - timedelta(days=start.weekday())
+        step = timedelta(weeks=rule.interval)
+        skipped = sum(1 for wd in days if wd < start.weekday())
+        period = max(0, (lo - week0) // step)
+        while True:
+            for j, wd in enumerate(days):
+                if period == 0 and wd < start.weekday():
+                    continue
+                yield period * len(days) + j - skipped, week0 + period * step + timedelta(days=wd)
+            period += 1
+
+    else:  # MONTHLY
+        k, n = 0, 0
+        while True:
+            value = _add_months(start, k * rule.interval)
+            if value is not None:
+                yield n, value
+                n += 1
+            k += 1
+
+
+def expand(rule, dtstart, duration, window_start, window_end):
+    """Starts of the occurrences overlapping [window_start, window_end)."""
+    start = _local(dtstart)
+    lo = _local(window_start) - duration
+    hi = _local(window_end)
+    until = _local(rule.until) if rule.until else None
+
+    starts = []
+    for index, value in _iter_local_starts(rule, start, max(start, lo)):
+        if value >= hi or (rule.count is not None and index >= rule.count):
+            break
+        if until is not None and value > until:
+            break
+        if value > lo:
+            starts.append(timezone.make_aware(value))
+    return starts
+
+
+def series_end(rule, dtstart, duration):
+    """End of the last occurrence, or None if the series never ends."""
+    if rule.until:
+        return rule.until + duration
+    if rule.count:
+        last = None
+        for index, value in _iter_local_starts(rule, _local(dtstart), _local(dtstart)):
+            if index >= rule.count:
+                break
+            last = value
+        return timezone.make_aware(last) + duration
+    return None
+
+
+def snap_to_days(start, end):
+    """Widen a window to whole local days so cache keys repeat between requests."""
+    start = timezone.localtime(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    local_end = timezone.localtime(end)
+    snapped = local_end.replace(hour=0, minute=0, second=0, microsecond=0)
+    if snapped != local_end:
+        snapped += timedelta(days=1)
+    return start, snapped
+
+
+def occurrences(pk, recurrence, start_time, end_time, window_start, window_end):
+    """
+    Cached expansion for one recurring session; the key changes with the rule.
+    Whole days are expanded and cached, then cut down to the window.
+    """
+    duration = end_time - start_time
+    fingerprint = hashlib.md5(
+        f"{recurrence}|{start_time.isoformat()}|{duration}".encode()).hexdigest()
+    day_start, day_end = snap_to_days(window_start, window_end)
+    key = f"occurrences:{pk}:{fingerprint}:{day_start.timestamp()}:{day_end.timestamp()}"
+    starts = cache_get(cache, key)
+    if starts is None:
+        starts = expand(parse_rule(recurrence), start_time, duration, day_start, day_end)
+        cache.set(key, starts, EXPANSION_CACHE_TIMEOUT)
+    return [start for start in starts if start < window_end and start + duration > window_start]
+
+
+def materialize(session, occurrence_start):
+    """
+    Concrete StudySession row for one occurrence of a recurring session,
+    created on first use (e.g. when a task is attached to it). The first
+    occurrence is the series row, so its tasks stay on the series.
+    """
+    from .models import StudySession
+
+    if occurrence_start == session.start_time:
+        return session  # the first occurrence is the series row itself
+    duration = session.end_time - session.start_time
+    if occurrence_start not in expand(parse_rule(session.recurrence), session.start_time, duration,
+                                      occurrence_start, occurrence_start + timedelta(microseconds=1)):
+        raise ValueError("Not an occurrence of this session.")
+    override, created = StudySession.objects.get_or_create(
+        parent=session, original_start=occurrence_start,
+        defaults={
+            'group_id': session.group_id,
+            'title': session.title,
+            'description': session.description,
+            'start_time': occurrence_start,
+            'end_time': occurrence_start + duration,
+        })
+    return override
+
+
+def reanchor_overrides(session, previous_start):
+    """
+    Follow a change of a series' rule or start: each override moves by the
+    same wall-clock shift as the series start and is kept if it lands on an
+    occurrence of the new rule; the ones left orphaned are deleted (with
+    their tasks, like any deleted occurrence). Returns (moved, deleted).
+    """
+    from .models import StudySession
+
+    overrides = list(session.overrides.order_by('original_start'))
+    if not overrides:
+        return 0, 0
+    if not session.recurrence:
+        StudySession.objects.filter(pk__in=[o.pk for o in overrides]).delete()
+        return 0, len(overrides)
+
+    shift = _local(session.start_time) - _local(previous_start)
+
+    def moved(value):
+        return timezone.make_aware(_local(value) + shift)
+
+    targets = [moved(o.original_start) for o in overrides]
+    valid = set(expand(parse_rule(session.recurrence), session.start_time,
+                       session.end_time - session.start_time,
+                       min(targets), max(targets) + timedelta(microseconds=1)))
+    keep = [(o, t) for o, t in zip(overrides, targets) if t in valid]
+    orphans = [o.pk for o, t in zip(overrides, targets) if t not in valid]
+    if orphans:
+        StudySession.objects.filter(pk__in=orphans).delete()
+    if shift:
+        # walk away from the direction of the shift so (parent, original_start) stays unique
+        for override, target in (reversed(keep) if shift > timedelta(0) else keep):
+            override.original_start = target
+            override.start_time = moved(override.start_time)
+            override.end_time = moved(override.end_time)
+            override.save(update_fields=['original_start', 'start_time', 'end_time'])
+    return len(keep) if shift else 0, len(orphans)
@@ -0,0 +1,51 @@
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib renderer
+    orjson = None
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer backed by orjson.
+    Produces the same bytes as JSONRenderer for compact, unicode output and
+    falls back to it for anything orjson can't reproduce (indent, ascii).
+    """
+    _default = encoders.JSONEncoder().default
+    # let DRF's encoder format datetimes/dataclasses so output stays identical
+    _options = 0 if orjson is None else (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._default, option=self._options)
+        # keep output a strict javascript subset, same as JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def stream_json_array(chunks, renderer=None):
+    """
+    Render an iterable of lists as one JSON array, chunk by chunk, so memory
+    stays bounded by the chunk size. Bytes match rendering the whole list.
+    """
+    renderer = renderer or ORJSONRenderer()
+    yield b'['
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        body = renderer.render(chunk)[1:-1]
+        if not first:
+            body = b',' + body
+        first = False
+        yield body
+    yield b']'
@@ -0,0 +1,201 @@
+"""
+Session reminder scheduler.
+
+Keeps a heap of upcoming reminder fire times (session start minus each
+offset), filled a lookahead window at a time with indexed start_time range
+queries, and emits reminder Notifications to every member of the session's
+group in batches. Progress is stored as a watermark in SchedulerState, in
+the same transaction as the notifications, so restarts never send twice.
+Heap entries can be minutes old, so due ones are checked against the
+sessions in one query before sending: deleted or overridden occurrences are
+dropped, renames are picked up and moved sessions are rescheduled.
+"""
+import heapq
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GroupMembership, Notification, SchedulerState, StudySession
+from .agenda import series_overlapping
+from .recurrence import expand, parse_rule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OFFSETS = (24 * 60, 15)  # minutes before start
+
+
+def reminder_offsets():
+    minutes = getattr(settings, 'SESSION_REMINDER_OFFSETS', DEFAULT_OFFSETS)
+    return sorted({timedelta(minutes=m) for m in minutes}, reverse=True)
+
+
+def describe_offset(offset):
+    minutes = int(offset.total_seconds() // 60)
+    if minutes % (24 * 60) == 0:
+        days = minutes // (24 * 60)
+        return f"{days} day{'s' if days != 1 else ''}"
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+class ReminderScheduler:
+    name = 'session-reminders'
+
+    # sessions scheduled less than lookahead before a reminder is due can miss
+    # it, so keep this short; each refill is a cheap indexed range query
+    def __init__(self, offsets=None, lookahead=timedelta(minutes=5), batch_size=500, clock=timezone.now):
+        self.offsets = offsets or reminder_offsets()
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self.clock = clock
+        self.heap = []
+        self.loaded_until = None
+
+    # watermark
+
+    def load_watermark(self):
+        state, created = SchedulerState.objects.get_or_create(
+            name=self.name, defaults={'watermark': self.clock()})
+        return state.watermark
+
+    def save_watermark(self, value):
+        SchedulerState.objects.filter(name=self.name, watermark__lt=value).update(watermark=value)
+
+    # loading
+
+    def session_starts(self, start, end):
+        """(session_id, group_id, title, start) for every start in (start, end]."""
+        rows = StudySession.objects.filter(
+            recurrence='', start_time__gt=start, start_time__lte=end
+        ).values_list('id', 'group_id', 'title', 'start_time')
+        starts = list(rows.iterator(chunk_size=self.batch_size))
+
+        generated = []
+        series = series_overlapping(StudySession.objects.all(), start, end).values_list(
+            'id', 'group_id', 'title', 'recurrence', 'start_time', 'end_time')
+        for pk, group_id, title, recurrence, first_start, first_end in series.iterator(
+                chunk_size=self.batch_size):
+            # expanded directly: every window here is new, caching would only churn
+            for occurrence in expand(parse_rule(recurrence), first_start, first_end - first_start,
+                                     start, end + timedelta(microseconds=1)):
+                if start < occurrence <= end:
+                    generated.append((pk, group_id, title, occurrence))
+        if generated:
+            # a materialized override is a plain session and was picked up above
+            overridden = set(StudySession.objects.filter(
+                parent_id__in={row[0] for row in generated},
+                original_start__gt=start, original_start__lte=end,
+            ).values_list('parent_id', 'original_start'))
+            starts.extend(row for row in generated if (row[0], row[3]) not in overridden)
+        return starts
+
+    def refill(self, now):
+        """Push every fire time in (loaded_until, now + lookahead] onto the heap."""
+        horizon = now + self.lookahead
+        if self.loaded_until is None:
+            self.loaded_until = self.load_watermark()
+        if horizon <= self.loaded_until:
+            return
+        for offset in self.offsets:
+            for pk, group_id, title, start in self.session_starts(
+                    self.loaded_until + offset, horizon + offset):
+                heapq.heappush(self.heap, (start - offset, pk, start, offset, group_id, title))
+        self.loaded_until = horizon
+
+    # sending
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap))
+        return due
+
+    def revalidate(self, due, now):
+        """
+        (due, later): the entries as the sessions are now, and moved sessions'
+        entries that are no longer due. Entries whose new fire time is past
+        loaded_until are dropped; the next refill loads them again.
+        """
+        ids = {entry[1] for entry in due}
+        sessions = {row[0]: row for row in StudySession.objects.filter(pk__in=ids).values_list(
+            'id', 'group_id', 'title', 'recurrence', 'start_time', 'end_time')}
+        overridden = set(StudySession.objects.filter(
+            parent_id__in=ids, original_start__in={entry[2] for entry in due},
+        ).values_list('parent_id', 'original_start'))
+
+        current, later = [], []
+        for fire_time, pk, start, offset, group_id, title in due:
+            if pk not in sessions:
+                continue  # deleted
+            _, group_id, title, recurrence, first_start, first_end = sessions[pk]
+            if recurrence:
+                if (pk, start) in overridden or start not in expand(
+                        parse_rule(recurrence), first_start, first_end - first_start,
+                        start, start + timedelta(microseconds=1)):
+                    continue  # the override was loaded as a plain session, or the rule changed
+            elif first_start != start:
+                start, fire_time = first_start, first_start - offset
+                if fire_time > self.loaded_until:
+                    continue
+                if fire_time > now:
+                    later.append((fire_time, pk, start, offset, group_id, title))
+                    continue
+            current.append((fire_time, pk, start, offset, group_id, title))
+        return current, later
+
+    def build_notifications(self, due, now):
+        members = {}
+        for group_id, user_id in GroupMembership.active.filter(
+                group_id__in={entry[4] for entry in due}).values_list('group_id', 'user_id'):
+            members.setdefault(group_id, []).append(user_id)
+
+        notifications = []
+        for fire_time, pk, start, offset, group_id, title in due:
+            if start <= now:
+                continue  # missed while down and already started, nothing to remind
+            message = f"'{title}' starts in {describe_offset(offset)}."
+            notifications.extend(
+                Notification(user_id=user_id, message=message, type='session_reminder')
+                for user_id in members.get(group_id, ()))
+        return notifications
+
+    def run_due(self, now=None):
+        """Send every reminder due by now; returns the number of notifications."""
+        now = now or self.clock()
+        self.refill(now)
+        due = self.pop_due(now)
+        later = []
+        try:
+            with transaction.atomic():
+                notifications = []
+                if due:
+                    current, later = self.revalidate(due, now)
+                    notifications = self.build_notifications(current, now) if current else []
+                Notification.objects.bulk_create(notifications, batch_size=self.batch_size)
+                self.save_watermark(now)
+        except Exception:
+            # nothing was committed, retry these on the next run
+            for entry in due:
+                heapq.heappush(self.heap, entry)
+            raise
+        for entry in later:
+            heapq.heappush(self.heap, entry)
+        if notifications:
+            logger.info("Sent %d session reminders", len(notifications))
+        return len(notifications)
+
+    def seconds_until_next(self, now, max_sleep):
+        if self.heap:
+            return max(0.0, min(max_sleep, (self.heap[0][0] - now).total_seconds()))
+        return max_sleep
+
+    def run_forever(self, max_sleep=30.0):
+        while True:
+            self.run_due()
+            time.sleep(self.seconds_until_next(self.clock(), max_sleep))
@@ -0,0 +1,92 @@
+"""
+Document search.
+
+Each document's title and extracted text (DocumentText) are indexed as
+DocumentTerm rows: one row per distinct word with its count, title words
+counted TITLE_WEIGHT times. A query matches documents that contain every
+word, the last one as a prefix so results follow the user's typing, and
+ranks them by the summed counts in one GROUP BY over the (term, document)
+index. The table works the same on SQLite and Postgres.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from .models import DocumentTerm
+
+WORD = re.compile(r'\w+')
+MIN_LENGTH = 2
+MAX_LENGTH = 40              # DocumentTerm.term max_length
+MAX_TERMS_PER_DOCUMENT = 5000
+MAX_QUERY_TERMS = 8
+TITLE_WEIGHT = 10
+STOPWORDS = frozenset(
+    'an and are as at be but by for from has have in is it its of on or that the this to was were '
+    'will with'.split())
+
+
+def tokenize(text):
+    return [word for word in WORD.findall(text.lower())
+            if MIN_LENGTH <= len(word) <= MAX_LENGTH and word not in STOPWORDS]
+
+
+def term_counts(title, text):
+    counts = Counter(tokenize(text))
+    for word in tokenize(title):
+        counts[word] += TITLE_WEIGHT
+    return dict(counts.most_common(MAX_TERMS_PER_DOCUMENT))
+
+
+def index_document(document, text):
+    """Replace the document's index rows with the words of its title and text."""
+    with transaction.atomic():
+        DocumentTerm.objects.filter(document=document).delete()
+        DocumentTerm.objects.bulk_create([
+            DocumentTerm(document=document, term=term, count=count)
+            for term, count in term_counts(document.title, text).items()
+        ], batch_size=1000)
+
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def search(documents, query, limit=20):
+    """(document id, score) of the best matches among the documents queryset."""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    *exact, last = terms
+    # a range rather than LIKE, so the prefix stays on the (term, document) index
+    prefix = Q(term__gte=last, term__lt=last + '\uffff')
+    conditions = [Q(term=term) for term in exact] + [prefix]
+    # one flag per query word, so a document must match all of them
+    flags = {
+        f'has_{i}': Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for i, condition in enumerate(conditions)
+    }
+    any_term = Q(term__in=exact) | prefix if exact else prefix
+    rows = (DocumentTerm.objects
+            .filter(any_term, document__in=documents.values('id'))
+            .values('document_id')
+            .annotate(score=Sum('count'), **flags)
+            .filter(**{flag: 1 for flag in flags})
+            .order_by('-score', 'document_id')[:limit])
+    return [(row['document_id'], row['score']) for row in rows]
+
+
+def snippet(text, terms, width=80):
+    """(offset, excerpt) around the first hit of any term in text, or (None, '')."""
+    if not text or not terms:
+        return None, ''
+    *exact, last = terms
+    alternatives = [re.escape(term) + r'\b' for term in exact] + [re.escape(last)]
+    pattern = r'\b(?:' + '|'.join(alternatives) + ')'
+    match = re.search(pattern, text, re.IGNORECASE)
+    if match is None:
+        return None, ''
+    start, end = max(0, match.start() - width), min(len(text), match.end() + width)
+    excerpt = ' '.join(text[start:end].split())
+    return match.start(), ('…' if start else '') + excerpt + ('…' if end < len(text) else '')
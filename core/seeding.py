@@ -0,0 +1,211 @@
+"""
+Synthetic data for load tests (manage.py seed_vsg).
+
+Data is skewed the way real usage is: a few groups have most of the members,
+a few members do most of the work, most notifications are read. Everything is
+inserted with bulk_create in chunks and only ids are kept in memory, so large
+seeds run in bounded memory. The same --seed gives the same data set.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .activity import month_of
+from .models import (
+    ActivityEvent, Document, DocumentComment, Group, GroupMembership, Notification, Profile,
+    StudySession, Task, TimerSession,
+)
+from .recurrence import parse_rule, series_end
+
+SEED_PASSWORD = 'seed-pass'
+RECURRENCES = ('FREQ=WEEKLY;COUNT=12', 'FREQ=DAILY;COUNT=10', 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=8')
+
+
+class Seeder:
+    def __init__(self, users=100, groups=20, sessions_per_group=8, tasks_per_session=4,
+                 documents_per_group=5, comments_per_document=3, notifications_per_user=20,
+                 timers_per_user=10, prefix='seed', seed=0, chunk_size=1000, log=None):
+        self.users = users
+        self.groups = groups
+        self.sessions_per_group = sessions_per_group
+        self.tasks_per_session = tasks_per_session
+        self.documents_per_group = documents_per_group
+        self.comments_per_document = comments_per_document
+        self.notifications_per_user = notifications_per_user
+        self.timers_per_user = timers_per_user
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.counts = {}
+
+    # helpers
+
+    def insert(self, model, objects):
+        """bulk_create an iterable in chunks; returns the new ids."""
+        ids, chunk = [], []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) >= self.chunk_size:
+                ids.extend(o.pk for o in model.objects.bulk_create(chunk))
+                chunk = []
+        if chunk:
+            ids.extend(o.pk for o in model.objects.bulk_create(chunk))
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(ids)
+        self.log(f"{model.__name__}: {len(ids)}")
+        return ids
+
+    def skewed(self, mean, cap):
+        """Pareto-distributed count with roughly the given mean, at least 1."""
+        alpha = 1.5
+        value = mean * (alpha - 1) / alpha * self.rng.paretovariate(alpha)
+        return max(1, min(cap, int(value)))
+
+    def busy_pick(self, population):
+        # lower indexes are picked far more often: a few members do most of the work
+        return population[min(len(population) - 1, int(self.rng.expovariate(3.0 / len(population))))]
+
+    # seeding
+
+    def run(self):
+        with transaction.atomic():
+            user_ids = self.seed_users()
+            members = self.seed_groups(user_ids)
+            sessions = self.seed_sessions(members)
+            self.seed_tasks(sessions, members)
+            documents = self.seed_documents(members)
+            self.seed_comments(documents, members)
+            self.seed_user_rows(user_ids)
+        return self.counts
+
+    def seed_users(self):
+        password = make_password(SEED_PASSWORD)  # hashing once instead of per user
+        ids = self.insert(User, (
+            User(username=f"{self.prefix}_user_{i}", email=f"{self.prefix}_user_{i}@example.com",
+                 password=password)
+            for i in range(self.users)))
+        # bulk_create skips the pre_save signal that fills GroupMembership.sort_name
+        self.sort_names = {pk: f"{self.prefix}_user_{i}".lower() for i, pk in enumerate(ids)}
+        self.insert(Profile, (
+            Profile(user_id=pk, total_study_time=self.rng.randint(0, 6000)) for pk in ids))
+        return ids
+
+    def seed_groups(self, user_ids):
+        creators = [self.busy_pick(user_ids) for _ in range(self.groups)]
+        group_ids = self.insert(Group, (
+            Group(name=f"{self.prefix} group {i}", description=f"Study group {i}", created_by_id=creator)
+            for i, creator in enumerate(creators)))
+
+        members = {}
+        for group_id, creator in zip(group_ids, creators):
+            size = self.skewed(max(2, self.users // 20), len(user_ids))
+            chosen = set(self.rng.sample(user_ids, size)) | {creator}
+            members[group_id] = [creator] + sorted(chosen - {creator})
+        self.insert(GroupMembership, (
+            GroupMembership(group_id=group_id, user_id=user_id, sort_name=self.sort_names[user_id],
+                            role='admin' if i == 0 or self.rng.random() < 0.05 else 'member')
+            for group_id, users in members.items() for i, user_id in enumerate(users)))
+        self.insert(ActivityEvent, (
+            ActivityEvent(group_id=group_id, month=month_of(self.now), actor_id=user_id,
+                          verb='member.joined', created_at=self.now)
+            for group_id, users in members.items() for user_id in users))
+        return members
+
+    def seed_sessions(self, members):
+        sessions = []
+        objects = []
+        for group_id in members:
+            for i in range(self.skewed(self.sessions_per_group, self.sessions_per_group * 10)):
+                start = self.now + timedelta(hours=self.rng.randint(-24 * 60, 24 * 30))
+                duration = timedelta(minutes=self.rng.choice((30, 60, 90, 120)))
+                rule = self.rng.choice(RECURRENCES) if self.rng.random() < 0.1 else ''
+                objects.append(StudySession(
+                    group_id=group_id, title=f"Session {i}", start_time=start, end_time=start + duration,
+                    recurrence=rule,
+                    recurrence_until=series_end(parse_rule(rule), start, duration) if rule else None))
+                sessions.append(group_id)
+        ids = self.insert(StudySession, objects)
+        return list(zip(ids, sessions))
+
+    def seed_tasks(self, sessions, members):
+        today = self.now.date()
+        self.insert(Task, (
+            Task(session_id=session_id, created_by_id=self.busy_pick(members[group_id]),
+                 title=f"Task {i}", status='complete' if self.rng.random() < 0.4 else 'pending',
+                 due_date=today + timedelta(days=self.rng.randint(-30, 30)) if self.rng.random() < 0.7 else None)
+            for session_id, group_id in sessions
+            for i in range(self.rng.randint(0, self.tasks_per_session * 2))))
+
+    def seed_documents(self, members):
+        documents = []
+        objects = []
+        for group_id, users in members.items():
+            for i in range(self.skewed(self.documents_per_group, self.documents_per_group * 10)):
+                ext = self.rng.choice(('pdf', 'docx', 'txt', 'png'))
+                objects.append(Document(
+                    group_id=group_id, uploaded_by_id=self.busy_pick(users), title=f"Document {i}",
+                    file=f"seed/{group_id}/{i}.{ext}", original_name=f"document-{i}.{ext}",
+                    file_type=ext, file_size=self.rng.randint(1_000, 5_000_000),
+                    approved=self.rng.random() < 0.8))
+                documents.append(group_id)
+        ids = self.insert(Document, objects)
+        return list(zip(ids, documents))
+
+    def seed_comments(self, documents, members):
+        roots = self.insert(DocumentComment, (
+            DocumentComment(document_id=document_id, user_id=self.busy_pick(members[group_id]),
+                            comment=f"Comment {i}")
+            for document_id, group_id in documents
+            for i in range(self.rng.randint(0, self.comments_per_document * 2))))
+        for start in range(0, len(roots), self.chunk_size):
+            DocumentComment.objects.bulk_update([
+                DocumentComment(id=pk, path=f"{pk:010d}/", depth=0)
+                for pk in roots[start:start + self.chunk_size]], ['path', 'depth'])
+
+        parents = list(DocumentComment.objects.filter(id__in=roots).values_list(
+            'id', 'document_id', 'document__group_id', 'path').iterator())
+        replies = self.insert(DocumentComment, (
+            DocumentComment(document_id=document_id, parent_id=pk, comment=f"Reply {i}",
+                            user_id=self.busy_pick(members[group_id]))
+            for pk, document_id, group_id, _ in parents
+            for i in range(self.rng.choice((0, 0, 1, 2)))))
+        paths = dict((pk, path) for pk, _, _, path in parents)
+        reply_rows = DocumentComment.objects.filter(id__in=replies).values_list('id', 'parent_id')
+        for start in range(0, len(replies), self.chunk_size):
+            DocumentComment.objects.bulk_update([
+                DocumentComment(id=pk, path=f"{paths[parent_id]}{pk:010d}/", depth=1)
+                for pk, parent_id in reply_rows.filter(id__in=replies[start:start + self.chunk_size])
+            ], ['path', 'depth'])
+
+        # denormalized counters in one statement each
+        comments = DocumentComment.objects.filter(document=OuterRef('pk')).order_by().values('document')
+        Document.objects.filter(id__in=[pk for pk, _ in documents]).update(
+            comment_count=Coalesce(Subquery(comments.annotate(n=Count('id')).values('n')), 0),
+            last_comment_at=Subquery(comments.annotate(last=Max('created_at')).values('last')))
+        children = DocumentComment.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+        DocumentComment.objects.filter(id__in=roots).update(
+            reply_count=Coalesce(Subquery(children.annotate(n=Count('id')).values('n')), 0))
+
+    def seed_user_rows(self, user_ids):
+        self.insert(Notification, (
+            Notification(user_id=user_id, message=f"Notification {i}", read_status=self.rng.random() < 0.7,
+                         type=self.rng.choice(('info', 'session_reminder', 'document_upload')))
+            for user_id in user_ids
+            for i in range(self.skewed(self.notifications_per_user, self.notifications_per_user * 20))))
+
+        def timers():
+            for user_id in user_ids:
+                for _ in range(self.rng.randint(0, self.timers_per_user * 2)):
+                    started = self.now - timedelta(minutes=self.rng.randint(60, 90 * 24 * 60))
+                    duration = self.rng.choice((25, 50, 90))
+                    yield TimerSession(user_id=user_id, mode=self.rng.choice(('timer', 'focused', 'pomodoro')),
+                                       duration=duration, started_at=started,
+                                       ended_at=started + timedelta(minutes=duration))
+        self.insert(TimerSession, timers())
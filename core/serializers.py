@@ -1,8 +1,14 @@
+from itertools import islice
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Count
+from django.utils import timezone
+from .metrics import timed
+from .recurrence import parse_rule, format_rule
 from .models import (
     Profile, Group, GroupMembership, Task, Document, DocumentComment,
-    StudySession, TimerSession, Notification
+    StudySession, TimerSession, Notification, GroupDeletion, DataExport
 )
 
 # User Serializer (register)
@@ -36,10 +42,15 @@ class ProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ('total_study_time', 'completed_tasks_count', 'user_id', 'username')
 
     def get_groups_created_count(self, obj):
+        # dashboard precomputes the counts to avoid extra queries
+        if hasattr(obj, 'groups_created_count'):
+            return obj.groups_created_count
         return obj.user.created_groups.count()
 
     def get_groups_joined_count(self, obj):
-        return obj.user.memberships.count()
+        if hasattr(obj, 'groups_joined_count'):
+            return obj.groups_joined_count
+        return obj.user.memberships.filter(group__deleted_at__isnull=True).count()
 
 
 # Group Serializer
@@ -67,11 +78,13 @@ class GroupMembershipSerializer(serializers.ModelSerializer):
 # Task Serializer
 class TaskSerializer(serializers.ModelSerializer):
     created_by = serializers.SerializerMethodField()
+    # attach to one occurrence of a recurring session (materialized on demand)
+    occurrence_start = serializers.DateTimeField(write_only=True, required=False)
 
     class Meta:
         model = Task
         fields = ('id', 'session', 'created_by', 'title', 'description',
-                  'status', 'due_date', 'created_at')
+                  'status', 'due_date', 'created_at', 'occurrence_start')
         read_only_fields = ('created_by',)
 
     def get_created_by(self, obj):
@@ -85,8 +98,11 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ('id', 'group', 'uploaded_by', 'title', 'file',
-                  'file_type', 'file_size', 'uploaded_at', 'approved')
+        fields = ('id', 'group', 'uploaded_by', 'title', 'file', 'original_name',
+                  'file_type', 'mime_type', 'file_size', 'uploaded_at', 'approved',
+                  'comment_count', 'last_comment_at')
+        read_only_fields = ('original_name', 'file_type', 'mime_type', 'file_size',
+                            'comment_count', 'last_comment_at')
 
     def get_uploaded_by(self, obj):
         return {"id": obj.uploaded_by.id, "username": obj.uploaded_by.username}
@@ -99,15 +115,28 @@ class StudySessionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = StudySession
-        fields = ('id', 'group', 'title', 'description',
-                  'start_time', 'end_time', 'tasks_count', 'status')
+        fields = ('id', 'group', 'title', 'description', 'start_time', 'end_time',
+                  'recurrence', 'recurrence_until', 'parent', 'original_start',
+                  'tasks_count', 'status')
+        read_only_fields = ('recurrence_until', 'parent', 'original_start')
 
     def get_tasks_count(self, obj):
+        # use the annotated count when the queryset provides one
+        if hasattr(obj, 'num_tasks'):
+            return obj.num_tasks
         return obj.tasks.count()
     
     def get_status(self, obj):
         return obj.status  # Uses the @property from the model
     
+    def validate_recurrence(self, value):
+        if not value:
+            return ''
+        try:
+            return format_rule(parse_rule(value))
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
     def validate(self, attrs):
         start = attrs.get('start_time')
         end = attrs.get('end_time')
@@ -136,9 +165,265 @@ class DocumentCommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DocumentComment
-        fields = ('id', 'document', 'user', 'comment', 'created_at')
-        read_only_fields = ('user', 'created_at')
+        fields = ('id', 'document', 'parent', 'user', 'comment', 'created_at', 'depth', 'reply_count')
+        read_only_fields = ('user', 'created_at', 'depth', 'reply_count')
 
     def get_user(self, obj):
         return {"id": obj.user.id, "username": obj.user.username}
 
+    def validate(self, data):
+        if self.instance is not None:
+            # path, depth and the reply counts are derived from these on create
+            for field in ('document', 'parent'):
+                if field in data and data[field] != getattr(self.instance, field):
+                    raise serializers.ValidationError({field: "A comment can't be moved."})
+            return data
+        parent = data.get('parent')
+        if parent is not None:
+            if parent.document_id != data['document'].id:
+                raise serializers.ValidationError({"parent": "Reply must be on the same document."})
+            if parent.depth + 1 > DocumentComment.MAX_DEPTH:
+                raise serializers.ValidationError({"parent": "Thread is too deep."})
+        return data
+
+
+class GroupDeletionSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GroupDeletion
+        fields = ('group_id', 'group_name', 'status', 'total_rows', 'deleted_rows',
+                  'deleted_files', 'progress', 'requested_at', 'finished_at')
+
+    def get_progress(self, obj):
+        if obj.status == 'done':
+            return 1.0
+        if not obj.total_rows:
+            return 0.0
+        return round(min(obj.deleted_rows / obj.total_rows, 1.0), 3)
+
+
+class DataExportSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DataExport
+        fields = ('id', 'status', 'total_items', 'done_items', 'progress', 'file_size',
+                  'error', 'requested_at', 'finished_at')
+
+    def get_progress(self, obj):
+        if obj.status == 'done':
+            return 1.0
+        if not obj.total_items:
+            return 0.0
+        return round(min(obj.done_items / obj.total_items, 1.0), 3)
+
+
+# Lean (read-only) serializers
+# Build dicts straight from .values() rows, skipping DRF's per-field
+# machinery. Output must stay identical to the ModelSerializers above.
+
+def _datetime_repr(value):
+    # same as serializers.DateTimeField.to_representation with ISO_8601
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _date_repr(value):
+    return value.isoformat() if value else None
+
+
+class LeanSerializer:
+    value_fields = ()
+
+    def __init__(self, instance, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    def get_rows(self, queryset):
+        return queryset.values(*self.value_fields)
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    @timed
+    def to_list(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+    @property
+    def data(self):
+        return self.to_list(self.get_rows(self.instance))
+
+    def iter_chunks(self, chunk_size):
+        """Yield lists of at most chunk_size dicts from a server-side cursor."""
+        rows = self.get_rows(self.instance).iterator(chunk_size=chunk_size)
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                return
+            yield self.to_list(batch)
+
+
+class GroupLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'name', 'description', 'created_by_id',
+                    'created_by__username', 'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'created_by': {'id': row['created_by_id'], 'username': row['created_by__username']},
+            'created_at': _datetime_repr(row['created_at']),
+        }
+
+
+class TaskLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'session_id', 'created_by_id', 'created_by__username',
+                    'title', 'description', 'status', 'due_date', 'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'session': row['session_id'],
+            'created_by': {'id': row['created_by_id'], 'username': row['created_by__username']},
+            'title': row['title'],
+            'description': row['description'],
+            'status': row['status'],
+            'due_date': _date_repr(row['due_date']),
+            'created_at': _datetime_repr(row['created_at']),
+        }
+
+
+class DocumentLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'group_id', 'uploaded_by_id', 'uploaded_by__username', 'title',
+                    'file', 'original_name', 'file_type', 'mime_type', 'file_size', 'uploaded_at', 'approved',
+                    'comment_count', 'last_comment_at')
+
+    def get_file_url(self, name):
+        # mirrors serializers.FileField.to_representation
+        if not name:
+            return None
+        url = Document._meta.get_field('file').storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'group': row['group_id'],
+            'uploaded_by': {'id': row['uploaded_by_id'], 'username': row['uploaded_by__username']},
+            'title': row['title'],
+            'file': self.get_file_url(row['file']),
+            'original_name': row['original_name'],
+            'file_type': row['file_type'],
+            'mime_type': row['mime_type'],
+            'file_size': row['file_size'],
+            'uploaded_at': _datetime_repr(row['uploaded_at']),
+            'approved': row['approved'],
+            'comment_count': row['comment_count'],
+            'last_comment_at': _datetime_repr(row['last_comment_at']),
+        }
+
+
+class StudySessionLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'group_id', 'title', 'description', 'start_time', 'end_time',
+                    'recurrence', 'recurrence_until', 'parent_id', 'original_start', 'num_tasks')
+
+    def get_rows(self, queryset):
+        if 'num_tasks' not in queryset.query.annotations:
+            queryset = queryset.annotate(num_tasks=Count('tasks'))
+        return queryset.values(*self.value_fields)
+
+    def __init__(self, instance, context=None):
+        super().__init__(instance, context)
+        self.now = timezone.now()
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'group': row['group_id'],
+            'title': row['title'],
+            'description': row['description'],
+            'start_time': _datetime_repr(row['start_time']),
+            'end_time': _datetime_repr(row['end_time']),
+            'recurrence': row['recurrence'],
+            'recurrence_until': _datetime_repr(row['recurrence_until']),
+            'parent': row['parent_id'],
+            'original_start': _datetime_repr(row['original_start']),
+            'tasks_count': row['num_tasks'],
+            'status': self.get_status(row),
+        }
+
+    def get_status(self, row):
+        # same rules as StudySession.status
+        if row['recurrence']:
+            until = row['recurrence_until']
+            return 'completed' if until is not None and until < self.now else 'active'
+        return 'completed' if row['end_time'] < self.now else 'active'
+
+
+class DocumentCommentLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'document_id', 'parent_id', 'user_id', 'user__username', 'comment',
+                    'created_at', 'depth', 'reply_count')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'document': row['document_id'],
+            'parent': row['parent_id'],
+            'user': {'id': row['user_id'], 'username': row['user__username']},
+            'comment': row['comment'],
+            'created_at': _datetime_repr(row['created_at']),
+            'depth': row['depth'],
+            'reply_count': row['reply_count'],
+        }
+
+
+class GroupMemberLeanSerializer(LeanSerializer):
+    # the profile columns come from the same LEFT JOIN as the membership row
+    value_fields = ('user_id', 'user__username', 'sort_name', 'role', 'joined_at',
+                    'user__profile__profile_picture', 'user__profile__total_study_time',
+                    'user__profile__completed_tasks_count')
+
+    def get_avatar_url(self, name):
+        # mirrors serializers.ImageField.to_representation
+        if not name:
+            return None
+        url = Profile._meta.get_field('profile_picture').storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, row):
+        return {
+            'id': row['user_id'],
+            'username': row['user__username'],
+            'role': row['role'],
+            'joined_at': _datetime_repr(row['joined_at']),
+            'avatar': self.get_avatar_url(row['user__profile__profile_picture']),
+            'total_study_time': row['user__profile__total_study_time'] or 0,
+            'completed_tasks_count': row['user__profile__completed_tasks_count'] or 0,
+        }
+
+
+class ActivityEventLeanSerializer(LeanSerializer):
+    value_fields = ('id', 'month', 'verb', 'actor_id', 'actor__username', 'target_id', 'data', 'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'verb': row['verb'],
+            'actor': {'id': row['actor_id'], 'username': row['actor__username']} if row['actor_id'] else None,
+            'target_id': row['target_id'],
+            'data': row['data'],
+            'created_at': _datetime_repr(row['created_at']),
+        }
@@ -1,7 +1,18 @@
-from django.db.models.signals import pre_save, post_save
-from django.dispatch import receiver
+from functools import partial
+
 from django.db import transaction
-from .models import Task, Profile
+from django.db.models import F, Max
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Task, Group, GroupMembership, StudySession, Document, DocumentComment, DataExport
+from .agenda import bump_group_version
+from .export import remove_file
+from .recurrence import reanchor_overrides
+from .jobs import enqueue
+from .presence import publish_membership
+from .storage import release_blobs
+from .sync import record
 
 @receiver(pre_save, sender=Task)
 def task_pre_save(sender, instance, **kwargs):
@@ -16,26 +27,144 @@ def task_pre_save(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Task)
 def task_post_save(sender, instance, created, **kwargs):
-    # only update on create or status change
-    try:
-        profile = instance.created_by.profile
-    except Profile.DoesNotExist:
-        return
-
+    # only recount on create or status change
     prev = getattr(instance, "_prev_status", None)
     curr = instance.status
+    if (created and curr == 'complete') or (not created and prev != curr):
+        recount_completed_tasks(instance.created_by_id)
+
+
+@receiver(post_delete, sender=Task)
+def task_post_delete(sender, instance, **kwargs):
+    if instance.status == 'complete':
+        recount_completed_tasks(instance.created_by_id)
+
+
+def recount_completed_tasks(user_id):
+    enqueue('profiles.recount_completed_tasks', {'user_id': user_id},
+            dedupe_key=f"recount-completed-tasks:{user_id}")
+
 
-    if created and curr == 'complete':
+# overrides of a series follow changes to its rule or start (core.recurrence)
+@receiver(pre_save, sender=StudySession)
+def session_pre_save(sender, instance, **kwargs):
+    instance._prev_series = None
+    if instance.pk and instance.parent_id is None:
+        instance._prev_series = (StudySession.objects.filter(pk=instance.pk)
+                                 .values_list('recurrence', 'start_time').first())
+
+
+@receiver(post_save, sender=StudySession)
+def session_rescheduled(sender, instance, created, **kwargs):
+    prev = getattr(instance, '_prev_series', None)
+    if created or not prev or not prev[0]:
+        return
+    if prev != (instance.recurrence, instance.start_time):
         with transaction.atomic():
-            profile.completed_tasks_count = (profile.completed_tasks_count or 0) + 1
-            profile.save(update_fields=['completed_tasks_count'])
+            reanchor_overrides(instance, prev[1])
+
+
+# invalidate the cached iCalendar block of the affected group
+@receiver(post_save, sender=StudySession)
+@receiver(post_delete, sender=StudySession)
+def session_changed(sender, instance, **kwargs):
+    bump_group_version(instance.group_id)
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_group_version(instance.id)
+
+
+# keep Document.comment_count/last_comment_at and DocumentComment.reply_count current
+@receiver(post_save, sender=DocumentComment)
+def comment_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    Document.objects.filter(pk=instance.document_id).update(
+        comment_count=F('comment_count') + 1, last_comment_at=instance.created_at)
+    if instance.parent_id:
+        DocumentComment.objects.filter(pk=instance.parent_id).update(reply_count=F('reply_count') + 1)
+
+
+@receiver(post_delete, sender=DocumentComment)
+def comment_deleted(sender, instance, **kwargs):
+    latest = DocumentComment.objects.filter(document_id=instance.document_id).values('document_id') \
+        .annotate(last=Max('created_at')).values('last')
+    Document.objects.filter(pk=instance.document_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1, last_comment_at=latest)
+    if instance.parent_id:
+        DocumentComment.objects.filter(pk=instance.parent_id, reply_count__gt=0).update(
+            reply_count=F('reply_count') - 1)
+
+
+# change log for /api/sync/
+def task_group_id(task):
+    if Task.session.is_cached(task):
+        return task.session.group_id
+    return StudySession.objects.filter(pk=task.session_id).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=StudySession)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=StudySession)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Document)
+def log_change(sender, instance, **kwargs):
+    deleted = kwargs.get('signal') is post_delete
+    if sender is Group:
+        record('group', instance.id, instance.id, deleted)
+    elif sender is StudySession:
+        record('session', instance.id, instance.group_id, deleted)
+    elif sender is Task:
+        record('task', instance.id, task_group_id(instance), deleted)
     else:
-        # status changed
-        if prev != curr:
-            with transaction.atomic():
-                if prev != 'complete' and curr == 'complete':
-                    profile.completed_tasks_count = (profile.completed_tasks_count or 0) + 1
-                    profile.save(update_fields=['completed_tasks_count'])
-                elif prev == 'complete' and curr != 'complete' and profile.completed_tasks_count > 0:
-                    profile.completed_tasks_count = profile.completed_tasks_count - 1
-                    profile.save(update_fields=['completed_tasks_count'])
+        record('document', instance.id, instance.group_id, deleted)
+
+
+# a deleted document stops holding its blob (core.storage)
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    if instance.content_hash:
+        release_blobs({instance.content_hash: 1})
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def log_membership_change(sender, instance, **kwargs):
+    record('membership', instance.user_id, instance.group_id, kwargs.get('signal') is post_delete)
+
+
+# open presence sockets follow their user's memberships
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def membership_presence(sender, instance, **kwargs):
+    deleted = kwargs.get('signal') is post_delete
+    if deleted or kwargs.get('created'):
+        change = (instance.user_id, instance.group_id, 'left' if deleted else 'joined')
+        transaction.on_commit(partial(publish_membership, [change]))
+
+
+# keep the member directory's sort key in step with the username
+@receiver(pre_save, sender=GroupMembership)
+def membership_sort_name(sender, instance, **kwargs):
+    if not instance.sort_name:
+        instance.sort_name = instance.user.username.lower()
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, update_fields=None, **kwargs):
+    # logins save with update_fields=['last_login']; those can't rename
+    if not created and (update_fields is None or 'username' in update_fields):
+        sort_name = instance.username.lower()
+        GroupMembership.objects.filter(user=instance).exclude(sort_name=sort_name).update(sort_name=sort_name)
+
+
+# export archives go with their rows, including rows cascading from a deleted user
+@receiver(post_delete, sender=DataExport)
+def export_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(remove_file, instance))
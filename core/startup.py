@@ -0,0 +1,76 @@
+"""
+Worker start-up: pre-fork warm-up and the numbers behind manage.py startup_report.
+
+warm_up() does the work every worker otherwise repeats on its first
+request: it populates the URL resolver (importing every view module),
+resolves DRF's and simplejwt's class settings and fills the model _meta
+caches. Then it closes database connections, so no socket is shared with
+forked children, and freezes the garbage collector's view of everything
+loaded so far (gc.freeze), so collections in the children never write to
+those pages and they stay shared copy-on-write. wsgi.py and asgi.py call it
+when the application is loaded; with a preloading server (gunicorn
+--preload, uWSGI without lazy-apps) that happens once, in the master.
+"""
+import gc
+import re
+
+from django.apps import apps
+from django.db import connections
+
+DRF_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_THROTTLE_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_PAGINATION_CLASS', 'DEFAULT_FILTER_BACKENDS', 'EXCEPTION_HANDLER',
+)
+JWT_SETTINGS = ('AUTH_TOKEN_CLASSES', 'TOKEN_USER_CLASS', 'TOKEN_BACKEND_CLASS')
+
+
+def warm_up(freeze=True):
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    resolver = get_resolver()
+    resolver.reverse_dict  # imports the views and builds the reverse lookup tables
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+    for name in JWT_SETTINGS:
+        getattr(jwt_settings, name, None)
+    for model in apps.get_models():
+        model._meta.get_fields()
+    connections.close_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """
+    Rows of `python -X importtime` output as (module, self_us, cumulative_us,
+    depth); depth 0 rows are what the boot imported directly.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def by_package(rows):
+    """Self import time in microseconds summed per top-level package."""
+    totals = {}
+    for module, self_us, _, _ in rows:
+        package = module.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def regressions(current, baseline, tolerance=0.2, metrics=('import_ms', 'boot_ms', 'rss_kb')):
+    """Metrics that grew by more than tolerance (a fraction) over a saved report."""
+    return [(name, baseline[name], current[name]) for name in metrics
+            if baseline.get(name) and current[name] > baseline[name] * (1 + tolerance)]
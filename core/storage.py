@@ -0,0 +1,226 @@
+"""
+Document storage.
+
+Blobs are content-addressed: a file is stored once under
+blobs/<aa>/<bb>/<sha256><ext>, where aa and bb are the first hex digits of
+its hash. Re-uploading the same bytes costs no write, names never clash and
+directories stay small. Size, type and MIME are sniffed once, at upload
+(describe_upload), so later saves of a Document never touch the file.
+
+Blob rows count the documents using each hash. Document.save takes its
+reference (claim_blob) before the storage looks for an existing blob, and
+the group purge deletes a blob only while holding its row at zero
+references, so an upload that found the blob can't lose it to a purge.
+
+The backend is chosen with settings.DOCUMENT_STORAGE (dotted path) and
+DOCUMENT_STORAGE_OPTIONS. ContentAddressedFileSystemStorage is the default;
+S3Storage talks to any S3-compatible service through a boto3-style client.
+"""
+import hashlib
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+from .counters import subtract
+
+try:
+    import boto3
+except ImportError:  # only needed for S3Storage without an explicit client
+    boto3 = None
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 512
+
+# leading bytes -> MIME; zip containers are told apart by extension below
+SIGNATURES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),  # legacy .doc/.xls/.ppt
+    (b'\x1f\x8b', 'application/gzip'),
+)
+ZIP_BASED = {'.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub'}
+OLE_BASED = {'.doc', '.xls', '.ppt'}
+
+
+def looks_like_text(head):
+    if b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as exc:
+        # a multi-byte character cut off at the end of the sample is fine
+        return exc.start >= len(head) - 3
+    return True
+
+
+def sniff_mime(head, name):
+    ext = os.path.splitext(name)[1].lower()
+    guessed = mimetypes.guess_type(name)[0]
+    for signature, mime in SIGNATURES:
+        if head.startswith(signature):
+            if (mime == 'application/zip' and ext in ZIP_BASED) or (
+                    mime == 'application/x-ole-storage' and ext in OLE_BASED):
+                return guessed or mime
+            return mime
+    if head and looks_like_text(head):
+        return guessed if guessed and guessed.startswith('text/') else 'text/plain'
+    return guessed or 'application/octet-stream'
+
+
+def describe_upload(content, name):
+    """
+    One pass over an uploaded file: size, sha256, MIME and extension. The hash
+    is left on the file so the storage doesn't read it a second time.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    for chunk in content.chunks(CHUNK_SIZE):
+        if len(head) < SNIFF_BYTES:
+            head += chunk[:SNIFF_BYTES - len(head)]
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    content.content_hash = digest.hexdigest()
+    return {
+        'file_size': size,
+        'content_hash': content.content_hash,
+        'mime_type': sniff_mime(head, name),
+        'file_type': name.split('.')[-1][:50],  # as documents have always had it
+    }
+
+
+def blob_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()[:16]
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def content_hash(content):
+    cached = getattr(content, 'content_hash', None)
+    if cached:
+        return cached
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def claim_blob(digest):
+    """
+    Count one more document on the blob; call inside the transaction that
+    saves the document, the row stays locked until it commits.
+    """
+    from .models import Blob
+
+    while not Blob.objects.filter(pk=digest).update(refs=F('refs') + 1):
+        try:
+            with transaction.atomic():
+                Blob.objects.create(content_hash=digest, refs=1)
+            return
+        except IntegrityError:
+            continue  # created meanwhile, count on that row
+
+
+def release_blobs(counts):
+    """Drop counts[digest] references; a blob at zero is left for the purge."""
+    from .models import Blob
+
+    subtract(Blob, 'refs', counts)
+
+
+class ContentAddressedMixin:
+    """Storage.save that names files by their hash and skips existing blobs."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        target = blob_name(content_hash(content), name)
+        if not self.exists(target):
+            target = self._save(target, content)
+        return target.replace('\\', '/')
+
+
+@deconstructible
+class ContentAddressedFileSystemStorage(ContentAddressedMixin, FileSystemStorage):
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return name  # the same blob was written concurrently
+
+
+@deconstructible
+class S3Storage(ContentAddressedMixin, Storage):
+    """Content-addressed blobs in an S3-compatible bucket (AWS, MinIO, R2, ...)."""
+
+    def __init__(self, bucket=None, client=None, endpoint_url=None, region_name=None,
+                 url_expiry=3600):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.url_expiry = url_expiry
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            if boto3 is None:
+                raise ImproperlyConfigured("S3Storage needs boto3 installed (or a client passed in).")
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url,
+                                        region_name=self.region_name)
+        return self._client
+
+    def _save(self, name, content):
+        content.seek(0)
+        self.client.put_object(Bucket=self.bucket, Key=name, Body=content,
+                               ContentType=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        return name
+
+    def _open(self, name, mode='rb'):
+        # the streaming body is read as it is consumed, never all at once
+        return File(self.client.get_object(Bucket=self.bucket, Key=name)['Body'], name=name)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except Exception:
+            return False
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': name}, ExpiresIn=self.url_expiry)
+
+
+_storage = None
+
+
+def document_storage():
+    """Storage for Document.file, built once from settings."""
+    global _storage
+    if _storage is None:
+        path = getattr(settings, 'DOCUMENT_STORAGE', 'core.storage.ContentAddressedFileSystemStorage')
+        _storage = import_string(path)(**getattr(settings, 'DOCUMENT_STORAGE_OPTIONS', {}))
+    return _storage
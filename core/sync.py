@@ -0,0 +1,168 @@
+"""
+Incremental sync for offline-first clients.
+
+Model signals append a ChangeLog row (group, model, object id) for every
+saved or deleted group, session, task and document and for membership
+changes. /api/sync/?since=<token> reads the log after the token for the
+user's groups only, so a warm sync costs O(changes). Changed rows are read
+back at sync time, so a row that changed ten times is sent once, and a
+changed row the user can't see (anymore) is sent as a tombstone.
+
+compact() keeps the newest entry per object and drops entries older than
+SYNC_RETENTION_DAYS; tokens older than that are rejected and the client
+starts over with a full sync. Writes that bypass signals (QuerySet.update,
+bulk_create) have to call record() themselves.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import ChangeLog, Document, Group, GroupMembership, StudySession, Task
+from .serializers import (
+    GroupLeanSerializer, StudySessionLeanSerializer, TaskLeanSerializer, DocumentLeanSerializer
+)
+
+PAGE_SIZE = 1000
+
+# log name -> (response key, lean serializer)
+MODELS = {
+    'group': ('groups', GroupLeanSerializer),
+    'session': ('sessions', StudySessionLeanSerializer),
+    'task': ('tasks', TaskLeanSerializer),
+    'document': ('documents', DocumentLeanSerializer),
+}
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'SYNC_RETENTION_DAYS', 30))
+
+
+def settle_delay():
+    # entries younger than this may still have uncommitted neighbours with a
+    # lower id, so they are left for the next sync
+    return timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+
+
+def record(model, object_id, group_id, deleted=False):
+    if group_id is not None:
+        ChangeLog.objects.create(model=model, object_id=object_id, group_id=group_id, deleted=deleted)
+
+
+def record_many(model, rows, deleted=False):
+    """record() for (object_id, group_id) pairs, in one insert."""
+    ChangeLog.objects.bulk_create([
+        ChangeLog(model=model, object_id=object_id, group_id=group_id, deleted=deleted)
+        for object_id, group_id in rows if group_id is not None
+    ])
+
+
+# tokens
+
+def encode_token(position, issued):
+    return f"{position}.{int(issued.timestamp())}"
+
+
+def decode_token(token):
+    """(position, issued) from a token, raising ValueError if it is malformed."""
+    position, _, issued = token.partition('.')
+    return int(position), datetime.fromtimestamp(int(issued), tz=dt_timezone.utc)
+
+
+def token_expired(issued):
+    return issued < timezone.now() - retention()
+
+
+# reading
+
+def visible_querysets(user, member_groups, admin_groups):
+    """Same visibility rules as the list endpoints, limited to member groups."""
+    return {
+        'group': Group.objects.filter(id__in=member_groups),
+        'session': StudySession.objects.filter(group_id__in=member_groups),
+        'task': Task.objects.filter(session__group_id__in=member_groups),
+        'document': Document.objects.filter(group_id__in=member_groups).filter(
+            Q(approved=True) | Q(uploaded_by=user) | Q(group_id__in=admin_groups)),
+    }
+
+
+def changes(user, position=None, page_size=PAGE_SIZE, context=None):
+    """
+    Everything the user needs to catch up from `position` (None for a full
+    sync). Groups the user joined since the token are sent in full; groups
+    they left come back as group tombstones.
+    """
+    memberships = dict(GroupMembership.active.filter(user=user).values_list('group_id', 'role'))
+    member_groups = list(memberships)
+    admin_groups = [group_id for group_id, role in memberships.items() if role == 'admin']
+    visible = visible_querysets(user, member_groups, admin_groups)
+
+    cutoff = timezone.now() - settle_delay()
+    settled = ChangeLog.objects.filter(created_at__lte=cutoff)
+    changed = {name: set() for name in MODELS}
+    full_groups, left_groups, has_more = set(), set(), False
+
+    if position is None:
+        full_groups = set(member_groups)
+        head = settled.order_by('-id').values_list('id', flat=True).first() or 0
+        issued = cutoff
+    else:
+        entries = list(settled.filter(id__gt=position).filter(
+            Q(group_id__in=member_groups) & ~Q(model='membership')
+            | Q(model='membership', object_id=user.id)
+        ).order_by('id').values_list('id', 'group_id', 'model', 'object_id', 'created_at')[:page_size + 1])
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        for _, group_id, model, object_id, _ in entries:
+            if model == 'membership':
+                (full_groups if group_id in memberships else left_groups).add(group_id)
+            else:
+                changed[model].add(object_id)
+        if has_more:
+            head, issued = entries[-1][0], entries[-1][4]
+        else:
+            # caught up: skip past entries of other groups too
+            head = settled.order_by('-id').values_list('id', flat=True).first() or position
+            issued = cutoff
+
+    payload = {'token': encode_token(head, issued), 'full': position is None, 'has_more': has_more}
+    for name, (key, serializer_class) in MODELS.items():
+        queryset = visible[name]
+        if name == 'group':
+            wanted = Q(id__in=changed[name] | full_groups)
+        elif name == 'task':
+            wanted = Q(id__in=changed[name]) | Q(session__group_id__in=full_groups)
+        else:
+            wanted = Q(id__in=changed[name]) | Q(group_id__in=full_groups)
+        serializer = serializer_class(queryset.filter(wanted).order_by('id'), context=context)
+        rows = serializer.data
+        sent = {row['id'] for row in rows}
+        deletes = sorted(changed[name] - sent)
+        if name == 'group':
+            deletes = sorted(set(deletes) | left_groups)
+        payload[key] = {'upserts': rows, 'deletes': deletes}
+    return payload
+
+
+# compaction
+
+def compact(batch_size=1000):
+    """Drop expired entries and entries superseded by a newer one for the same object."""
+    expired_ids = ChangeLog.objects.filter(
+        created_at__lt=timezone.now() - retention()).values_list('id', flat=True)
+    expired = 0
+    while True:
+        batch = list(expired_ids[:batch_size])
+        if not batch:
+            break
+        expired += ChangeLog.objects.filter(id__in=batch).delete()[0]
+
+    superseded = 0
+    duplicates = ChangeLog.objects.values('model', 'object_id', 'group_id').annotate(
+        latest=Max('id'), entries=Count('id')).filter(entries__gt=1).order_by()
+    for row in duplicates.iterator(chunk_size=batch_size):
+        superseded += ChangeLog.objects.filter(
+            model=row['model'], object_id=row['object_id'], group_id=row['group_id'],
+            id__lt=row['latest']).delete()[0]
+    return expired, superseded
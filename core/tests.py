@@ -1,3 +1,1782 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import io
+import os
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.core.files.base import ContentFile
+from django.core import checks, mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .agenda import find_conflicts
+from .recurrence import expand, materialize, occurrences, parse_rule, series_end
+from .scheduler import ReminderScheduler
+from .jobs import Worker, enqueue, job
+from .purge import GroupPurger, request_deletion
+from .seeding import Seeder
+from .export import Exporter
+from .extraction import extract, extract_timed, reset_pool, run_in_pool
+from .job_handlers import extract_document_text
+from .loadtest import Endpoint, InProcessTransport, LoadTest, VirtualUser, percentile, regressions
+from .storage import ContentAddressedFileSystemStorage, S3Storage, claim_blob
+from .archive import Archiver, POLICIES as ARCHIVE_POLICIES
+from .activity import ActivityBuffer, buffer as activity_buffer
+from .sync import compact as sync_compact, encode_token as sync_encode_token
+from .presence import (
+    InMemoryChannelLayer, PresenceApplication, Roster, expire_stale, publish_timer_event_async
+)
+from .middleware import CompressionMiddleware, accepted_encodings
+from . import metrics as request_metrics
+from .profiling import SlowQueryLogger, StackSampler
+from .throttling import SlidingWindow, check_throttle_cache, parse_rate
+from . import startup
+from .models import (
+    Profile, Group, GroupMembership, Task, Document, DocumentComment, StudySession, Notification, Job,
+    TimerSession, GroupInvite, DataExport, DocumentText,
+    ActivityEvent, Blob
+)
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer
+from .serializers import (
+    GroupSerializer, TaskSerializer, DocumentSerializer, StudySessionSerializer,
+    DocumentCommentSerializer, GroupLeanSerializer, TaskLeanSerializer, DocumentLeanSerializer,
+    StudySessionLeanSerializer, DocumentCommentLeanSerializer
+)
+from .views import DashboardView, GroupViewSet
+
+
+class LeanSerializerParityTests(TestCase):
+    """Lean serializers + ORJSONRenderer must produce the exact bytes of the originals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pass1234')
+        cls.group = Group.objects.create(
+            name='Grüppe   "quoted"', description='line\nbreak', created_by=cls.user)
+        GroupMembership.objects.create(user=cls.user, group=cls.group, role='admin')
+        now = timezone.now()
+        cls.past = StudySession.objects.create(
+            group=cls.group, title='Past', start_time=now - timedelta(days=2),
+            end_time=now - timedelta(days=1))
+        cls.future = StudySession.objects.create(
+            group=cls.group, title='Future', start_time=now + timedelta(days=1),
+            end_time=now + timedelta(days=2))
+        Task.objects.create(session=cls.future, created_by=cls.user, title='No due date \u2028 \x1f')
+        Task.objects.create(session=cls.future, created_by=cls.user, title='Due',
+                            status='complete', due_date=date(2025, 1, 31))
+        Document.objects.bulk_create([
+            Document(group=cls.group, uploaded_by=cls.user, title='Notes',
+                     file=f'documents/group_{cls.group.id}/notes v1.pdf', file_type='pdf'),
+            Document(group=cls.group, uploaded_by=cls.user, title='Empty', file=''),
+        ])
+        root = DocumentComment.objects.create(
+            document=Document.objects.first(), user=cls.user, comment='Nice 👍')
+        DocumentComment.objects.create(document=root.document, parent=root, user=cls.user, comment='+1')
+
+    def setUp(self):
+        self.context = {'request': APIRequestFactory().get('/api/documents/')}
+
+    def assertSameBytes(self, serializer_class, lean_class, queryset):
+        expected = JSONRenderer().render(
+            serializer_class(queryset, many=True, context=self.context).data)
+        lean_data = lean_class(queryset, context=self.context).data
+        self.assertEqual(JSONRenderer().render(lean_data), expected)
+        self.assertEqual(ORJSONRenderer().render(lean_data), expected)
+
+    def test_group(self):
+        self.assertSameBytes(GroupSerializer, GroupLeanSerializer, Group.objects.order_by('id'))
+
+    def test_task(self):
+        self.assertSameBytes(TaskSerializer, TaskLeanSerializer, Task.objects.order_by('id'))
+
+    def test_document(self):
+        self.assertSameBytes(DocumentSerializer, DocumentLeanSerializer, Document.objects.order_by('id'))
+
+    def test_study_session(self):
+        self.assertSameBytes(StudySessionSerializer, StudySessionLeanSerializer,
+                             StudySession.objects.order_by('id'))
+
+    def test_document_comment(self):
+        self.assertSameBytes(DocumentCommentSerializer, DocumentCommentLeanSerializer,
+                             DocumentComment.objects.order_by('id'))
+
+    def test_list_endpoint_uses_lean_output(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/tasks/')
+        expected = JSONRenderer().render(
+            TaskSerializer(Task.objects.order_by('-created_at'), many=True).data)
+        self.assertEqual(response.content, expected)
+
+
+class StreamingListTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pass1234')
+        Group.objects.bulk_create([
+            Group(name=f'Group {i}', created_by=self.user) for i in range(25)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_stream_matches_buffered_response(self):
+        buffered = self.client.get('/api/groups/explore-groups/')
+        with mock.patch.object(GroupViewSet, 'stream_chunk_size', 7):
+            streamed = self.client.get('/api/groups/explore-groups/?stream=1')
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), buffered.content)
+
+    def test_stream_empty_list(self):
+        response = self.client.get('/api/tasks/?stream=1')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class DashboardTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dana', password='pass1234')
+        Profile.objects.create(user=self.user)
+        owner = User.objects.create_user('olga', password='pass1234')
+        self.own = Group.objects.create(name='Mine', created_by=self.user)
+        joined = Group.objects.create(name='Joined', created_by=owner)
+        GroupMembership.objects.create(user=self.user, group=self.own, role='admin')
+        GroupMembership.objects.create(user=self.user, group=joined)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_rows(self, n):
+        now = timezone.now()
+        for group in Group.objects.all():
+            session = StudySession.objects.create(group=group, title='S', start_time=now + timedelta(hours=1),
+                                                  end_time=now + timedelta(hours=2))
+            Task.objects.bulk_create([Task(session=session, created_by=self.user, title=f'T{i}') for i in range(n)])
+        Document.objects.bulk_create([
+            Document(group=self.own, uploaded_by=self.user, title=f'D{i}', file=f'documents/d{i}.txt')
+            for i in range(n)])
+
+    def test_pending_approvals_are_capped_and_queries_constant(self):
+        self.add_rows(5)
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['pending_approvals_count'], 5)
+
+        self.add_rows(DashboardView.PENDING_LIMIT)
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual(len(response.data['pending_approvals']), DashboardView.PENDING_LIMIT)
+        self.assertEqual(response.data['pending_approvals_count'], DashboardView.PENDING_LIMIT + 5)
+        self.assertEqual(len(response.data['upcoming_sessions']), 4)
+
+    def test_series_past_its_first_occurrence_is_upcoming(self):
+        start = timezone.now() - timedelta(days=3)
+        series = StudySession.objects.create(group=self.own, title='Weekly', recurrence='FREQ=WEEKLY',
+                                             start_time=start, end_time=start + timedelta(hours=1))
+        StudySession.objects.create(group=self.own, title='Done', start_time=start,
+                                    end_time=start + timedelta(hours=1))
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual([s['id'] for s in response.data['upcoming_sessions']], [series.id])
+
+
+class CommentThreadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='pass1234')
+        group = Group.objects.create(name='Threads', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='admin')
+        self.document = Document.objects.create(
+            group=group, uploaded_by=self.user, title='Doc', file='documents/doc.txt')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, text, parent=None):
+        response = self.client.post('/api/document-comments/', {
+            'document': self.document.id, 'comment': text, 'parent': parent}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_thread_order_counters_and_pagination(self):
+        root = self.post('root')
+        a = self.post('a', root)
+        b = self.post('b', root)
+        a1 = self.post('a1', a)
+        other = self.post('other root')
+
+        listed = self.client.get('/api/document-comments/', {'document': self.document.id})
+        self.assertEqual([c['id'] for c in listed.data], [other, root])
+
+        url = f'/api/document-comments/{root}/thread/'
+        with self.assertNumQueries(2):  # root lookup + one subtree page
+            page = self.client.get(url, {'limit': 3}).data
+        self.assertEqual([c['id'] for c in page['results']], [root, a, a1])
+        self.assertEqual([c['depth'] for c in page['results']], [0, 1, 2])
+        rest = self.client.get(url, {'limit': 3, 'after': page['next_after']}).data
+        self.assertEqual([c['id'] for c in rest['results']], [b])
+        self.assertIsNone(rest['next_after'])
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.comment_count, 5)
+        self.assertEqual(DocumentComment.objects.get(pk=root).reply_count, 2)
+
+        self.client.delete(f'/api/document-comments/{a}/')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.comment_count, 3)
+        self.assertEqual(DocumentComment.objects.get(pk=root).reply_count, 1)
+
+    def test_reply_must_stay_on_document(self):
+        root = self.post('root')
+        other = Document.objects.create(
+            group=self.document.group, uploaded_by=self.user, title='Other', file='documents/o.txt')
+        response = self.client.post('/api/document-comments/', {
+            'document': other.id, 'comment': 'x', 'parent': root}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_comment_cannot_be_moved(self):
+        root = self.post('root')
+        reply = self.post('reply', root)
+        url = f'/api/document-comments/{reply}/'
+        self.assertEqual(self.client.patch(url, {'parent': None}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'parent': self.post('other')}, format='json').status_code, 400)
+        response = self.client.patch(url, {'comment': 'edited', 'parent': root}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        moved = DocumentComment.objects.get(pk=reply)
+        self.assertEqual((moved.parent_id, moved.depth, moved.comment), (root, 1, 'edited'))
+        self.assertEqual(DocumentComment.objects.get(pk=root).reply_count, 1)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('frank', password='pass1234')
+        self.owner = User.objects.create_user('gina', password='pass1234')
+        self.group = Group.objects.create(name='Synced', created_by=self.owner)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='member')
+        self.session = StudySession.objects.create(
+            group=self.group, title='S', start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(hours=1))
+        self.task = Task.objects.create(session=self.session, created_by=self.owner, title='T')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token=None):
+        response = self.client.get('/api/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_then_incremental(self):
+        full = self.sync()
+        self.assertTrue(full['full'])
+        self.assertEqual([t['id'] for t in full['tasks']['upserts']], [self.task.id])
+
+        self.assertEqual(self.sync(full['token'])['tasks'], {'upserts': [], 'deletes': []})
+
+        other = Group.objects.create(name='Not mine', created_by=self.owner)
+        Document.objects.create(group=other, uploaded_by=self.owner, title='x', file='documents/x.txt')
+        added = Task.objects.create(session=self.session, created_by=self.owner, title='New')
+        deleted_id = self.task.id
+        self.task.delete()
+        delta = self.sync(full['token'])
+        self.assertEqual([t['id'] for t in delta['tasks']['upserts']], [added.id])
+        self.assertEqual(delta['tasks']['deletes'], [deleted_id])
+        self.assertEqual(delta['documents'], {'upserts': [], 'deletes': []})
+
+    def test_membership_changes_and_compaction(self):
+        token = self.sync()['token']
+        other = Group.objects.create(name='Joined later', created_by=self.owner)
+        StudySession.objects.create(group=other, title='Old', start_time=timezone.now(),
+                                    end_time=timezone.now() + timedelta(hours=1))
+        GroupMembership.objects.create(user=self.user, group=other)
+        GroupMembership.objects.filter(user=self.user, group=self.group).delete()
+        self.session.title = 'Renamed'
+        self.session.save()
+
+        delta = self.sync(token)
+        self.assertEqual([g['id'] for g in delta['groups']['upserts']], [other.id])
+        self.assertEqual(delta['groups']['deletes'], [self.group.id])
+        self.assertEqual([s['title'] for s in delta['sessions']['upserts']], ['Old'])
+
+        # the session's create and the membership's create are superseded
+        self.assertEqual(sync_compact(), (0, 2))
+
+    def test_expired_token(self):
+        stale = sync_encode_token(0, timezone.now() - timedelta(days=60))
+        self.assertEqual(self.client.get('/api/sync/', {'since': stale}).status_code, 410)
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'junk'}).status_code, 400)
+
+
+class ActivityTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('hank', password='pass1234')
+        self.group = Group.objects.create(name='Active', created_by=self.user)
+        self.other = Group.objects.create(name='Elsewhere', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_buffer_flushes_on_size(self):
+        buffer = ActivityBuffer(flush_size=3, flush_interval=3600)
+        for _ in range(5):
+            buffer.add(ActivityEvent(group_id=self.group.id, month=203001, verb='member.joined'))
+        self.assertEqual(ActivityEvent.objects.count(), 3)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(ActivityEvent.objects.count(), 5)
+
+    def test_actions_are_logged_and_feed_pages(self):
+        joiner = User.objects.create_user('ivy', password='pass1234')
+        client = APIClient()
+        client.force_authenticate(joiner)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/groups/{self.group.id}/join/')
+            client.post(f'/api/groups/{self.other.id}/join/')
+            client.post(f'/api/groups/{self.group.id}/leave/')
+        activity_buffer.flush()
+
+        ActivityEvent.objects.bulk_create([
+            ActivityEvent(group_id=self.group.id, month=202001, verb='task.completed', target_id=i)
+            for i in range(3)])
+        url = f'/api/groups/{self.group.id}/activity/'
+        page = self.client.get(url, {'limit': 2}).data
+        self.assertEqual([e['verb'] for e in page['results']], ['member.left', 'member.joined'])
+        self.assertEqual(page['results'][0]['actor']['username'], 'ivy')
+        rest = self.client.get(url, {'limit': 2, 'before': page['next']}).data
+        self.assertEqual([e['target_id'] for e in rest['results']], [2, 1])
+
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class GroupMembersTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('Olga', password='pass1234')
+        Profile.objects.create(user=self.owner, total_study_time=90)
+        self.group = Group.objects.create(name='Directory', created_by=self.owner)
+        GroupMembership.objects.create(user=self.owner, group=self.group, role='admin')
+        for name in ('anna', 'andy', 'bob', 'amir'):
+            GroupMembership.objects.create(user=User.objects.create_user(name, password='pass1234'),
+                                           group=self.group)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = f'/api/groups/{self.group.id}/members/'
+
+    def test_pages_in_username_order_across_joins_and_leaves(self):
+        with self.assertNumQueries(3):  # group, membership check, the page
+            page = self.client.get(self.url, {'limit': 2}).data
+        self.assertEqual([m['username'] for m in page['results']], ['amir', 'andy'])
+
+        # a member joins before the cursor and one on the next page leaves
+        GroupMembership.objects.create(user=User.objects.create_user('aaron', password='pass1234'),
+                                       group=self.group)
+        GroupMembership.objects.filter(user__username='anna').delete()
+        rest = self.client.get(self.url, {'limit': 2, 'after': page['next']}).data
+        self.assertEqual([m['username'] for m in rest['results']], ['bob', 'Olga'])
+        self.assertEqual(rest['results'][1]['total_study_time'], 90)
+        self.assertEqual(rest['results'][0]['avatar'], None)
+        self.assertIsNone(rest['next'])
+
+    def test_role_filter_and_prefix_search(self):
+        names = lambda params: [m['username'] for m in self.client.get(self.url, params).data['results']]
+        self.assertEqual(names({'q': 'AN'}), ['andy', 'anna'])
+        self.assertEqual(names({'role': 'admin'}), ['Olga'])
+        self.assertEqual(names({'role': 'member', 'q': 'o'}), [])
+
+        self.owner.username = 'zoe'
+        self.owner.save()
+        self.assertEqual(names({'q': 'z'}), ['zoe'])
+
+        self.assertEqual(self.client.get(self.url, {'role': 'owner'}).status_code, 400)
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user('eve', password='pass1234'))
+        self.assertEqual(outsider.get(self.url).status_code, 403)
+
+
+class MemberImportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('teacher', password='pass1234')
+        self.group = Group.objects.create(name='Class of 30', created_by=self.admin)
+        GroupMembership.objects.create(user=self.admin, group=self.group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = f'/api/groups/{self.group.id}/members/import/'
+
+    def upload(self, client, lines):
+        csv_file = SimpleUploadedFile('class.csv', '\n'.join(lines).encode(), content_type='text/csv')
+        return client.post(self.url, {'file': csv_file}, format='multipart')
+
+    def test_import_adds_members_and_invites_emails(self):
+        students = User.objects.bulk_create([
+            User(username=f'student{i}', email=f'student{i}@school.test') for i in range(30)])
+        GroupMembership.objects.create(user=students[0], group=self.group)
+        lines = ['username'] + [f'student{i}' for i in range(20)] + [
+            'Student25@School.test', 'student1', 'new.kid@school.test', 'ghost', 'teacher']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(self.client, lines)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], 19)  # student1-19
+        self.assertEqual(response.data['already_members'], 2)
+        # an address is never matched to whoever put it in their profile
+        self.assertEqual(response.data['invited'], 2)
+        self.assertEqual(response.data['unknown_usernames'], ['ghost'])
+        members = GroupMembership.objects.filter(group=self.group)
+        self.assertEqual(members.count(), 21)
+        self.assertEqual(members.get(user=students[1]).sort_name, 'student1')
+        self.assertFalse(members.filter(user=students[25]).exists())
+        self.assertEqual(Notification.objects.filter(type='group_added').count(), 19)
+        activity_buffer.flush()
+        event = ActivityEvent.objects.get(group_id=self.group.id, verb='members.imported')
+        event.full_clean()  # a declared verb
+        self.assertEqual((event.data['added'], event.data['invited']), (19, 2))
+
+        Worker().drain()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['new.kid@school.test', 'student25@school.test'])
+        invite = GroupInvite.objects.get(email='new.kid@school.test')
+        self.assertIsNotNone(invite.sent_at)
+        token = next(message for message in mail.outbox if message.to == ['new.kid@school.test']) \
+            .body.split('invite code in the app: ')[1].split()[0]
+
+        # signing up with the address alone doesn't join
+        self.client.post('/api/auth/register/', {'username': 'newkid', 'email': 'New.Kid@school.test',
+                                            'password': 'pass12345'}, format='json')
+        newkid = User.objects.get(username='newkid')
+        self.assertFalse(members.filter(user=newkid).exists())
+
+        # whoever holds the mailed token does, once
+        client = APIClient()
+        client.force_authenticate(newkid)
+        self.assertEqual(client.post('/api/invites/claim/', {'token': 'guess'}, format='json').status_code, 404)
+        response = client.post('/api/invites/claim/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['group'], self.group.id)
+        self.assertTrue(members.filter(user=newkid).exists())
+        self.assertFalse(GroupInvite.objects.filter(email='new.kid@school.test').exists())
+        self.assertEqual(client.post('/api/invites/claim/', {'token': token}, format='json').status_code, 404)
+
+        # expired invites are refused
+        GroupInvite.objects.update(sent_at=timezone.now() - timedelta(days=30))
+        token = next(message for message in mail.outbox if message.to == ['student25@school.test']) \
+            .body.split('invite code in the app: ')[1].split()[0]
+        client.force_authenticate(students[25])
+        self.assertEqual(client.post('/api/invites/claim/', {'token': token}, format='json').status_code, 404)
+
+    def test_only_admins_can_import(self):
+        member = User.objects.create_user('pupil', password='pass1234')
+        GroupMembership.objects.create(user=member, group=self.group)
+        client = APIClient()
+        client.force_authenticate(member)
+        self.assertEqual(self.upload(client, ['pupil']).status_code, 403)
+        self.assertEqual(self.client.post(self.url, {}, format='multipart').status_code, 400)
+
+
+class TaskFilterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('rita', password='pass1234')
+        self.other = User.objects.create_user('sam', password='pass1234')
+        now = timezone.now()
+        self.groups = [Group.objects.create(name=name, created_by=self.user) for name in ('Math', 'Bio')]
+        sessions = []
+        for group in self.groups:
+            GroupMembership.objects.create(user=self.user, group=group, role='admin')
+            sessions.append(StudySession.objects.create(group=group, title='S', start_time=now,
+                                                        end_time=now + timedelta(hours=1)))
+        today = timezone.localdate()
+        Task.objects.bulk_create([
+            Task(session=sessions[0], created_by=self.user, title='Algebra drills', due_date=today - timedelta(days=2)),
+            Task(session=sessions[0], created_by=self.other, title='Geometry proofs', due_date=today + timedelta(days=3)),
+            Task(session=sessions[0], created_by=self.user, title='Algebra quiz', status='complete',
+                 due_date=today - timedelta(days=1)),
+            Task(session=sessions[1], created_by=self.user, title='Cell biology notes'),
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def titles(self, **params):
+        response = self.client.get('/api/tasks/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [task['title'] for task in response.data]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.titles(overdue=1), ['Algebra drills'])
+        self.assertEqual(self.titles(q='algebra', ordering='due_date'), ['Algebra drills', 'Algebra quiz'])
+        self.assertEqual(self.titles(status='pending', created_by='me', ordering='-due_date'),
+                         ['Algebra drills', 'Cell biology notes'])
+        self.assertEqual(self.titles(group=self.groups[1].id), ['Cell biology notes'])
+        self.assertEqual(self.titles(due_after=timezone.localdate().isoformat()), ['Geometry proofs'])
+        self.assertEqual(self.client.get('/api/tasks/', {'status': 'done'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/tasks/', {'ordering': 'title'}).status_code, 400)
+
+    def test_facets_come_from_one_group_by(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/', {'facets': 1, 'status': 'pending',
+                                                        'group': self.groups[0].id})
+        self.assertEqual(len(response.data['results']), 2)
+        facets = response.data['facets']
+        # each facet ignores its own filter and applies the other
+        self.assertEqual(facets['status'], {'pending': 2, 'complete': 1})
+        self.assertEqual([(g['name'], g['count']) for g in facets['group']], [('Math', 2), ('Bio', 1)])
+        self.assertEqual(sum('GROUP BY' in q['sql'] for q in queries.captured_queries), 1)
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pass1234')
+        self.group = Group.objects.create(name='Admined', created_by=self.admin)
+        self.client.force_login(self.admin)
+
+    def statements(self, queries, verb, table):
+        return [q['sql'] for q in queries if q['sql'].startswith(verb) and f'"{table}"' in q['sql']]
+
+    def test_changelists_render(self):
+        start = timezone.now()
+        for i in range(10):
+            group = Group.objects.create(name=f'G{i}', created_by=self.admin)
+            session = StudySession.objects.create(group=group, title=f'S{i}', start_time=start,
+                                                  end_time=start + timedelta(hours=1))
+            Task.objects.create(session=session, created_by=self.admin, title=f'T{i}')
+        for name in ('task', 'document', 'notification', 'timersession', 'groupmembership'):
+            response = self.client.get(f'/admin/core/{name}/')
+            self.assertEqual(response.status_code, 200, name)
+        # no per-row queries for a task's session group or creator
+        with self.assertNumQueries(6):
+            self.client.get('/admin/core/task/')
+
+    def test_bulk_actions_are_single_statements(self):
+        docs = Document.objects.bulk_create([
+            Document(group=self.group, uploaded_by=self.admin, title=f'D{i}', file='documents/d.txt')
+            for i in range(3)])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/core/document/', {
+                'action': 'approve_documents', '_selected_action': [d.id for d in docs]})
+        self.assertEqual(len(self.statements(queries, 'UPDATE', 'core_document')), 1)
+        self.assertEqual(Document.objects.filter(approved=True).count(), 3)
+
+        Notification.objects.bulk_create([
+            Notification(user=self.admin, message=str(i), read_status=i % 2 == 0) for i in range(4)])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/core/notification/', {
+                'action': 'purge_read',
+                '_selected_action': list(Notification.objects.values_list('id', flat=True))})
+        self.assertEqual(len(self.statements(queries, 'DELETE', 'core_notification')), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+class ArchiveTests(TestCase):
+
+    def test_archives_old_rows_in_batches(self):
+        user = User.objects.create_user('jill', password='pass1234')
+        group = Group.objects.create(name='Old', created_by=user)
+        old = timezone.now() - timedelta(days=1000)
+        Notification.objects.bulk_create([
+            Notification(user=user, message='old read', read_status=True),
+            Notification(user=user, message='old unread'),
+            Notification(user=user, message='new read', read_status=True)])
+        Notification.objects.exclude(message='new read').update(created_at=old)
+        TimerSession.objects.create(user=user, mode='timer', duration=25, started_at=old, ended_at=old)
+        TimerSession.objects.create(user=user, mode='timer', duration=25, started_at=old)  # still running
+        quiet, busy = Document.objects.bulk_create([
+            Document(group=group, uploaded_by=user, title=title, file='documents/x.txt')
+            for title in ('quiet', 'busy')])
+        for document in (quiet, busy):
+            root = DocumentComment.objects.create(document=document, user=user, comment='root')
+            DocumentComment.objects.create(document=document, parent=root, user=user, comment='reply')
+        Document.objects.filter(pk=quiet.pk).update(last_comment_at=old)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            archiver = Archiver(output_dir, batch_size=1)
+            results = {name: archiver.run(policy(365)) for name, policy in ARCHIVE_POLICIES.items()}
+            self.assertEqual({name: total for name, (total, _) in results.items()},
+                             {'notifications': 1, 'timers': 1, 'comments': 2})
+            with gzip.open(results['comments'][1], 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertEqual([row['comment'] for row in rows], ['reply', 'root'])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(TimerSession.objects.get().ended_at, None)
+        self.assertEqual(list(DocumentComment.objects.values_list('document_id', flat=True).distinct()),
+                         [busy.id])
+        quiet.refresh_from_db()
+        self.assertEqual(quiet.comment_count, 0)
+
+    def test_thread_revived_mid_archive_keeps_its_counts(self):
+        user = User.objects.create_user('jim', password='pass1234')
+        group = Group.objects.create(name='Old', created_by=user)
+        document = Document.objects.create(group=group, uploaded_by=user, title='d', file='documents/x.txt')
+        root = DocumentComment.objects.create(document=document, user=user, comment='root')
+        DocumentComment.objects.create(document=document, parent=root, user=user, comment='old reply')
+        Document.objects.filter(pk=document.pk).update(last_comment_at=timezone.now() - timedelta(days=1000))
+
+        def new_reply(seconds):
+            # a reply between two batches brings the thread back to life
+            DocumentComment.objects.get_or_create(document=document, parent=root, user=user, comment='new reply')
+        with tempfile.TemporaryDirectory() as output_dir, \
+                mock.patch('core.archive.time.sleep', side_effect=new_reply):
+            total, _ = Archiver(output_dir, batch_size=1, pause=1).run(ARCHIVE_POLICIES['comments'](365))
+        self.assertEqual(total, 1)
+        document.refresh_from_db()
+        root.refresh_from_db()
+        self.assertEqual((document.comment_count, root.reply_count), (2, 1))
+
+
+class GroupPurgeTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.owner = User.objects.create_user('kim', password='pass1234')
+        self.member = User.objects.create_user('lee', password='pass1234')
+        self.group = Group.objects.create(name='Doomed', created_by=self.owner)
+        GroupMembership.objects.create(user=self.owner, group=self.group, role='admin')
+        GroupMembership.objects.create(user=self.member, group=self.group)
+        start = timezone.now()
+        series = StudySession.objects.create(
+            group=self.group, title='Weekly', start_time=start, end_time=start + timedelta(hours=1),
+            recurrence='FREQ=WEEKLY;COUNT=3')
+        override = StudySession.objects.create(
+            group=self.group, title='Moved', parent=series, original_start=start + timedelta(weeks=1),
+            start_time=start + timedelta(weeks=1, hours=2), end_time=start + timedelta(weeks=1, hours=3))
+        Profile.objects.create(user=self.member)
+        Task.objects.create(session=override, created_by=self.member, title='T', status='complete')
+        Worker().drain()
+        self.assertEqual(Profile.objects.get(user=self.member).completed_tasks_count, 1)
+        self.document = Document.objects.create(
+            group=self.group, uploaded_by=self.member, title='Notes',
+            file=SimpleUploadedFile('notes.txt', b'hello'))
+        root = DocumentComment.objects.create(document=self.document, user=self.member, comment='a')
+        DocumentComment.objects.create(document=self.document, parent=root, user=self.owner, comment='b')
+        self.client = APIClient()
+
+    def test_delete_hides_then_purges_in_batches(self):
+        path = self.document.file.path
+        self.client.force_authenticate(self.owner)
+        response = self.client.delete(f'/api/groups/{self.group.id}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+
+        self.client.force_authenticate(self.member)
+        self.assertNotIn(self.group.id, [g['id'] for g in self.client.get('/api/groups/').data])
+        self.assertEqual(self.client.get('/api/sessions/').data, [])
+        self.assertEqual(self.client.get('/api/documents/').data, [])
+        # only member-scoped lookups pay for the join to the group
+        self.assertFalse(GroupMembership.active.filter(group=self.group).exists())
+        self.assertTrue(GroupMembership.objects.filter(group=self.group).exists())
+        self.assertNotIn('JOIN', str(GroupMembership.objects.filter(user=self.member).query))
+
+        with mock.patch('core.job_handlers.GroupPurger',
+                        lambda group_id: GroupPurger(group_id, batch_size=1)):
+            Worker().drain()
+        self.assertFalse(Group.all_objects.filter(pk=self.group.id).exists())
+        self.assertFalse(StudySession.objects.exists() or Task.objects.exists()
+                         or DocumentComment.objects.exists() or GroupMembership.objects.exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+        # the raw task delete skips post_delete, the purge queues the recount itself
+        self.assertEqual(Profile.objects.get(user=self.member).completed_tasks_count, 0)
+
+        self.client.force_authenticate(self.owner)
+        progress = self.client.get(f'/api/groups/{self.group.id}/deletion/').data
+        self.assertEqual((progress['status'], progress['deleted_rows'], progress['deleted_files']),
+                         ('done', 8, 1))
+
+    def test_blob_claimed_by_an_upload_survives_the_purge(self):
+        path = self.document.file.path
+        digest = self.document.content_hash
+        self.assertEqual(Blob.objects.get(pk=digest).refs, 1)
+        request_deletion(self.group, self.owner)
+        # an upload of the same bytes elsewhere has found the blob but isn't saved yet
+        claim_blob(digest)
+        Worker().drain()
+        self.assertFalse(Group.all_objects.filter(pk=self.group.id).exists())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(pk=digest).refs, 1)
+
+    def test_shared_file_check_is_one_query_per_batch(self):
+        documents = [Document.objects.create(group=self.group, uploaded_by=self.member, title=f'D{i}',
+                                             file=SimpleUploadedFile(f'd{i}.txt', f'body {i}'.encode()))
+                     for i in range(5)]
+        Document.objects.filter(pk__in=[d.pk for d in documents]).delete()
+        files = {(d.file.name, d.content_hash) for d in documents}
+        with CaptureQueriesContext(connection) as queries:
+            GroupPurger(self.group.id).delete_files(files)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')
+                              and 'FROM "core_document"' in q['sql']]), 1)
+        self.assertFalse(any(os.path.exists(d.file.path) for d in documents))
+
+    def test_members_cannot_add_to_a_group_queued_for_purge(self):
+        session = StudySession.objects.filter(parent__isnull=True).get()
+        request_deletion(self.group, self.owner)
+        self.client.force_authenticate(self.member)
+        response = self.client.post('/api/tasks/', {'session': session.id, 'title': 'Late'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Task.objects.filter(title='Late').exists())
+
+    def test_only_creator_can_delete(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.delete(f'/api/groups/{self.group.id}/').status_code, 403)
+        self.assertIsNone(Group.objects.get(pk=self.group.id).deleted_at)
+
+
+class LocalObjectStore:
+    """In-process stand-in for the part of the boto3 S3 client S3Storage uses."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.buckets = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        data = Body.read() if hasattr(Body, 'read') else Body
+        self.buckets.setdefault(Bucket, {})[Key] = (data, ContentType)
+        return {}
+
+    def get_object(self, Bucket, Key):
+        try:
+            data, content_type = self.buckets.get(Bucket, {})[Key]
+        except KeyError:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data), 'ContentType': content_type}
+
+    def head_object(self, Bucket, Key):
+        return {key: value for key, value in self.get_object(Bucket, Key).items() if key != 'Body'}
+
+    def delete_object(self, Bucket, Key):
+        self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"memory://{Params['Bucket']}/{Params['Key']}"
+
+
+class DocumentStorageTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.user = User.objects.create_user('max', password='pass1234')
+        self.group = Group.objects.create(name='Files', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, data):
+        response = self.client.post('/api/documents/', {
+            'group': self.group.id, 'title': name, 'file': SimpleUploadedFile(name, data)},
+            format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Document.objects.get(pk=response.data['id'])
+
+    def test_content_addressed_upload_and_metadata(self):
+        first = self.upload('Report.PDF', b'%PDF-1.7 body')
+        second = self.upload('copy.pdf', b'%PDF-1.7 body')
+        self.assertEqual(first.file.name, second.file.name)
+        digest = first.content_hash
+        self.assertEqual(first.file.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual((first.file_size, first.file_type, first.mime_type, first.original_name),
+                         (13, 'PDF', 'application/pdf', 'Report.PDF'))
+        blobs = [f for _, _, files in os.walk(self.media.name) for f in files]
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(Blob.objects.get(pk=digest).refs, 2)
+        second.delete()
+        self.assertEqual(Blob.objects.get(pk=digest).refs, 1)
+
+        # metadata-only saves never reach the storage
+        with mock.patch.object(ContentAddressedFileSystemStorage, 'open', side_effect=AssertionError), \
+                mock.patch.object(ContentAddressedFileSystemStorage, 'size', side_effect=AssertionError):
+            response = self.client.post(f'/api/documents/{first.id}/approve/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_s3_backend_against_local_stand_in(self):
+        client = LocalObjectStore()
+        storage = S3Storage(bucket='docs', client=client)
+        name = storage.save('notes.txt', ContentFile(b'hello', name='notes.txt'))
+        self.assertEqual(storage.save('other.txt', ContentFile(b'hello')), name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(storage.open(name).read(), b'hello')
+        body = io.BytesIO(b'hello')
+        with mock.patch.object(client, 'get_object', return_value={'Body': body}):
+            self.assertIs(storage.open(name).file, body)  # streamed, not read into memory
+        self.assertEqual(storage.size(name), 5)
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+
+
+class DataExportTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name,
+                                            EXPORT_ROOT=os.path.join(self.media.name, 'exports')))
+        self.user = User.objects.create_user('nora', email='nora@example.com', password='pass1234')
+        Profile.objects.create(user=self.user, bio='Reads a lot')
+        group = Group.objects.create(name='Readers', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='admin')
+        session = StudySession.objects.create(group=group, title='Week 1', start_time=timezone.now(),
+                                              end_time=timezone.now() + timedelta(hours=1))
+        Task.objects.bulk_create([Task(session=session, created_by=self.user, title=f'Chapter {i}')
+                                  for i in range(5)])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/documents/', {'group': group.id, 'title': 'Notes',
+                                             'file': SimpleUploadedFile('notes.txt', b'page one')},
+                         format='multipart')
+
+    def test_export_builds_zip_with_progress_and_downloads(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/exports/')
+        self.assertEqual(response.status_code, 202)
+        # a second request while the first is queued returns the same export
+        self.assertEqual(self.client.post('/api/exports/').data['id'], response.data['id'])
+        url = f"/api/exports/{response.data['id']}/"
+        self.assertEqual(self.client.get(url + 'download/').status_code, 404)
+
+        Worker().drain()
+        export = self.client.get(url).data
+        self.assertEqual((export['status'], export['progress']), ('done', 1.0))
+        self.assertEqual(export['done_items'], export['total_items'])
+
+        response = self.client.get(url + 'download/')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            names = archive.namelist()
+            tasks = archive.read('tasks.jsonl').decode().splitlines()
+            profile = json.loads(archive.read('profile.json'))
+            document_file = next(name for name in names if name.startswith('documents/'))
+            self.assertEqual(archive.read(document_file), b'page one')
+        self.assertEqual(len(tasks), 5)
+        self.assertEqual(json.loads(tasks[0])['title'], 'Chapter 0')
+        self.assertEqual(profile['profile']['bio'], 'Reads a lot')
+        self.assertIn('comments.jsonl', names)
+
+        with override_settings(EXPORT_ACCEL_REDIRECT='/protected/exports/'):
+            response = self.client.get(url + 'download/')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f"/protected/exports/{DataExport.objects.get().file_name}")
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('otto', password='pass1234'))
+        self.assertEqual(other.get(url + 'download/').status_code, 404)
+
+        path = os.path.join(self.media.name, 'exports', DataExport.objects.get().file_name)
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_export_without_a_live_job_can_be_requested_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/exports/').data['id']
+        # the worker gave up on it (or the job row was lost) with the export still running
+        DataExport.objects.filter(pk=first).update(status='running')
+        Job.objects.filter(name='exports.build').update(status='failed')
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.post('/api/exports/').data['id']
+        self.assertNotEqual(second, first)
+        self.assertEqual(DataExport.objects.get(pk=first).status, 'failed')
+        Worker().drain()
+        self.assertEqual(DataExport.objects.get(pk=second).status, 'done')
+
+    def test_long_export_keeps_its_job_lock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/exports/')
+        write_files = Exporter.write_files
+
+        def slow_write_files(exporter, archive):
+            # the export has been running for longer than the lock lasts
+            Job.objects.filter(name='exports.build').update(locked_at=timezone.now() - timedelta(hours=1))
+            write_files(exporter, archive)
+            self.assertEqual(Worker().requeue_stale(), 0)
+
+        with mock.patch('core.jobs.HEARTBEAT_INTERVAL', 0), \
+                mock.patch.object(Exporter, 'write_files', slow_write_files):
+            Worker().drain()
+        self.assertEqual(DataExport.objects.get().status, 'done')
+        self.assertEqual(Job.objects.get(name='exports.build').attempts, 1)
+
+
+def make_pdf(pages):
+    """Minimal PDF with one Flate-compressed content stream per page."""
+    import zlib
+    objects, kids = [], []
+    for i, text in enumerate(pages):
+        page, stream = 3 + 2 * i, 4 + 2 * i
+        content = zlib.compress(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+        objects.append(f"{stream} 0 obj\n<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode()
+                       + content + b"\nendstream\nendobj\n")
+        objects.append(f"{page} 0 obj\n<< /Type /Page /Parent 2 0 R /Contents {stream} 0 R >>\nendobj\n".encode())
+        kids.append(f"{page} 0 R")
+    return (b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+            + f"2 0 obj\n<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>\nendobj\n".encode()
+            + b"".join(objects) + b"trailer\n<< /Root 1 0 R >>\n%%EOF\n")
+
+
+class DocumentTextTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name, EXTRACTION_PROCESSES=0))
+        self.user = User.objects.create_user('tex', password='pass1234')
+        self.group = Group.objects.create(name='Texts', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, data, title):
+        response = self.client.post('/api/documents/', {
+            'group': self.group.id, 'title': title, 'file': SimpleUploadedFile(name, data)},
+            format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(Job.objects.filter(name='documents.extract_text',
+                                           payload__document_id=response.data['id']).exists())
+        extract_document_text(response.data['id'])
+        return Document.objects.get(pk=response.data['id'])
+
+    def test_extractors(self):
+        self.assertEqual(extract(make_pdf(['Cell \\(biology\\)', 'Mitosis']), 'a.pdf', 'application/pdf'),
+                         ('Cell (biology)\n\nMitosis', [0, 16]))
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as docx:
+            docx.writestr('word/document.xml', (
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+                '<w:p><w:r><w:t>Intro</w:t></w:r></w:p>'
+                '<w:p><w:r><w:t>Before</w:t><w:br w:type="page"/><w:t>After</w:t></w:r></w:p>'
+                '</w:body></w:document>'))
+        self.assertEqual(extract(archive.getvalue(), 'notes.docx'), ('Intro\nBefore\n\nAfter', [0, 14]))
+        self.assertEqual(extract(b'one\x0ctwo  words', 'a.txt', 'text/plain'), ('one\n\ntwo words', [0, 5]))
+        self.assertEqual(extract(b'\x00\x01', 'a.bin'), ('', []))
+        # the real pool runs the same function in another process
+        self.assertEqual(run_in_pool(1, 60, b'pooled text', 'a.txt', 'text/plain', 6), ('pooled', [0], True))
+        reset_pool()  # kills the processes; the next call starts a new pool
+        self.assertEqual(run_in_pool(1, 60, b'again', 'a.txt', 'text/plain', 10), ('again', [0], False))
+        reset_pool()
+
+    def test_search_with_pages_and_excerpts(self):
+        biology = self.upload('bio.pdf', make_pdf(['Cells divide', 'Mitosis has four phases']), 'Biology notes')
+        self.upload('chem.txt', b'Atoms and molecules', 'Chemistry')
+        text = biology.extracted_text
+        self.assertEqual(text.content_hash, biology.content_hash)
+        self.assertEqual(text.page_offsets, [0, 14])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/documents/search/', {'q': 'mitosis pha'})
+        self.assertEqual(response.status_code, 200)
+        # the prefix is a range the term index can serve, not a LIKE
+        self.assertFalse([q['sql'] for q in queries if 'core_documentterm' in q['sql'] and ' LIKE ' in q['sql']])
+        (hit,) = response.data
+        self.assertEqual((hit['id'], hit['page'], hit['excerpt']), (biology.id, 2, 'Cells divide Mitosis has four phases'))
+        # title words rank first
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'chemistry'}).data[0]['title'], 'Chemistry')
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'the'}).data, [])
+
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user('out', password='pass1234'))
+        self.assertEqual(outsider.get('/api/documents/search/', {'q': 'mitosis'}).data, [])
+
+    def test_unchanged_content_is_not_extracted_again(self):
+        first = self.upload('a.txt', b'Photosynthesis in plants', 'Plants')
+        with mock.patch('core.job_handlers.run_in_pool', side_effect=AssertionError):
+            extract_document_text(first.id)
+            # same bytes under another document: the stored text is reused
+            copy = self.upload('b.txt', b'Photosynthesis in plants', 'Copy')
+            self.client.patch(f'/api/documents/{copy.id}/', {'title': 'Leaves'}, format='multipart')
+            extract_document_text(copy.id, reindex=True)
+        self.assertEqual(copy.extracted_text.text, 'Photosynthesis in plants')
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'leaves'}).data[0]['id'], copy.id)
+
+    def test_timed_out_extraction_is_retried(self):
+        def slow(*args):
+            time.sleep(5)
+        with mock.patch('core.extraction.extract_limited', side_effect=slow):
+            started = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                extract_timed(0.2, b'x', 'a.txt', 'text/plain', 10)
+            self.assertLess(time.monotonic() - started, 2)
+
+        with mock.patch('core.job_handlers.run_in_pool', side_effect=TimeoutError), \
+                self.assertLogs('core.job_handlers', 'WARNING'):
+            response = self.client.post('/api/documents/', {
+                'group': self.group.id, 'title': 'Slow', 'file': SimpleUploadedFile('s.txt', b'Enzymes')},
+                format='multipart')
+            with self.assertRaises(TimeoutError):
+                extract_document_text(response.data['id'])
+        self.assertEqual(DocumentText.objects.get(document_id=response.data['id']).content_hash, '')
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'slow'}).data[0]['id'], response.data['id'])
+        # the next attempt extracts the text
+        extract_document_text(response.data['id'])
+        self.assertEqual(self.client.get('/api/documents/search/', {'q': 'enzymes'}).data[0]['id'], response.data['id'])
+
+
+class SeedLoadTests(TestCase):
+
+    def test_seed_is_reproducible_and_consistent(self):
+        counts = Seeder(users=30, groups=5, seed=7, chunk_size=50).run()
+        self.assertEqual(counts['User'], 30)
+        self.assertEqual(counts['Profile'], 30)
+        self.assertEqual(GroupMembership.objects.count(), counts['GroupMembership'])
+        # every group has its creator as admin, and comment trees are well formed
+        for group in Group.objects.all():
+            self.assertTrue(group.memberships.filter(user=group.created_by, role='admin').exists())
+        for comment in DocumentComment.objects.select_related('parent'):
+            prefix = comment.parent.path if comment.parent_id else ''
+            self.assertEqual(comment.path, f"{prefix}{comment.pk:010d}/")
+        document = Document.objects.order_by('-comment_count').first()
+        self.assertEqual(document.comment_count, document.comments.count())
+
+        again = Seeder(users=30, groups=5, seed=7, chunk_size=50, prefix='again').run()
+        self.assertEqual(again, counts)
+
+    def test_load_test_report(self):
+        Seeder(users=5, groups=2, seed=1).run()
+        users = [VirtualUser(user) for user in User.objects.all()]
+        transport = InProcessTransport()
+        user = next(u for u in users if u.ids['group'])
+        self.assertEqual(transport.request('GET', '/api/dashboard/', user.token), 200)
+        self.assertEqual(transport.request('GET', '/api/dashboard/', 'bad-token'), 401)
+
+        class FakeTransport:
+            def request(self, method, path, token, body=None):
+                return 500 if 'tasks' in path else 200
+
+            def close(self):
+                pass
+
+        mix = (Endpoint('dashboard', 'GET', '/api/dashboard/', 3), Endpoint('tasks', 'GET', '/api/tasks/', 1))
+        report = LoadTest(FakeTransport(), users, mix=mix, concurrency=2, requests=40).run().as_dict()
+        self.assertEqual(report['requests'], 40)
+        self.assertEqual(report['errors'], report['endpoints']['tasks']['requests'])
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
+
+        baseline = {'endpoints': {'dashboard': {'p95': 10.0}, 'tasks': {'p95': 10.0}}}
+        current = {'endpoints': {'dashboard': {'p95': 12.5}, 'tasks': {'p95': 11.0}}}
+        self.assertEqual(regressions(current, baseline, tolerance=0.2), [('dashboard', 10.0, 12.5)])
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('quinn', password='pass1234')
+        self.group = Group.objects.create(name='Busy', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sliding_window_and_cache_fallback(self):
+        self.assertEqual(parse_rate('500MB/hour'), (500 * 1024 ** 2, 3600))
+        self.assertEqual(parse_rate('20/10s'), (20, 10))
+        now = [1000.0]
+        window = SlidingWindow(clock=lambda: now[0])
+        self.assertEqual([window.hit('k', 3, 10)[0] for _ in range(4)], [True, True, True, False])
+        allowed, remaining, retry_after = window.hit('k', 3, 10)
+        self.assertEqual((allowed, remaining, retry_after), (False, 0, 14))
+        # halfway into the next window half of the old hits still count
+        now[0] = 1015.0
+        self.assertEqual([window.hit('k', 3, 10)[0] for _ in range(2)], [True, False])
+
+        # with the cache down the limit still holds, counted in the process
+        window = SlidingWindow(clock=lambda: 2000.0)
+        with mock.patch.object(cache, 'incr', side_effect=ConnectionError), \
+                self.assertLogs('core.throttling', 'WARNING') as logs:
+            results = [window.hit('k', 2, 10)[0] for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(len(logs.records), 1)
+
+    def test_per_process_cache_fails_the_deploy_check(self):
+        self.assertEqual([error.id for error in check_throttle_cache()], ['core.E001'])
+        errors = checks.run_checks(include_deployment_checks=True, tags=[checks.Tags.caches])
+        self.assertIn('core.E001', [error.id for error in errors])
+        # ordinary commands (migrate, runserver's check) don't run it
+        self.assertNotIn('core.E001', [error.id for error in checks.run_checks()])
+
+    @override_settings(REST_FRAMEWORK={
+        'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
+        'DEFAULT_THROTTLE_CLASSES': ('core.throttling.UploadBytesThrottle',
+                                     'core.throttling.EndpointRateThrottle',
+                                     'core.throttling.GroupRateThrottle'),
+        'DEFAULT_THROTTLE_RATES': {'read': '100/min', 'write': '100/min', 'session.write': '2/min',
+                                   'upload_bytes': '1KB/hour'},
+    })
+    def test_scoped_limits_and_headers(self):
+        response = self.client.get('/api/groups/')
+        self.assertEqual((response['X-RateLimit-Limit'], response['X-RateLimit-Remaining']), ('100', '99'))
+
+        start = timezone.now()
+        payload = {'group': self.group.id, 'title': 'Sprint', 'start_time': start.isoformat(),
+                   'end_time': (start + timedelta(hours=1)).isoformat()}
+        codes = [self.client.post('/api/sessions/', payload, format='json').status_code for _ in range(3)]
+        self.assertEqual(codes, [201, 201, 429])
+        response = self.client.post('/api/sessions/', payload, format='json')
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(response['X-RateLimit-Scope'], 'session.write')
+        # other endpoints keep their own budget
+        self.assertEqual(self.client.get('/api/groups/').status_code, 200)
+        # refused session posts gave their overall write hits back: 2 used, this is the 3rd
+        self.assertEqual(self.client.post('/api/tasks/', {}, format='json')['X-RateLimit-Remaining'], '97')
+        with override_settings(THROTTLE_DISABLED=True):
+            self.assertEqual(self.client.post('/api/sessions/', payload, format='json').status_code, 201)
+
+        upload = SimpleUploadedFile('big.txt', b'x' * 2048)
+        with mock.patch('rest_framework.parsers.MultiPartParser.parse', side_effect=AssertionError):
+            response = self.client.post('/api/documents/', {'group': self.group.id, 'title': 'Big',
+                                                            'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['X-RateLimit-Scope'], 'upload_bytes')
+
+
+    @override_settings(REST_FRAMEWORK={
+        'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
+        'DEFAULT_THROTTLE_CLASSES': ('core.throttling.EndpointRateThrottle',
+                                     'core.throttling.GroupRateThrottle'),
+        'DEFAULT_THROTTLE_RATES': {'read': '100/min', 'write': '100/min', 'group.write': '2/min'},
+    })
+    def test_refusal_refunds_hits_of_other_throttles(self):
+        start = timezone.now()
+        payload = {'group': self.group.id, 'title': 'Sprint', 'start_time': start.isoformat(),
+                   'end_time': (start + timedelta(hours=1)).isoformat()}
+        codes = [self.client.post('/api/sessions/', payload, format='json').status_code for _ in range(4)]
+        self.assertEqual(codes, [201, 201, 429, 429])
+        # EndpointRateThrottle counted the refused posts before GroupRateThrottle said no
+        self.assertEqual(self.client.post('/api/tasks/', {}, format='json')['X-RateLimit-Remaining'], '97')
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        request_metrics.registry.clear()
+        self.user = User.objects.create_user('mia', password='pass1234')
+        group = Group.objects.create(name='Metrics', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_prometheus_text(self):
+        # outside DEBUG, only staff see Server-Timing
+        self.assertNotIn('Server-Timing', self.client.get('/api/groups/my-groups/'))
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.user.is_staff = True
+        response = self.client.get('/api/groups/my-groups/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertRegex(timing, r'ser;dur=[0-9.]*[1-9]')  # the rendering after the view
+
+        # without a token /metrics is only open in DEBUG
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            text = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE vsg_request_duration_seconds histogram', text)
+        self.assertIn('vsg_request_duration_seconds_count{route="group-my-groups",method="GET"} 2', text)
+        self.assertIn('vsg_responses_total{route="group-my-groups",method="GET",status="200"} 2', text)
+        self.assertIn('vsg_request_queries_bucket{route="group-my-groups",method="GET",le="+Inf"} 2', text)
+
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_cache_hits_and_serializer_time_are_counted(self):
+        from django.core.cache import cache
+
+        metrics, token = request_metrics.start_request()
+        try:
+            self.assertIsNone(request_metrics.cache_get(cache, 'metrics-test'))
+            cache.set('metrics-test', 1)
+            self.assertEqual(request_metrics.cache_get(cache, 'metrics-test'), 1)
+            GroupLeanSerializer(Group.objects.all()).data
+        finally:
+            request_metrics.end_request(token)
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (1, 1))
+        self.assertGreater(metrics.serializer_time, 0)
+        self.assertEqual(metrics.serializer_depth, 0)
+        # third-party classes are left alone
+        from rest_framework import serializers as drf_serializers
+        self.assertFalse(hasattr(drf_serializers.Serializer.data.fget, '__wrapped__'))
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.user = User.objects.create_user('pia', password='pass1234')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_profile_on_privileged_header(self):
+        for fmt in ('collapsed', 'pstats'):
+            with override_settings(PROFILE_TOKEN='let-me', PROFILE_DIR=self.dir.name, PROFILE_FORMAT=fmt):
+                client = APIClient()
+                self.assertNotIn('X-Profile-File', client.get('/api/groups/', **self.auth))
+                self.assertNotIn('X-Profile-File', client.get('/api/groups/', HTTP_X_PROFILE='nope', **self.auth))
+                response = client.get('/api/groups/', HTTP_X_PROFILE='let-me', **self.auth)
+            self.assertEqual(response.status_code, 200)
+            name = response['X-Profile-File']
+            self.assertRegex(name, rf'-GET-group-list-\d+ms\.{fmt}$')
+            self.assertTrue(os.path.exists(os.path.join(self.dir.name, name)))
+
+    def test_stack_sampler_collapses_stacks(self):
+        import threading
+        sampler = StackSampler(threading.get_ident())
+        sampler.sample()
+        sampler.sample()
+        (stack, count), = sampler.counts.items()
+        self.assertEqual(count, 2)
+        self.assertTrue(stack.endswith('core.tests:test_stack_sampler_collapses_stacks;core.profiling:sample'))
+        self.assertEqual(sampler.collapsed(), f"{stack} 2\n")
+
+    def test_slow_query_log_names_the_origin(self):
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs, \
+                connection.execute_wrapper(SlowQueryLogger(0)):
+            list(Group.objects.filter(name='slow'))
+        record = logs.records[0]
+        self.assertIn('core.tests:test_slow_query_log_names_the_origin', record.origin)
+        self.assertIn('"core_group"', record.sql)
+        self.assertIn('params=<hidden>', record.getMessage())
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs, \
+                connection.execute_wrapper(SlowQueryLogger(0, log_params=True)):
+            list(Group.objects.filter(name='slow'))
+        self.assertIn("('slow',", logs.records[0].getMessage())
+
+
+class StartupTests(TestCase):
+
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     django.utils.version\n"
+            "import time:       300 |        420 |   django.utils\n"
+            "import time:      1000 |       1420 | django\n"
+            "import time:        50 |         50 | core.startup\n"
+        )
+        rows = startup.parse_importtime(stderr)
+        self.assertEqual(rows[0], ('django.utils.version', 120, 120, 2))
+        self.assertEqual(rows[2], ('django', 1000, 1420, 0))
+        self.assertEqual(startup.by_package(rows), {'django': 1420, 'core': 50})
+        self.assertEqual(
+            startup.regressions({'import_ms': 130, 'boot_ms': 100, 'rss_kb': 1000},
+                                {'import_ms': 100, 'boot_ms': 100, 'rss_kb': 1000}),
+            [('import_ms', 100, 130)])
+
+    def test_warm_up_populates_resolver(self):
+        from django.urls import get_resolver
+
+        with mock.patch.object(startup, 'connections') as connections:
+            startup.warm_up(freeze=False)
+        connections.close_all.assert_called_once_with()
+        self.assertTrue(get_resolver()._populated)
+
+
+class CompressionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware(lambda request: None)
+
+    def test_accepted_encodings_drops_q_zero(self):
+        self.assertEqual(accepted_encodings('gzip;q=0, br, deflate;q=0.5'), {'br', 'deflate'})
+
+    def test_gzips_json(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        body = b'{"a":"' + b'x' * 1000 + b'"}'
+        response = self.middleware.process_response(
+            request, HttpResponse(body, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_skips_compressed_media(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        body = b'\x89PNG' + b'x' * 1000
+        response = self.middleware.process_response(
+            request, HttpResponse(body, content_type='image/png'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+
+
+class AgendaTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('carol', password='pass1234')
+        self.group = Group.objects.create(name='Maths, Physics', created_by=self.user)
+        self.other = Group.objects.create(name='Other', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        GroupMembership.objects.create(user=self.user, group=self.other, role='admin')
+        self.base = timezone.make_aware(datetime(2030, 1, 7, 9))
+        self.a = self.session(self.group, 'A', 0, 2)
+        self.b = self.session(self.other, 'B', 1, 3)    # overlaps A
+        self.c = self.session(self.group, 'C', 3, 4)    # touches B only
+        self.session(self.group, 'Outside', 48, 49)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def session(self, group, title, start_hours, end_hours):
+        return StudySession.objects.create(
+            group=group, title=title,
+            start_time=self.base + timedelta(hours=start_hours),
+            end_time=self.base + timedelta(hours=end_hours))
+
+    def test_find_conflicts(self):
+        self.assertEqual(find_conflicts([(1, 0, 10), (2, 5, 15), (3, 10, 20), (4, 12, 13)]),
+                         [(1, 2), (2, 3), (2, 4), (3, 4)])
+
+    def test_agenda_window_and_conflicts(self):
+        response = self.client.get('/api/sessions/agenda/', {
+            'from': self.base.isoformat(), 'to': (self.base + timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['title'] for s in response.data['sessions']], ['A', 'B', 'C'])
+        self.assertEqual(response.data['conflicts'], [[self.a.id, self.b.id]])
+
+    def test_agenda_rejects_bad_window(self):
+        response = self.client.get('/api/sessions/agenda/', {'from': '2030-01-02', 'to': '2030-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ics_feed_and_invalidation(self):
+        params = {'from': '2030-01-01', 'to': '2030-02-01'}
+        body = b''.join(self.client.get('/api/sessions/agenda/ics/', params).streaming_content)
+        self.assertTrue(body.startswith(b'BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count(b'BEGIN:VEVENT'), 4)
+        self.assertIn(b'CATEGORIES:Maths\\, Physics', body)
+
+        self.a.title = 'Renamed'
+        self.a.save()
+        body = b''.join(self.client.get('/api/sessions/agenda/ics/', params).streaming_content)
+        self.assertIn(b'SUMMARY:Renamed', body)
+
+        # the version is on the group row, and saving a stale group can't roll it back
+        group = Group.objects.get(pk=self.a.group_id)
+        version = group.agenda_version
+        self.a.save()
+        group.save()
+        self.assertEqual(Group.objects.get(pk=group.pk).agenda_version, version + 2)
+
+
+class RecurrenceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dave', password='pass1234')
+        self.group = Group.objects.create(name='Weekly', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='admin')
+        self.start = timezone.make_aware(datetime(2030, 1, 7, 19))  # a Monday
+        self.series = StudySession.objects.create(
+            group=self.group, title='Weekly', recurrence='FREQ=WEEKLY',
+            start_time=self.start, end_time=self.start + timedelta(hours=1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_expand_only_the_window(self):
+        rule = parse_rule('FREQ=WEEKLY;BYDAY=MO,TH;COUNT=5')
+        starts = expand(rule, self.start, timedelta(hours=1),
+                        self.start + timedelta(days=7), self.start + timedelta(days=365))
+        self.assertEqual([s.date() for s in starts],
+                         [date(2030, 1, 14), date(2030, 1, 17), date(2030, 1, 21)])
+        self.assertEqual(series_end(rule, self.start, timedelta(hours=1)).date(), date(2030, 1, 21))
+
+    def test_monthly_skips_missing_days(self):
+        start = timezone.make_aware(datetime(2030, 1, 31, 10))
+        starts = expand(parse_rule('FREQ=MONTHLY;COUNT=3'), start, timedelta(hours=1),
+                        start, start + timedelta(days=200))
+        self.assertEqual([s.month for s in starts], [1, 3, 5])
+
+    def test_invalid_rule_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_rule('FREQ=YEARLY')
+        response = self.client.post('/api/sessions/', {
+            'group': self.group.id, 'title': 'x', 'recurrence': 'FREQ=DAILY;BYDAY=MO',
+            'start_time': self.start.isoformat(),
+            'end_time': (self.start + timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_year_of_weekly_occurrences(self):
+        response = self.client.get(f'/api/sessions/{self.series.id}/occurrences/', {
+            'from': '2030-01-01', 'to': '2030-12-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['sessions']), 52)
+        self.assertEqual(StudySession.objects.count(), 1)
+
+    def test_task_materializes_occurrence_once(self):
+        occurrence = self.start + timedelta(weeks=3)
+        for title in ('one', 'two'):
+            response = self.client.post('/api/tasks/', {
+                'session': self.series.id, 'title': title,
+                'occurrence_start': occurrence.isoformat()})
+            self.assertEqual(response.status_code, 201)
+        override = StudySession.objects.get(parent=self.series)
+        self.assertEqual(override.start_time, occurrence)
+        self.assertEqual(override.tasks.count(), 2)
+
+        response = self.client.get('/api/sessions/agenda/', {
+            'from': (occurrence - timedelta(days=1)).isoformat(),
+            'to': (occurrence + timedelta(days=1)).isoformat()})
+        self.assertEqual([(s['id'], s['tasks_count']) for s in response.data['sessions']],
+                         [(override.id, 2)])
+
+    def test_expansion_cache_ignores_time_of_day(self):
+        cache.clear()
+        now = self.start + timedelta(days=6, hours=3, microseconds=17)
+        with mock.patch('core.recurrence.expand', wraps=expand) as expanded:
+            for offset in (0, 1, 2):
+                window_start = now + timedelta(seconds=offset)
+                starts = occurrences(self.series.id, self.series.recurrence, self.series.start_time,
+                                     self.series.end_time, window_start, window_start + timedelta(days=7))
+                self.assertEqual(starts, [self.start + timedelta(weeks=1)])
+        self.assertEqual(expanded.call_count, 1)
+
+    def test_first_occurrence_counts_series_tasks(self):
+        response = self.client.post('/api/tasks/', {
+            'session': self.series.id, 'title': 'prep',
+            'occurrence_start': self.start.isoformat()})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.series.tasks.count(), 1)
+        self.assertFalse(StudySession.objects.filter(parent=self.series).exists())
+
+        response = self.client.get(f'/api/sessions/{self.series.id}/occurrences/', {
+            'from': '2030-01-01', 'to': '2030-01-20'})
+        self.assertEqual([s['tasks_count'] for s in response.data['sessions']], [1, 0])
+
+    def test_rule_change_reanchors_or_drops_overrides(self):
+        for weeks in (1, 2):
+            materialize(self.series, self.start + timedelta(weeks=weeks))
+        # one day later and every other week: week 2 still lines up, week 1 doesn't
+        self.series.start_time += timedelta(days=1)
+        self.series.end_time += timedelta(days=1)
+        self.series.recurrence = 'FREQ=WEEKLY;INTERVAL=2'
+        self.series.save()
+        override = StudySession.objects.get(parent=self.series)
+        self.assertEqual(override.original_start, self.start + timedelta(weeks=2, days=1))
+        self.assertEqual(override.start_time, override.original_start)
+
+        self.series.recurrence = ''
+        self.series.save()
+        self.assertFalse(StudySession.objects.filter(parent=self.series).exists())
+
+    def test_task_rejects_non_occurrence(self):
+        response = self.client.post('/api/tasks/', {
+            'session': self.series.id, 'title': 'x',
+            'occurrence_start': (self.start + timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReminderSchedulerTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('erin', password='pass1234')
+        member = User.objects.create_user('frank', password='pass1234')
+        group = Group.objects.create(name='Reminders', created_by=owner)
+        GroupMembership.objects.create(user=owner, group=group, role='admin')
+        GroupMembership.objects.create(user=member, group=group)
+        self.now = timezone.make_aware(datetime(2030, 3, 1, 12))
+        StudySession.objects.create(
+            group=group, title='Single', start_time=self.now + timedelta(minutes=30),
+            end_time=self.now + timedelta(minutes=90))
+        StudySession.objects.create(
+            group=group, title='Daily', recurrence='FREQ=DAILY;COUNT=3',
+            start_time=self.now + timedelta(hours=2), end_time=self.now + timedelta(hours=3))
+
+    def scheduler(self):
+        return ReminderScheduler(offsets=[timedelta(minutes=15)], clock=lambda: self.now)
+
+    def test_sends_each_reminder_once_across_restarts(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.run_due(), 0)
+
+        self.now += timedelta(minutes=16)        # 'Single' is 14 minutes away
+        self.assertEqual(scheduler.run_due(), 2)
+        self.assertEqual(scheduler.run_due(), 0)
+
+        restarted = self.scheduler()             # fresh heap, same watermark
+        self.assertEqual(restarted.run_due(), 0)
+        self.now += timedelta(hours=1, minutes=30)  # first 'Daily' occurrence
+        self.assertEqual(restarted.run_due(), 2)
+
+        self.now += timedelta(days=1)            # second occurrence, reloaded lazily
+        self.assertEqual(self.scheduler().run_due(), 2)
+        self.assertEqual(Notification.objects.filter(type='session_reminder').count(), 6)
+        self.assertTrue(Notification.objects.filter(message="'Daily' starts in 15 minutes.").exists())
+
+    def test_changes_after_loading_are_respected(self):
+        scheduler = self.scheduler()
+        scheduler.lookahead = timedelta(hours=3)  # everything below is on the heap already
+        self.assertEqual(scheduler.run_due(), 0)
+        single = StudySession.objects.get(title='Single')
+        daily = StudySession.objects.get(title='Daily')
+        single.title, single.start_time = 'Moved', single.start_time + timedelta(minutes=30)
+        single.save()
+        StudySession.objects.create(group=daily.group, title='Moved day 1', parent=daily,
+                                    original_start=daily.start_time, start_time=self.now + timedelta(days=1),
+                                    end_time=self.now + timedelta(days=1, hours=1))
+
+        self.now += timedelta(minutes=16)        # the old 'Single' fire time
+        self.assertEqual(scheduler.run_due(), 0)
+        self.now += timedelta(minutes=30)        # the new one
+        self.assertEqual(scheduler.run_due(), 2)
+        self.assertTrue(Notification.objects.filter(message="'Moved' starts in 15 minutes.").exists())
+        self.now += timedelta(hours=1)           # first 'Daily' occurrence was overridden
+        self.assertEqual(scheduler.run_due(), 0)
+        scheduler.lookahead = timedelta(days=2)
+        self.assertEqual(scheduler.run_due(), 0)  # loads the later occurrences
+        StudySession.objects.filter(parent=daily).delete()
+        daily.delete()
+        self.now += timedelta(days=1)
+        self.assertEqual(scheduler.run_due(), 0)
+        self.assertEqual(Notification.objects.filter(type='session_reminder').count(), 2)
+
+
+calls = []
+
+
+@job('tests.flaky')
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_dedupe_key_keeps_one_queued_job(self):
+        first = enqueue('tests.flaky', {'fail_times': 0}, dedupe_key='k')
+        second = enqueue('tests.flaky', {'fail_times': 0}, dedupe_key='k')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Worker().drain(), 1)
+        # once it ran, the same key can be queued again
+        self.assertNotEqual(enqueue('tests.flaky', {'fail_times': 0}, dedupe_key='k').id, first.id)
+
+    def test_retries_with_backoff_then_fails(self):
+        queued = enqueue('tests.flaky', {'fail_times': 5}, max_attempts=2)
+        worker = Worker()
+        with self.assertLogs('core.jobs', 'ERROR'):
+            worker.run_once()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertEqual(worker.run_once(), 0)      # not due yet
+
+        Job.objects.filter(id=queued.id).update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            worker.run_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'failed')
+        self.assertIn('boom', queued.last_error)
+
+    def test_job_claimed_by_one_worker_only(self):
+        enqueue('tests.flaky', {'fail_times': 0})
+        self.assertEqual(len(Worker(name='a').claim()), 1)
+        self.assertEqual(Worker(name='b').claim(), [])
+
+    def test_unknown_job_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.missing')
+
+    def test_task_completion_recounts_profile(self):
+        user = User.objects.create_user('gina', password='pass1234')
+        Profile.objects.create(user=user)
+        group = Group.objects.create(name='G', created_by=user)
+        now = timezone.now()
+        session = StudySession.objects.create(group=group, title='S', start_time=now,
+                                              end_time=now + timedelta(hours=1))
+        task = Task.objects.create(session=session, created_by=user, title='T')
+        task.status = 'complete'
+        task.save()
+        Task.objects.create(session=session, created_by=user, title='U', status='complete')
+        self.assertEqual(Job.objects.filter(status='queued').count(), 1)
+        Worker().drain()
+        self.assertEqual(Profile.objects.get(user=user).completed_tasks_count, 2)
+
+    def test_upload_enqueues_metadata_and_notification(self):
+        admin = User.objects.create_user('hank', password='pass1234')
+        member = User.objects.create_user('ivy', password='pass1234')
+        group = Group.objects.create(name='Docs', created_by=admin)
+        GroupMembership.objects.create(user=admin, group=group, role='admin')
+        GroupMembership.objects.create(user=member, group=group)
+        client = APIClient()
+        client.force_authenticate(member)
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = client.post('/api/documents/', {
+                'group': group.id, 'title': 'Notes',
+                'file': SimpleUploadedFile('notes.txt', b'hello world')}, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(Notification.objects.exists())
+            Worker().drain()
+        document = Document.objects.get()
+        self.assertEqual((document.file_size, document.file_type), (11, 'txt'))
+        self.assertEqual(Notification.objects.get().user, admin)
+
+
+class PresenceTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('pres-alice', password='pass1234')
+        self.bob = User.objects.create_user('pres-bob', password='pass1234')
+        self.group = Group.objects.create(name='Live', created_by=self.alice)
+        GroupMembership.objects.create(user=self.alice, group=self.group, role='admin')
+        GroupMembership.objects.create(user=self.bob, group=self.group)
+        self.layer = InMemoryChannelLayer()
+        self.clock = [0.0]
+        self.roster = Roster(timeout=30, clock=lambda: self.clock[0])
+        self.app = PresenceApplication(layer=self.layer, roster=self.roster, sweep_interval=3600)
+
+    def connect(self, user):
+        token = str(AccessToken.for_user(user))
+        return ApplicationCommunicator(self.app, {
+            'type': 'websocket', 'path': '/ws/presence/',
+            'query_string': f'token={token}'.encode()})
+
+    async def receive_json(self, communicator):
+        message = await communicator.receive_output(timeout=2)
+        return json.loads(message['text'])
+
+    def test_roster_presence_and_timer_broadcast(self):
+        async def scenario():
+            alice = self.connect(self.alice)
+            await alice.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await alice.receive_output(timeout=2))['type'], 'websocket.accept')
+            roster = await self.receive_json(alice)
+            self.assertEqual(roster['members'], [{'user_id': self.alice.id, 'username': 'pres-alice'}])
+            await self.receive_json(alice)  # her own 'online' event
+
+            bob = self.connect(self.bob)
+            await bob.send_input({'type': 'websocket.connect'})
+            await bob.receive_output(timeout=2)
+            self.assertEqual(len((await self.receive_json(bob))['members']), 2)
+            await self.receive_json(bob)  # his own 'online' event
+            online = await self.receive_json(alice)
+            self.assertEqual((online['type'], online['state'], online['user_id']),
+                             ('presence', 'online', self.bob.id))
+
+            await publish_timer_event_async(self.bob.id, 'pres-bob', [self.group.id], 'pause',
+                                            {'id': 1, 'paused_at': 'now'}, layer=self.layer)
+            timer = await self.receive_json(alice)
+            self.assertEqual((timer['type'], timer['event'], timer['timer']),
+                             ('timer', 'pause', {'id': 1, 'paused_at': 'now'}))
+            self.assertEqual((await self.receive_json(bob))['type'], 'timer')
+
+            # bob stops sending heartbeats, alice keeps hers up
+            self.clock[0] = 20
+            await alice.send_input({'type': 'websocket.receive', 'text': '{"type": "heartbeat"}'})
+            await asyncio.sleep(0.05)
+            self.clock[0] = 40
+            await expire_stale(self.layer, self.roster)
+            self.assertEqual(await bob.receive_output(timeout=2),
+                             {'type': 'websocket.close', 'code': 4408})
+            offline = await self.receive_json(alice)
+            self.assertEqual((offline['state'], offline['user_id']), ('offline', self.bob.id))
+
+            await alice.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await alice.wait(timeout=2)
+            await bob.wait(timeout=2)
+            self.assertEqual(self.roster.groups, {})
+            self.assertEqual(self.layer.groups, {})
+
+        async_to_sync(scenario)()
+
+    def test_socket_without_groups_still_expires(self):
+        loner = User.objects.create_user('pres-loner', password='pass1234')
+
+        async def scenario():
+            socket = self.connect(loner)
+            await socket.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await socket.receive_output(timeout=2))['type'], 'websocket.accept')
+            await asyncio.sleep(0.05)
+            self.clock[0] = 40
+            await expire_stale(self.layer, self.roster)
+            self.assertEqual(await socket.receive_output(timeout=2),
+                             {'type': 'websocket.close', 'code': 4408})
+            await socket.wait(timeout=2)
+            self.assertEqual(self.roster.sockets, {})
+
+        async_to_sync(scenario)()
+
+    def test_membership_changes_reach_open_sockets(self):
+        other = Group.objects.create(name='Other', created_by=self.alice)
+
+        def change(action):
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+
+        async def scenario():
+            bob = self.connect(self.bob)
+            await bob.send_input({'type': 'websocket.connect'})
+            await bob.receive_output(timeout=2)
+            await self.receive_json(bob)  # roster
+            await self.receive_json(bob)  # his own 'online' event
+
+            await sync_to_async(change)(lambda: GroupMembership.objects.create(user=self.bob, group=other))
+            roster = await self.receive_json(bob)
+            self.assertEqual((roster['type'], roster['group']), ('roster', other.id))
+            self.assertEqual((await self.receive_json(bob))['state'], 'online')
+            bob_channel, = self.layer.groups[f'presence.group.{other.id}']
+
+            await sync_to_async(change)(
+                lambda: GroupMembership.objects.filter(user=self.bob, group=other).delete())
+            self.assertEqual(await self.receive_json(bob), {'type': 'removed', 'group': other.id})
+            self.assertNotIn(other.id, self.roster.groups)
+
+            await sync_to_async(change)(lambda: request_deletion(self.group, self.alice))
+            self.assertEqual(await self.receive_json(bob), {'type': 'removed', 'group': self.group.id})
+            self.assertEqual(self.layer.groups, {f'presence.user.{self.bob.id}': {bob_channel}})
+
+            await bob.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await bob.wait(timeout=2)
+
+        with mock.patch('core.presence._layer', self.layer):
+            async_to_sync(scenario)()
+
+    def test_rejects_bad_token(self):
+        async def scenario():
+            communicator = ApplicationCommunicator(self.app, {
+                'type': 'websocket', 'path': '/ws/presence/', 'query_string': b'token=nope'})
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual(await communicator.receive_output(timeout=2),
+                             {'type': 'websocket.close', 'code': 4401})
+
+        async_to_sync(scenario)()
+
+
+class ORJSONRendererTests(TestCase):
+
+    def test_matches_json_renderer_for_raw_values(self):
+        data = {'at': timezone.now(), 'day': date(2025, 1, 31), 1: [None, 1.5, 'ü']}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_only_lean_views_opt_in(self):
+        self.assertIs(GroupViewSet.renderer_classes[0], ORJSONRenderer)
+        self.assertIs(GroupViewSet.parser_classes[0], ORJSONParser)
+        self.assertIs(DashboardView.renderer_classes[0], JSONRenderer)
+
+
+class ORJSONParserTests(TestCase):
+
+    def test_parses_like_json_parser(self):
+        body = '{"title": "Grüppe", "n": [1, 2.5, null, true]}'.encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)),
+                         {'title': 'Grüppe', 'n': [1, 2.5, None, True]})
+
+    def test_invalid_json_raises_parse_error(self):
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
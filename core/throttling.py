@@ -0,0 +1,259 @@
+"""
+Request throttling.
+
+Every limit is a sliding window, approximated with two fixed-window counters
+in the cache: the current window's count plus the previous window's count
+weighted by how much of it still overlaps the sliding window. That is one
+atomic add/incr and one get per limit, works the same on Redis, Memcached
+and the local-memory cache, and has no burst at window edges. When the cache
+is unreachable the counters move to a per-process LocMemCache, so limits
+still hold per worker instead of failing open or failing every request.
+
+The throttles (REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES']):
+
+- EndpointRateThrottle: separate read and write budgets per user, 'read'
+  and 'write', plus a tighter one per endpoint class (the view's
+  throttle_scope or router basename) where '<endpoint>.<read|write>' is
+  configured; anonymous clients get the 'anon' rate per IP.
+- GroupRateThrottle: writes into one group from all of its members,
+  'group.write'.
+- UploadBytesThrottle: declared request body bytes of multipart writes per
+  user, 'upload_bytes' (e.g. '500MB/hour'), checked before the body is
+  read; list it first.
+
+The counters must be shared by all workers: `manage.py check --deploy`
+reports an error (check_throttle_cache) when THROTTLE_CACHE is a
+per-process cache.
+THROTTLE_DISABLED turns every limit off, for load-test deployments driven
+by manage.py loadtest_vsg --base-url.
+
+Rates are '<n>/<period>' with an optional period multiplier ('20/10s',
+'600/min', '2GB/day'). Each check leaves its numbers on the request;
+RateLimitHeadersMiddleware (core.middleware) reports the refusing or else the
+tightest one as
+X-RateLimit-Limit, -Remaining and -Reset, and DRF adds Retry-After to 429s.
+"""
+import logging
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+SIZES = {'': 1, 'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+RATE = re.compile(r'^\s*(\d+)\s*([a-z]*)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def parse_rate(rate):
+    """(limit, window seconds) from '600/min', '20/10s' or '500MB/hour'."""
+    match = RATE.match(rate.lower())
+    if match is None or match.group(2) not in SIZES or match.group(4) not in PERIODS:
+        raise ValueError(f"Invalid throttle rate {rate!r}")
+    count, size, multiplier, period = match.groups()
+    return int(count) * SIZES[size], int(multiplier or 1) * PERIODS[period]
+
+
+class SlidingWindow:
+    """Weighted two-window counters in a cache, with a per-process fallback."""
+
+    def __init__(self, cache_alias='default', clock=time.time):
+        self.cache_alias = cache_alias
+        self.clock = clock
+        self.fallback = LocMemCache('throttle-fallback', {'OPTIONS': {'MAX_ENTRIES': 10000}})
+        self.failed_at = None
+
+    def count(self, cache, current_key, previous_key, amount, timeout):
+        cache.add(current_key, 0, timeout)
+        try:
+            current = cache.incr(current_key, amount)
+        except ValueError:  # expired between add and incr
+            cache.add(current_key, amount, timeout)
+            current = amount
+        return current, cache.get(previous_key, 0)
+
+    def keys(self, key, now, window):
+        index = int(now // window)
+        return index, f"throttle:{key}:{index}", f"throttle:{key}:{index - 1}"
+
+    def hit(self, key, limit, window, amount=1):
+        """
+        Add amount to key's window; returns (allowed, remaining, reset seconds).
+        A refused hit is taken back, so waiting out Retry-After always works.
+        """
+        now = self.clock()
+        index, current_key, previous_key = self.keys(key, now, window)
+        elapsed = now - index * window
+        cache = caches[self.cache_alias]
+        try:
+            current, previous = self.count(cache, current_key, previous_key, amount, window * 2)
+        except Exception:
+            if self.failed_at is None or now - self.failed_at > 60:
+                logger.warning("Throttle cache %r unavailable; counting per process", self.cache_alias,
+                               exc_info=True)
+            self.failed_at = now
+            cache = self.fallback
+            current, previous = self.count(cache, current_key, previous_key, amount, window * 2)
+
+        weight = 1 - elapsed / window
+        used = previous * weight + current
+        if used <= limit:
+            return True, int(limit - used), math.ceil(window - elapsed)
+        try:
+            cache.decr(current_key, amount)
+        except Exception:
+            pass
+        current -= amount
+        used = previous * weight + current
+        over = used + amount - limit
+        if amount > limit:
+            wait = window * 2 - elapsed  # never fits; report the longest honest wait
+        elif previous and over <= previous * weight:
+            # the previous window's share decays until the hit fits
+            wait = over * window / previous
+        else:
+            # next window: this window's count becomes the decaying share
+            wait = window - elapsed + window * max(0, current + amount - limit) / max(current, 1)
+        return False, max(0, int(limit - used)), max(1, math.ceil(wait))
+
+    def refund(self, key, window, amount=1):
+        """Take back an allowed hit of a request that another limit refused."""
+        _, current_key, _ = self.keys(key, self.clock(), window)
+        for cache in (caches[self.cache_alias], self.fallback):
+            try:
+                cache.decr(current_key, amount)
+                return
+            except Exception:  # unreachable, or the hit was counted in the other one
+                continue
+
+
+_window = None
+
+
+def sliding_window():
+    global _window
+    if _window is None:
+        _window = SlidingWindow(getattr(settings, 'THROTTLE_CACHE', 'default'))
+    return _window
+
+
+def check_throttle_cache(app_configs=None, **kwargs):
+    """Deploy system check (registered in CoreConfig.ready): per-worker counters multiply every limit."""
+    alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+    if isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return [checks.Error(
+            f"THROTTLE_CACHE {alias!r} is not shared between workers.",
+            hint="Configure a Redis or Memcached cache for it (e.g. set REDIS_URL).",
+            id='core.E001')]
+    return []
+
+
+def disabled():
+    return getattr(settings, 'THROTTLE_DISABLED', False)
+
+
+def endpoint_of(view):
+    return getattr(view, 'throttle_scope', None) or getattr(view, 'basename', None) or type(view).__name__
+
+
+class WindowThrottle(BaseThrottle):
+    """Checks each (scope, key, rate, amount) of checks() against its sliding window."""
+
+    def __init__(self):
+        self.retry_after = None
+
+    def checks(self, request, view):
+        raise NotImplementedError
+
+    def rate(self, scope):
+        return (api_settings.DEFAULT_THROTTLE_RATES or {}).get(scope)
+
+    def allow_request(self, request, view):
+        if disabled():
+            return True
+        raw = request._request
+        if getattr(raw, 'rate_limited', False):
+            return True  # refused by an earlier throttle; counting more would only be refunded
+        window = sliding_window()
+        states = getattr(raw, 'rate_limits', None)
+        if states is None:
+            states = raw.rate_limits = []
+        # hits counted for this request by every throttle class so far
+        counted = getattr(raw, 'throttle_hits', None)
+        if counted is None:
+            counted = raw.throttle_hits = []
+        for scope, key, rate, amount in self.checks(request, view):
+            limit, seconds = parse_rate(rate)
+            allowed, remaining, reset = window.hit(f"{scope}:{key}", limit, seconds, amount)
+            states.append((scope, limit, remaining, reset, allowed))
+            if not allowed:
+                # a refused request uses up none of its limits, whichever throttle counted them
+                for counted_key, counted_seconds, counted_amount in counted:
+                    window.refund(counted_key, counted_seconds, counted_amount)
+                counted.clear()
+                self.retry_after = reset
+                raw.rate_limited = True
+                return False
+            counted.append((f"{scope}:{key}", seconds, amount))
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class EndpointRateThrottle(WindowThrottle):
+    def checks(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            rate = self.rate('anon')
+            return [('anon', self.get_ident(request), rate, 1)] if rate else []
+        kind = 'write' if request.method in WRITE_METHODS else 'read'
+        scope = f"{endpoint_of(view)}.{kind}"
+        # the user's overall budget, then the endpoint's own if it has one
+        checks = [(kind, request.user.pk, self.rate(kind), 1),
+                  (scope, request.user.pk, self.rate(scope), 1)]
+        return [check for check in checks if check[2]]
+
+
+class GroupRateThrottle(WindowThrottle):
+    def group_id(self, request, view):
+        if getattr(view, 'basename', None) == 'group' and view.kwargs.get('pk'):
+            return view.kwargs['pk']
+        group = view.kwargs.get('group_pk') or request.query_params.get('group')
+        # an upload refused by UploadBytesThrottle (listed first) is never parsed
+        if group is None and not getattr(request._request, 'rate_limited', False):
+            data = request.data
+            group = data.get('group') if hasattr(data, 'get') else None
+        return str(group) if str(group).isdigit() else None
+
+    def checks(self, request, view):
+        if request.method not in WRITE_METHODS or not request.user or not request.user.is_authenticated:
+            return []
+        rate = self.rate('group.write')
+        group = self.group_id(request, view)
+        if rate is None or group is None:
+            return []
+        return [('group.write', group, rate, 1)]
+
+
+class UploadBytesThrottle(WindowThrottle):
+    def checks(self, request, view):
+        if (request.method not in WRITE_METHODS or not request.user or not request.user.is_authenticated
+                or not request.content_type.startswith('multipart/')):
+            return []
+        rate = self.rate('upload_bytes')
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            size = 0
+        if rate is None or not size:
+            return []
+        return [('upload_bytes', request.user.pk, rate, size)]
@@ -1,21 +1,133 @@
-from rest_framework import viewsets, generics, status, serializers
+import hmac
+import os
+
+from rest_framework import viewsets, generics, mixins, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, NotFound
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from django.db.models import Q, F, Count
 from . import models
-from .models import Profile, Group, GroupMembership, Task, Document, StudySession, TimerSession, Notification, DocumentComment
+from .models import Profile, Group, GroupMembership, Task, Document, StudySession, TimerSession, Notification, DocumentComment, DocumentText, DataExport
 from .serializers import (
     UserSerializer, ProfileSerializer, GroupSerializer,
     GroupMembershipSerializer, TaskSerializer, DocumentSerializer, DocumentCommentSerializer,
-    StudySessionSerializer, TimerSessionSerializer, NotificationSerializer
+    StudySessionSerializer, TimerSessionSerializer, NotificationSerializer,
+    GroupLeanSerializer, TaskLeanSerializer, DocumentLeanSerializer, StudySessionLeanSerializer,
+    DocumentCommentLeanSerializer, ActivityEventLeanSerializer, GroupDeletionSerializer,
+    GroupMemberLeanSerializer, DataExportSerializer
 )
+from .renderers import ORJSONRenderer, stream_json_array
+from .parsers import ORJSONParser
+from .recurrence import materialize
+from .jobs import enqueue
+from .presence import publish_timer_event
+from .agenda import parse_window, snap_to_days, agenda_rows, row_key, find_conflicts, stream_ics
 from .permissions import IsGroupAdmin
+from .pagination import OptionalCursorPagination
+from . import sync
+from . import activity
+from . import metrics
+from . import search as document_search
+from .purge import request_deletion
+from .membership_import import MemberImport, claim_invite, read_identifiers
+from .export import export_root, job_key, unfinished_export
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import BrowsableAPIRenderer
+
+# Serves list responses through a lean serializer (same JSON as serializer_class)
+# ?stream=1 streams the whole list in chunks instead of building it in memory
+# The lean endpoints opt in to orjson; everything else keeps DRF's JSON classes
+class LeanListMixin:
+    lean_serializer_class = None
+    renderer_classes = (ORJSONRenderer, BrowsableAPIRenderer)
+    parser_classes = (ORJSONParser, FormParser, MultiPartParser)
+    stream_chunk_size = 500
+
+    def wants_stream(self):
+        return self.request.query_params.get('stream') in ('1', 'true', 'yes')
+
+    def lean_response(self, queryset):
+        serializer = self.lean_serializer_class(
+            queryset, context=self.get_serializer_context())
+        if self.wants_stream():
+            return StreamingHttpResponse(
+                stream_json_array(serializer.iter_chunks(self.stream_chunk_size)),
+                content_type='application/json')
+        rows = serializer.get_rows(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_list(page))
+        return Response(serializer.to_list(rows))
+
+    def list(self, request, *args, **kwargs):
+        return self.lean_response(self.filter_queryset(self.get_queryset()))
+
+
+# Sync view
+
+
+class SyncView(APIView):
+    """
+    /api/sync/            → Full snapshot of the user's groups, sessions, tasks and documents
+    /api/sync/?since=<t>  → Only what was created, updated or deleted since token t
+    Each response carries the next token; has_more means call again right away.
+    A token older than the change log retention gets 410 and needs a full sync.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        position = None
+        since = request.query_params.get('since')
+        if since:
+            try:
+                position, issued = sync.decode_token(since)
+            except ValueError:
+                raise serializers.ValidationError({'since': 'Invalid sync token.'})
+            if sync.token_expired(issued):
+                return Response({'detail': 'Sync token expired, a full sync is required.'},
+                                status=status.HTTP_410_GONE)
+        return Response(sync.changes(request.user, position, context={'request': request}))
+
+
+class InviteClaimView(APIView):
+    """
+    /api/invites/claim/ (POST {"token"})
+    → Join the group of an emailed invite; the token works once
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        token = request.data.get('token')
+        if not token or not isinstance(token, str):
+            raise serializers.ValidationError({'token': 'This field is required.'})
+        membership = claim_invite(request.user, token)
+        if membership is None:
+            raise NotFound("This invite is invalid, used or expired.")
+        return Response({'group': membership.group_id, 'role': membership.role})
+
+
+# Metrics (plain Django view: Prometheus scrapers don't carry a JWT)
+def metrics_view(request):
+    """
+    /metrics → Per-route request histograms of this process, Prometheus text format.
+    Requires "Authorization: Bearer <METRICS_TOKEN>"; without a token only DEBUG serves it.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # User registration
 
@@ -37,11 +149,88 @@ class ProfileView(generics.RetrieveUpdateAPIView):
             user=self.request.user)
         return profile
 
+# Dashboard view
+
+
+def active_sessions(now):
+    """Single sessions not over yet, and series with an occurrence not over yet."""
+    series_active = ~Q(recurrence='') & (
+        Q(recurrence_until__isnull=True) | Q(recurrence_until__gte=now))
+    return Q(recurrence='', end_time__gte=now) | series_active
+
+
+class DashboardView(APIView):
+    """
+    /api/dashboard/
+    → Everything the home screen needs in one response: profile, groups,
+      upcoming sessions, open tasks, the newest pending approvals with
+      their total count, and the unread count.
+    The membership map is loaded once and reused by every other query.
+    """
+    permission_classes = (IsAuthenticated,)
+    SESSION_LIMIT = 10
+    TASK_LIMIT = 20
+    PENDING_LIMIT = 20
+
+    def get(self, request):
+        user = request.user
+        now = timezone.now()
+
+        # group_id -> role
+        roles = dict(GroupMembership.active.filter(
+            user=user).values_list('group_id', 'role'))
+        admin_group_ids = [gid for gid, role in roles.items() if role == 'admin']
+
+        profile, created = Profile.objects.select_related(
+            'user').get_or_create(user=user)
+
+        groups = list(Group.objects.filter(
+            Q(id__in=roles.keys()) | Q(created_by=user)
+        ).select_related('created_by').order_by('-created_at'))
+        member_groups = [g for g in groups
+                         if g.id in roles and g.created_by_id != user.id]
+        admin_groups = [g for g in groups if g.created_by_id == user.id]
+
+        profile.groups_created_count = len(admin_groups)
+        profile.groups_joined_count = len(roles)
+
+        sessions = StudySession.objects.filter(
+            active_sessions(now), group_id__in=roles.keys()
+        ).annotate(num_tasks=Count('tasks')).order_by('start_time')[:self.SESSION_LIMIT]
+
+        tasks = Task.objects.filter(
+            session__group_id__in=roles.keys(), status='pending'
+        ).select_related('created_by').order_by(
+            F('due_date').asc(nulls_last=True), '-created_at')[:self.TASK_LIMIT]
+
+        pending = Document.objects.filter(group_id__in=admin_group_ids, approved=False)
+        pending_count = pending.count()
+        pending_documents = pending.select_related('uploaded_by').order_by('-uploaded_at')[:self.PENDING_LIMIT]
+
+        unread_count = Notification.objects.filter(
+            user=user, read_status=False).count()
+
+        context = self.get_serializer_context()
+        return Response({
+            'profile': ProfileSerializer(profile, context=context).data,
+            'my_groups': GroupSerializer(member_groups, many=True, context=context).data,
+            'my_admin_groups': GroupSerializer(admin_groups, many=True, context=context).data,
+            'upcoming_sessions': StudySessionSerializer(sessions, many=True, context=context).data,
+            'open_tasks': TaskSerializer(tasks, many=True, context=context).data,
+            'pending_approvals': DocumentSerializer(pending_documents, many=True, context=context).data,
+            'pending_approvals_count': pending_count,
+            'unread_notifications': unread_count,
+        })
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
 # Group ViewSet
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(LeanListMixin, viewsets.ModelViewSet):
     serializer_class = GroupSerializer
+    lean_serializer_class = GroupLeanSerializer
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -64,21 +253,136 @@ class GroupViewSet(viewsets.ModelViewSet):
             user=request.user, group=group, defaults={'role': 'member'}
         )
         if created:
+            activity.log(group.id, 'member.joined', actor=request.user)
             return Response({'detail': 'Joined group'}, status=status.HTTP_201_CREATED)
         return Response({'detail': 'Already a member'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='leave')
     def leave_group(self, request, pk=None):
         group = self.get_object()
-        GroupMembership.objects.filter(user=request.user, group=group).delete()
+        deleted, _ = GroupMembership.objects.filter(user=request.user, group=group).delete()
+        if deleted:
+            activity.log(group.id, 'member.left', actor=request.user)
         return Response({'detail': 'Left group'}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'], url_path='activity')
+    def activity_feed(self, request, pk=None):
+        """
+        /api/groups/<id>/activity/?before=<cursor>&limit=<n>
+        → Newest first activity of one group (members only), keyset-paginated
+          inside the group's (group_id, month, id) index range
+        """
+        group = self.get_object()
+        if not GroupMembership.objects.filter(user=request.user, group=group).exists():
+            raise PermissionDenied("Only group members can see the activity feed.")
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+            before = request.query_params.get('before')
+            before = activity.decode_cursor(before) if before else None
+        except ValueError:
+            raise serializers.ValidationError({'before': 'Invalid cursor or limit.'})
+
+        events = models.ActivityEvent.objects.filter(group_id=group.id)
+        if before:
+            month, pk = before
+            events = events.filter(Q(month__lt=month) | Q(month=month, id__lt=pk))
+        serializer = ActivityEventLeanSerializer(events, context=self.get_serializer_context())
+        rows = list(serializer.get_rows(events).order_by('-month', '-id')[:limit + 1])
+        return Response({
+            'results': serializer.to_list(rows[:limit]),
+            'next': activity.encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+        })
+
+    @action(detail=True, methods=['get'], url_path='members')
+    def members(self, request, pk=None):
+        """
+        /api/groups/<id>/members/?role=<admin|member>&q=<username prefix>&after=<cursor>&limit=<n>
+        → Members of one group (members only) in username order, with avatar and
+          study stats, keyset-paginated inside the group's (group, role, sort_name, user) index
+        """
+        group = self.get_object()
+        if not GroupMembership.objects.filter(user=request.user, group=group).exists():
+            raise PermissionDenied("Only group members can see the member list.")
+        role = request.query_params.get('role')
+        if role and role not in dict(GroupMembership.ROLE_CHOICES):
+            raise serializers.ValidationError({'role': 'Must be admin or member.'})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+            after = request.query_params.get('after')
+            if after:
+                # "<user id>.<sort name>" of the last member on the previous page
+                user_id, _, after_name = after.partition('.')
+                after = (after_name, int(user_id))
+        except ValueError:
+            raise serializers.ValidationError({'after': 'Invalid cursor or limit.'})
+
+        memberships = GroupMembership.objects.filter(group=group)
+        if role:
+            memberships = memberships.filter(role=role)
+        prefix = request.query_params.get('q', '').strip().lower()
+        if prefix:
+            # the range keeps the scan inside the index; startswith settles the edges
+            memberships = memberships.filter(sort_name__gte=prefix, sort_name__lt=prefix + '\uffff',
+                                             sort_name__startswith=prefix)
+        if after:
+            # (sort_name, user) is unique per group, so joins and leaves between
+            # pages never repeat or skip the members that stay
+            after_name, user_id = after
+            memberships = memberships.filter(Q(sort_name__gt=after_name) | Q(sort_name=after_name, user_id__gt=user_id))
+        serializer = GroupMemberLeanSerializer(memberships, context=self.get_serializer_context())
+        rows = list(serializer.get_rows(memberships).order_by('sort_name', 'user_id')[:limit + 1])
+        last = rows[limit - 1] if len(rows) > limit else None
+        return Response({
+            'results': serializer.to_list(rows[:limit]),
+            'next': f"{last['user_id']}.{last['sort_name']}" if last else None,
+        })
+
+    @action(detail=True, methods=['post'], url_path='members/import',
+            parser_classes=(MultiPartParser, FormParser))
+    def import_members(self, request, pk=None):
+        """
+        /api/groups/<id>/members/import/ (multipart "file": CSV of usernames or emails)
+        → Group admins add members in bulk; emails without an account get an invite
+        """
+        group = self.get_object()
+        if not (request.user.is_superuser or GroupMembership.objects.filter(
+                user=request.user, group=group, role='admin').exists()):
+            raise PermissionDenied("Only group admins can import members.")
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({'file': 'Upload a CSV file.'})
+        importer = MemberImport(group, request.user,
+                                max_rows=getattr(settings, 'MEMBER_IMPORT_MAX_ROWS', None))
+        try:
+            result = importer.run(read_identifiers(upload.file))
+        except UnicodeDecodeError:
+            raise serializers.ValidationError({'file': 'The file must be UTF-8 encoded CSV.'})
+        except ValueError as exc:
+            raise serializers.ValidationError({'file': str(exc)})
+        return Response(result, status=status.HTTP_200_OK)
+
     # Restrict deletion to group creator only
-    def perform_destroy(self, instance):
-        if instance.created_by != self.request.user:
+    # The group disappears right away; its rows and files are purged in the background
+    def destroy(self, request, *args, **kwargs):
+        group = self.get_object()
+        if group.created_by != request.user:
             raise PermissionDenied(
                 "Only the group creator can delete this group.")
-        instance.delete()
+        deletion = request_deletion(group, request.user)
+        return Response(GroupDeletionSerializer(deletion).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path='deletion')
+    def deletion_progress(self, request, pk=None):
+        """
+        /api/groups/<id>/deletion/
+        → Progress of a group deletion, for the user who requested it
+        """
+        deletion = None
+        if str(pk).isdigit():
+            deletion = models.GroupDeletion.objects.filter(group_id=pk, requested_by=request.user).first()
+        if deletion is None:
+            raise NotFound("No deletion was requested for this group.")
+        return Response(GroupDeletionSerializer(deletion).data)
 
     # 🧩 New and updated endpoints
 
@@ -91,8 +395,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         member_groups = Group.objects.filter(
             memberships__user=request.user
         ).exclude(created_by=request.user).distinct()
-        serializer = self.get_serializer(member_groups, many=True)
-        return Response(serializer.data)
+        return self.lean_response(member_groups)
 
     @action(detail=False, methods=['get'], url_path='my-admin-groups')
     def my_admin_groups(self, request):
@@ -101,8 +404,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         → Groups that the user has CREATED
         """
         admin_groups = Group.objects.filter(created_by=request.user).distinct()
-        serializer = self.get_serializer(admin_groups, many=True)
-        return Response(serializer.data)
+        return self.lean_response(admin_groups)
 
     @action(detail=False, methods=['get'], url_path='explore-groups')
     def explore_groups(self, request):
@@ -111,20 +413,20 @@ class GroupViewSet(viewsets.ModelViewSet):
         → Groups that user hasn't joined yet
         """
         user = request.user
-        joined_group_ids = GroupMembership.objects.filter(
+        joined_group_ids = GroupMembership.active.filter(
             user=user
         ).values_list('group_id', flat=True)
         groups_to_join = Group.objects.exclude(
             id__in=joined_group_ids).order_by('-created_at')
-        serializer = self.get_serializer(groups_to_join, many=True)
-        return Response(serializer.data)
+        return self.lean_response(groups_to_join)
 
 
 
 # Task ViewSet
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all().order_by('-created_at')
     serializer_class = TaskSerializer
+    lean_serializer_class = TaskLeanSerializer
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
@@ -133,11 +435,35 @@ class TaskViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError("session field is required")
 
         group = session.group
-        if not GroupMembership.objects.filter(group=group, user=self.request.user).exists():
+        if not GroupMembership.active.filter(group=group, user=self.request.user).exists():
             raise PermissionDenied(
                 'You must be a member of the group to create a session task')
+        self.attach_to_occurrence(serializer, session)
         serializer.save(created_by=self.request.user)
 
+    def perform_update(self, serializer):
+        session = serializer.validated_data.get('session', serializer.instance.session)
+        self.attach_to_occurrence(serializer, session)
+        was_complete = serializer.instance.status == 'complete'
+        task = serializer.save()
+        if task.status == 'complete' and not was_complete:
+            activity.log(task.session.group_id, 'task.completed', actor=self.request.user,
+                         target_id=task.id, title=task.title)
+
+    def attach_to_occurrence(self, serializer, session):
+        # occurrence_start picks one occurrence of a recurring session;
+        # that occurrence only gets its own row once a task needs it
+        occurrence_start = serializer.validated_data.pop('occurrence_start', None)
+        if occurrence_start is None:
+            return
+        if not session.recurrence:
+            raise serializers.ValidationError(
+                {'occurrence_start': 'Session is not recurring.'})
+        try:
+            serializer.validated_data['session'] = materialize(session, occurrence_start)
+        except ValueError as exc:
+            raise serializers.ValidationError({'occurrence_start': str(exc)})
+
     def destroy(self, request, *args, **kwargs):
         task = self.get_object()
         group = task.session.group
@@ -150,45 +476,172 @@ class TaskViewSet(viewsets.ModelViewSet):
         else:
             return Response({'detail': 'Only task creator or group admin can delete this task.'}, status=status.HTTP_403_FORBIDDEN)
 
-    def get_queryset(self):
-        user = self.request.user
-        member_groups = GroupMembership.objects.filter(
-            user=user).values_list('group', flat=True)
-        queryset = Task.objects.filter(
-            session__group__in=member_groups).order_by('-created_at')
-
-        # Optional filter: /tasks/?session=12
-        session_id = self.request.query_params.get('session')
-        if session_id:
-            queryset = queryset.filter(session_id=session_id)
+    # ?ordering= values; ties always broken by id so the order is stable
+    ORDERINGS = {
+        'due_date': (F('due_date').asc(nulls_last=True), 'id'),
+        '-due_date': (F('due_date').desc(nulls_last=True), '-id'),
+        'status': ('status', '-created_at', '-id'),
+        '-status': ('-status', '-created_at', '-id'),
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+
+    def list(self, request, *args, **kwargs):
+        """
+        /api/tasks/?status=pending,complete&due_after=&due_before=&overdue=1&created_by=<id|me>
+                   &group=<id>&session=<id>&q=<title words>&ordering=due_date|status|created_at (- for desc)
+        → Tasks of the user's groups; with &facets=1 the list comes as "results" next to
+          "facets": counts per status and per group from one GROUP BY
+        """
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') not in ('1', 'true', 'yes') or self.wants_stream():
+            return response
+        return Response({'results': response.data, 'facets': self.facet_counts()})
+
+    def member_tasks(self):
+        member_groups = GroupMembership.active.filter(
+            user=self.request.user).values_list('group', flat=True)
+        return Task.objects.filter(session__group__in=member_groups)
+
+    def task_filters(self):
+        """Validated filters from the query string (parsed once per request)."""
+        if hasattr(self, '_task_filters'):
+            return self._task_filters
+        params = self.request.query_params
+        filters = {}
+        try:
+            if params.get('status'):
+                filters['status'] = set(params['status'].split(','))
+                if not filters['status'] <= set(dict(Task.STATUS_CHOICES)):
+                    raise ValueError('status')
+            for name in ('due_after', 'due_before'):
+                if params.get(name):
+                    filters[name] = parse_date(params[name])
+                    if filters[name] is None:
+                        raise ValueError(name)
+            for name in ('group', 'session'):
+                if params.get(name):
+                    filters[name] = int(params[name])
+            created_by = params.get('created_by')
+            if created_by:
+                filters['created_by'] = self.request.user.id if created_by == 'me' else int(created_by)
+        except ValueError:
+            raise serializers.ValidationError(
+                'Invalid filter: status must be pending or complete, dates YYYY-MM-DD and ids numbers.')
+        filters['overdue'] = params.get('overdue') in ('1', 'true', 'yes')
+        filters['words'] = params.get('q', '').split()[:8]
+        ordering = params.get('ordering', '-created_at')
+        if ordering not in self.ORDERINGS:
+            raise serializers.ValidationError({'ordering': f"Must be one of {', '.join(self.ORDERINGS)}."})
+        filters['ordering'] = self.ORDERINGS[ordering]
+        self._task_filters = filters
+        return filters
+
+    def filter_tasks(self, queryset, skip=()):
+        filters = self.task_filters()
+        if 'status' in filters and 'status' not in skip:
+            queryset = queryset.filter(status__in=filters['status'])
+        if 'group' in filters and 'group' not in skip:
+            queryset = queryset.filter(session__group_id=filters['group'])
+        if 'session' in filters:
+            queryset = queryset.filter(session_id=filters['session'])
+        if 'due_after' in filters:
+            queryset = queryset.filter(due_date__gte=filters['due_after'])
+        if 'due_before' in filters:
+            queryset = queryset.filter(due_date__lte=filters['due_before'])
+        if 'created_by' in filters:
+            queryset = queryset.filter(created_by_id=filters['created_by'])
+        if filters['overdue']:
+            queryset = queryset.filter(due_date__lt=timezone.localdate()).exclude(status='complete')
+        for word in filters['words']:
+            queryset = queryset.filter(title__icontains=word)
         return queryset
 
+    def facet_counts(self):
+        # one GROUP BY (status, group) without the status and group filters; each
+        # facet then applies the other one, so its counts show what picking a value gives
+        filters = self.task_filters()
+        rows = (self.filter_tasks(self.member_tasks(), skip=('status', 'group'))
+                .values('status', 'session__group_id', 'session__group__name')
+                .annotate(count=Count('id')).order_by())
+        by_status = {value: 0 for value, _ in Task.STATUS_CHOICES}
+        by_group = {}
+        for row in rows:
+            group_id = row['session__group_id']
+            if filters.get('group') in (None, group_id):
+                by_status[row['status']] += row['count']
+            if 'status' not in filters or row['status'] in filters['status']:
+                entry = by_group.setdefault(group_id, {'id': group_id, 'name': row['session__group__name'], 'count': 0})
+                entry['count'] += row['count']
+        groups = sorted(by_group.values(), key=lambda entry: (-entry['count'], entry['id']))
+        return {'status': by_status, 'group': groups}
+
+    def get_queryset(self):
+        queryset = self.filter_tasks(self.member_tasks())
+        return queryset.order_by(*self.task_filters()['ordering'])
+
 # Document ViewSet
 
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Document.objects.all().order_by('-uploaded_at')
     serializer_class = DocumentSerializer
+    lean_serializer_class = DocumentLeanSerializer
     permission_classes = (IsAuthenticated,)
     parser_classes = (MultiPartParser, FormParser)
 
     def perform_create(self, serializer):
         group = serializer.validated_data.get('group')
         # only members may upload
-        if not GroupMembership.objects.filter(group=group, user=self.request.user).exists():
+        if not GroupMembership.active.filter(group=group, user=self.request.user).exists():
             raise PermissionDenied(
                 'You must be a member of the group to upload documents')
         # uploaded_by is request.user; approved False by default
         serializer.save(uploaded_by=self.request.user, approved=False)
 
-        # after serializer.save(...)
-        group_admin = group.created_by
-        if group_admin != self.request.user:
-            Notification.objects.create(
-                user=group_admin,
-                message=f"{self.request.user.username} uploaded '{serializer.instance.title}' in '{group.name}' awaiting approval.",
-                type='document_upload'
-            )
+        # notify the group admin in the background
+        if group.created_by_id != self.request.user.id:
+            enqueue('notifications.document_uploaded',
+                    {'document_id': serializer.instance.id})
+        self.queue_extraction(serializer.instance)
+
+    def perform_update(self, serializer):
+        changed = {'file', 'title'} & set(serializer.validated_data)
+        serializer.save()
+        if changed:
+            # a new title only needs the index rebuilt; a new file is extracted again
+            self.queue_extraction(serializer.instance, reindex='file' not in changed)
+
+    def queue_extraction(self, document, reindex=False):
+        enqueue('documents.extract_text', {'document_id': document.id, 'reindex': reindex},
+                dedupe_key=f"document-text:{document.id}")
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        /api/documents/search/?q=&limit=
+        → Documents the user can see whose title or text contains every word
+          of q (the last one as a prefix), best first, each with the page and
+          an excerpt of the first hit.
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Must be an integer.'})
+        hits = document_search.search(self.get_queryset(), query, limit)
+        ids = [pk for pk, _ in hits]
+        rows = {row['id']: row for row in DocumentLeanSerializer(
+            Document.objects.filter(id__in=ids), context=self.get_serializer_context()).data}
+        texts = {text.document_id: text for text in DocumentText.objects.filter(document_id__in=ids)}
+        terms = document_search.query_terms(query)
+        results = []
+        for pk, score in hits:
+            text = texts.get(pk)
+            offset, excerpt = document_search.snippet(text.text if text else '', terms)
+            results.append(dict(rows[pk], score=score, excerpt=excerpt,
+                                page=text.page_of(offset) if offset is not None else None))
+        return Response(results)
 
     @action(detail=True, methods=['post'], url_path='approve', permission_classes=[IsAuthenticated, IsGroupAdmin])
     def approve_document(self, request, pk=None):
@@ -196,17 +649,19 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # check admin
         # IsGroupAdmin permission uses group id from request or obj
         doc.approved = True
-        doc.save()
+        doc.save(update_fields=['approved'])
+        activity.log(doc.group_id, 'document.approved', actor=request.user,
+                     target_id=doc.id, title=doc.title)
         return Response({'detail': 'Document approved'}, status=status.HTTP_200_OK)
 
     def get_queryset(self):
         user = self.request.user
 
         # Get all groups user is member of
-        member_groups = GroupMembership.objects.filter(
+        member_groups = GroupMembership.active.filter(
             user=user).values_list('group', flat=True)
         # Get all groups where user is admin
-        admin_groups = GroupMembership.objects.filter(
+        admin_groups = GroupMembership.active.filter(
             user=user, role='admin').values_list('group', flat=True)
 
         # Uploader can always see their own docs
@@ -216,7 +671,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
             Q(uploaded_by=user) |
             Q(group__in=member_groups, approved=True) |
             Q(group__in=admin_groups)
-        ).order_by('-uploaded_at')
+        ).filter(group__deleted_at__isnull=True).order_by('-uploaded_at')
 
     def destroy(self, request, *args, **kwargs):
         document = self.get_object()
@@ -234,9 +689,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
 
 # StudySession ViewSet
-class StudySessionViewSet(viewsets.ModelViewSet):
+class StudySessionViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = StudySession.objects.all().order_by('-start_time')
     serializer_class = StudySessionSerializer
+    lean_serializer_class = StudySessionLeanSerializer
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
@@ -278,7 +734,7 @@ class StudySessionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        member_groups = GroupMembership.objects.filter(
+        member_groups = GroupMembership.active.filter(
             user=user).values_list('group', flat=True)
         queryset = StudySession.objects.filter(
             group__in=member_groups).order_by('-start_time')
@@ -292,13 +748,72 @@ class StudySessionViewSet(viewsets.ModelViewSet):
         status_param = self.request.query_params.get('status')
         now = timezone.now()
 
+        # a recurring session stays active until its last occurrence is over
         if status_param == 'active':
-            queryset = queryset.filter(end_time__gte=now)
+            queryset = queryset.filter(active_sessions(now))
         elif status_param == 'completed':
-            queryset = queryset.filter(end_time__lt=now)
+            queryset = queryset.filter(
+                Q(recurrence='', end_time__lt=now) | Q(~Q(recurrence=''), recurrence_until__lt=now))
 
         return queryset
 
+    @action(detail=False, methods=['get'], url_path='agenda')
+    def agenda(self, request):
+        """
+        /api/sessions/agenda/?from=&to=
+        → Sessions overlapping the window across all of the user's groups
+          (recurring ones expanded), plus pairs of sessions that clash in time.
+          Unmaterialized occurrences are keyed as "<parent id>@<start>".
+        """
+        start, end = parse_window(request.query_params)
+        group_ids = GroupMembership.active.filter(
+            user=request.user).values_list('group_id', flat=True)
+        return self.agenda_response(
+            StudySession.objects.filter(group_id__in=group_ids), start, end)
+
+    @action(detail=True, methods=['get'], url_path='occurrences')
+    def occurrences(self, request, pk=None):
+        """
+        /api/sessions/<id>/occurrences/?from=&to=
+        → Occurrences of one recurring session in the window (up to a year),
+          with materialized overrides in place of the generated ones.
+        """
+        session = self.get_object()
+        start, end = parse_window(request.query_params, default_after=timedelta(days=31))
+        series = StudySession.objects.filter(Q(pk=session.pk) | Q(parent_id=session.pk))
+        return self.agenda_response(series, start, end)
+
+    def agenda_response(self, queryset, start, end):
+        serializer = StudySessionLeanSerializer(
+            queryset, context=self.get_serializer_context())
+        rows = agenda_rows(serializer, queryset, start, end)
+        conflicts = find_conflicts(
+            (row_key(row), row['start_time'], row['end_time']) for row in rows)
+        as_string = serializers.DateTimeField().to_representation
+        return Response({
+            'from': as_string(start),
+            'to': as_string(end),
+            'sessions': serializer.to_list(rows),
+            'conflicts': [list(pair) for pair in conflicts],
+        })
+
+    @action(detail=False, methods=['get'], url_path='agenda/ics')
+    def agenda_ics(self, request):
+        """
+        /api/sessions/agenda/ics/?from=&to=
+        → Same window as an iCalendar feed (defaults to -30/+180 days),
+          streamed group by group from a per-group cache.
+        """
+        start, end = snap_to_days(*parse_window(
+            request.query_params, default_before=timedelta(days=30),
+            default_after=timedelta(days=180)))
+        group_ids = list(GroupMembership.active.filter(
+            user=request.user).order_by('group_id').values_list('group_id', flat=True))
+        response = StreamingHttpResponse(
+            stream_ics(group_ids, start, end), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="agenda.ics"'
+        return response
+
 # TimerSession ViewSet
 class TimerSessionViewSet(viewsets.ModelViewSet):
     queryset = TimerSession.objects.all().order_by('-started_at')
@@ -310,7 +825,8 @@ class TimerSessionViewSet(viewsets.ModelViewSet):
         return TimerSession.objects.filter(user=self.request.user).order_by('-started_at')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user, started_at=timezone.now())
+        timer = serializer.save(user=self.request.user, started_at=timezone.now())
+        publish_timer_event(self.request.user, timer, 'start')
 
     @action(detail=True, methods=['post'])
     def pause(self, request, pk=None):
@@ -320,6 +836,7 @@ class TimerSessionViewSet(viewsets.ModelViewSet):
         timer.is_paused = True
         timer.paused_at = timezone.now()
         timer.save()
+        publish_timer_event(request.user, timer, 'pause')
         return Response({'status': 'paused', 'paused_at': timer.paused_at}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
@@ -329,6 +846,7 @@ class TimerSessionViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Timer is not paused.'}, status=status.HTTP_400_BAD_REQUEST)
         timer.is_paused = False
         timer.save()
+        publish_timer_event(request.user, timer, 'resume')
         return Response({'status': 'resumed'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
@@ -340,6 +858,7 @@ class TimerSessionViewSet(viewsets.ModelViewSet):
         now = timezone.now()
         timer.ended_at = now
         timer.save(update_fields=['ended_at'])
+        publish_timer_event(request.user, timer, 'stop')
 
         # calculate minutes elapsed (round down)
         delta = (timer.ended_at - timer.started_at).total_seconds()
@@ -368,6 +887,7 @@ class TimerSessionViewSet(viewsets.ModelViewSet):
         timer.is_paused = False
         timer.paused_at = None
         timer.save()
+        publish_timer_event(request.user, timer, 'restart')
         return Response({
             'status': 'restarted',
             'started_at': timer.started_at
@@ -392,10 +912,20 @@ class NotificationViewSet(viewsets.ModelViewSet):
 
 
 # DocumentCommentViewset
-class DocumentCommentViewSet(viewsets.ModelViewSet):
+class DocumentCommentViewSet(LeanListMixin, viewsets.ModelViewSet):
+    """
+    /api/document-comments/?document=<id>&limit=<n>
+    → Top-level comments (thread roots), newest first; cursor-paginated with ?limit=
+    /api/document-comments/<id>/thread/?after=<path>&limit=<n>
+    → The comment and every reply below it in thread order, one page at a time
+    """
     queryset = models.DocumentComment.objects.all().order_by('-created_at')
     serializer_class = DocumentCommentSerializer
+    lean_serializer_class = DocumentCommentLeanSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = OptionalCursorPagination
+    THREAD_PAGE_SIZE = 50
+    MAX_THREAD_PAGE_SIZE = 200
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -403,7 +933,7 @@ class DocumentCommentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         # Get all groups where this user is a member
-        member_groups = GroupMembership.objects.filter(
+        member_groups = GroupMembership.active.filter(
             user=user
         ).values_list('group', flat=True)
 
@@ -417,8 +947,36 @@ class DocumentCommentViewSet(viewsets.ModelViewSet):
         if document_id:
             queryset = queryset.filter(document_id=document_id)
 
+        # replies are fetched per thread
+        if self.action == 'list':
+            queryset = queryset.filter(parent__isnull=True)
         return queryset
 
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        root = self.get_object()
+        try:
+            limit = min(int(request.query_params.get('limit', self.THREAD_PAGE_SIZE)),
+                        self.MAX_THREAD_PAGE_SIZE)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Must be an integer.'})
+        if limit < 1:
+            raise serializers.ValidationError({'limit': 'Must be positive.'})
+
+        # keyset on the materialized path: each page is one index range scan
+        queryset = root.subtree()
+        after = request.query_params.get('after')
+        if after:
+            queryset = queryset.filter(path__gt=after)
+        serializer = self.lean_serializer_class(queryset, context=self.get_serializer_context())
+        rows = list(queryset.values(*serializer.value_fields, 'path')[:limit + 1])
+        next_after = rows[limit - 1]['path'] if len(rows) > limit else None
+        return Response({
+            'root': root.id,
+            'results': serializer.to_list(rows[:limit]),
+            'next_after': next_after,
+        })
+
     def destroy(self, request, *args, **kwargs):
         comment = self.get_object()
         group = comment.document.group
@@ -433,3 +991,57 @@ class DocumentCommentViewSet(viewsets.ModelViewSet):
             {'detail': 'Only the comment author or a group admin can delete this comment.'},
             status=status.HTTP_403_FORBIDDEN
         )
+
+
+# DataExport ViewSet
+class DataExportViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = DataExportSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """
+        /api/exports/ → The user's own exports with their progress, newest first
+        """
+        return DataExport.objects.filter(user=self.request.user).order_by('-requested_at', '-id')
+
+    def get_object(self):
+        # someone else's export is simply not found
+        export = self.get_queryset().filter(pk=self.kwargs['pk']).first() if self.kwargs['pk'].isdigit() else None
+        if export is None:
+            raise NotFound("No such export.")
+        return export
+
+    def create(self, request, *args, **kwargs):
+        """
+        POST /api/exports/ → Queue a ZIP of the user's profile, timers, tasks,
+        comments and documents; an unfinished export is returned instead of a second one
+        """
+        export = unfinished_export(request.user)
+        if export is None:
+            with transaction.atomic():
+                export = DataExport.objects.create(user=request.user)
+                enqueue('exports.build', {'export_id': export.pk}, dedupe_key=job_key(export))
+        return Response(self.get_serializer(export).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path='download')
+    def download(self, request, pk=None):
+        """
+        /api/exports/<id>/download/ → The finished ZIP, sent by the web server
+        (X-Accel-Redirect) when EXPORT_ACCEL_REDIRECT is set, else by sendfile
+        """
+        export = self.get_object()
+        if export.status != 'done':
+            raise NotFound("This export is not ready yet.")
+        download_name = f"vsg-export-{export.requested_at:%Y%m%d}.zip"
+        accel = getattr(settings, 'EXPORT_ACCEL_REDIRECT', None)
+        if accel:
+            response = HttpResponse(content_type='application/zip')
+            response['X-Accel-Redirect'] = accel.rstrip('/') + '/' + export.file_name
+            response['Content-Disposition'] = f'attachment; filename="{download_name}"'
+            return response
+        try:
+            fh = open(os.path.join(export_root(), export.file_name), 'rb')
+        except FileNotFoundError:
+            raise NotFound("The export file is gone; request a new export.")
+        return FileResponse(fh, as_attachment=True, filename=download_name, content_type='application/zip')
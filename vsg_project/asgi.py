@@ -2,6 +2,8 @@
 ASGI config for vsg_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; websockets on /ws/presence/ go to the presence service
+in core.presence.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vsg_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after Django is set up
+from core.presence import application as presence_application  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'WARM_UP_ON_LOAD', False):
+    from core.startup import warm_up
+    warm_up()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket' and scope['path'].rstrip('/') == '/ws/presence':
+        await presence_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -49,8 +49,21 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
 ]
 
+# Lean worker profile: VSG_API_ONLY=1 leaves out the admin (its URLs and the
+# import of every admin module at start-up) for workers that only serve /api/
+API_ONLY = os.environ.get('VSG_API_ONLY') == '1'
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
+# wsgi.py/asgi.py warm the process up when the application loads (core.startup);
+# with a preloading server that happens once, before the workers fork
+WARM_UP_ON_LOAD = os.environ.get('VSG_WARM_UP', '1') == '1'
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # must be high
+    'core.middleware.MetricsMiddleware',  # query/DB/serializer/cache numbers per request
+    'core.middleware.ProfilingMiddleware',  # opt-in, see PROFILE_* below
+    'core.middleware.CompressionMiddleware',  # gzip/brotli, before anything touching the body
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +71,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ActivityFlushMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',  # quota headers from core.throttling
 ]
 
 ROOT_URLCONF = 'vsg_project.urls'
@@ -130,6 +145,11 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Document blobs (core.storage); for S3-compatible storage use
+# 'core.storage.S3Storage' with {'bucket': ..., 'endpoint_url': ...}
+DOCUMENT_STORAGE = 'core.storage.ContentAddressedFileSystemStorage'
+DOCUMENT_STORAGE_OPTIONS = {}
+
 # Django REST Framework + JWT settings
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
@@ -138,9 +158,39 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # sliding-window limits counted in the cache (core.throttling); upload
+    # bytes first, so a refused upload is never read
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.UploadBytesThrottle',
+        'core.throttling.EndpointRateThrottle',
+        'core.throttling.GroupRateThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'read': '1200/min',
+        'write': '240/min',
+        'task.write': '120/min',
+        'document.write': '30/min',
+        'group.write': '600/min',
+        'upload_bytes': '500MB/hour',
+    },
 }
 
+# Cache alias holding the throttle counters. It must be shared by all workers
+# or every limit is multiplied by their number: `check --deploy` fails on a
+# local-memory cache, so set REDIS_URL (needs the redis package).
+# THROTTLE_DISABLED=1 turns every limit off; only for load-test deployments
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+THROTTLE_CACHE = 'default'
+THROTTLE_DISABLED = os.environ.get('THROTTLE_DISABLED') == '1'
+
 # Simple JWT - default settings OK; you can customize lifetimes in production
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -148,6 +198,74 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# Session reminders (manage.py run_scheduler): minutes before a session starts
+SESSION_REMINDER_OFFSETS = [24 * 60, 15]
+
+# Presence websockets (core.presence); the in-memory layer only reaches
+# sockets served by the same ASGI process
+PRESENCE_CHANNEL_LAYER = 'core.presence.InMemoryChannelLayer'
+PRESENCE_HEARTBEAT_TIMEOUT = 45  # seconds
+
+# Offline sync (core.sync); older tokens need a full resync, compact with
+# manage.py compact_sync_log
+SYNC_RETENTION_DAYS = 30
+SYNC_SETTLE_SECONDS = 2
+
+# Group activity feed (core.activity): buffered events are written in one
+# bulk insert at this size, after this many seconds, or at request end
+ACTIVITY_FLUSH_SIZE = 100
+ACTIVITY_FLUSH_INTERVAL = 5  # seconds
+
+# Document text extraction (core.extraction, 'documents.extract_text' job):
+# a pool of this many processes (0 = in the job worker), seconds per file,
+# files above this size are only searchable by title, characters kept
+EXTRACTION_PROCESSES = 2
+EXTRACTION_TIMEOUT = 60
+EXTRACTION_MAX_BYTES = 50 * 1024 * 1024
+DOCUMENT_TEXT_LIMIT = 200_000
+
+# Bulk membership import (/api/groups/<id>/members/import/): rows per file;
+# emails are invited through this mail backend with a one-time token, claimed
+# at /api/invites/claim/ within INVITE_MAX_AGE_DAYS. Set INVITE_CLAIM_URL to the
+# app page that posts it and the mail links there with ?token=
+MEMBER_IMPORT_MAX_ROWS = 50_000
+INVITE_MAX_AGE_DAYS = 14
+INVITE_CLAIM_URL = os.environ.get('INVITE_CLAIM_URL')
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'no-reply@localhost')
+
+# Where manage.py archive_vsg writes its gzip JSONL archives
+ARCHIVE_ROOT = BASE_DIR / 'archive'
+
+# Per-user data exports (/api/exports/, 'exports.build' job). Behind nginx, set
+# EXPORT_ACCEL_REDIRECT to an internal location aliased to EXPORT_ROOT and
+# downloads are served by nginx instead of a worker
+EXPORT_ROOT = BASE_DIR / 'exports'
+EXPORT_ACCEL_REDIRECT = os.environ.get('EXPORT_ACCEL_REDIRECT')
+
+# Per-request metrics (core.metrics): Server-Timing headers and per-route
+# histograms at /metrics. Scrapers send "Authorization: Bearer <METRICS_TOKEN>";
+# without a token /metrics is only served in DEBUG. METRICS_SERVER_TIMING None
+# sends the header to staff users and in DEBUG, True to everyone, False to no one
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = None
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Request profiling (core.profiling): requests with "X-Profile: <PROFILE_TOKEN>"
+# and one in PROFILE_SAMPLE_RATE others (0 = never) are profiled into PROFILE_DIR,
+# as collapsed stacks sampled every PROFILE_INTERVAL seconds or as cProfile pstats
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_FORMAT = 'collapsed'  # or 'pstats'
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Queries slower than this are logged to 'core.slow_queries' (None = off).
+# Parameters carry emails, tokens and message text, so they are only logged
+# when SLOW_QUERY_LOG_PARAMS is switched on
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG_PARAMS = False
+
 # CORS - allow local development
 CORS_ALLOW_ALL_ORIGINS = True  # for dev only; restrict in prod
 
@@ -14,16 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('core.urls')),  # all API endpoints at /api/
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
 ]
 
+if not getattr(settings, 'API_ONLY', False):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vsg_project.settings')
 
 application = get_wsgi_application()
+
+# imported after Django is set up
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'WARM_UP_ON_LOAD', False):
+    from core.startup import warm_up
+    warm_up()